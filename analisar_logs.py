@@ -0,0 +1,57 @@
+"""
+Análise de uma execução a partir do logs.json (servidor ou simulate_multi_salas.py).
+
+Carrega os registos em colunas NumPy e calcula esperas, taxas de desistência,
+utilização por médico e o tamanho da fila ao longo do tempo. Com --arquivar grava também
+a execução no formato colunar (.col), que as análises seguintes leem com mmap.
+"""
+import argparse
+import json
+import time
+
+from servidor.analise import analisar, load_columns
+from servidor.arquivo import write_archive
+from servidor.des import NIVEIS
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Análise vetorizada de um logs.json")
+    p.add_argument('--logs', default='logs.json',
+                   help="Ficheiro de registos a analisar (logs.json ou arquivo .col)")
+    p.add_argument('--arquivar', default=None, metavar='FICHEIRO.col',
+                   help="Grava a execução no formato colunar")
+    p.add_argument('--resolucao', type=float, default=1.0,
+                   help="Intervalo (s) de amostragem da curva de fila")
+    p.add_argument('--saida', default='analise.json', help="Ficheiro JSON com o resultado")
+    args = p.parse_args()
+
+    if args.resolucao <= 0:
+        p.error("O valor de --resolucao deve ser > 0")
+
+    t0 = time.perf_counter()
+    colunas = load_columns(args.logs)
+    t1 = time.perf_counter()
+    resultado = analisar(colunas, args.resolucao)
+    t2 = time.perf_counter()
+
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False)
+    if args.arquivar:
+        write_archive(args.arquivar, colunas)
+        print(f"Execução arquivada em {args.arquivar}")
+
+    print(f"✅ {len(colunas)} registos: leitura {t1 - t0:.2f}s, análise {t2 - t1:.2f}s")
+    esp = resultado['espera']
+    for nivel in ('global', *NIVEIS):
+        e = esp[nivel]
+        if e['n']:
+            print(f"  espera {nivel}: média {e['media']:.2f}s, p50 {e['p50']:.2f}s, "
+                  f"p90 {e['p90']:.2f}s, p99 {e['p99']:.2f}s (n={e['n']})")
+    d = resultado['desistencia']
+    if d['global'] is not None:
+        print(f"  desistências: {d['global']:.1%}")
+    u = resultado['utilizacao']
+    if u['media'] is not None:
+        print(f"  utilização dos médicos: média {u['media']:.1%} "
+              f"(min {u['min']:.1%}, max {u['max']:.1%})")
+    print(f"  fila: máximo {resultado['fila']['max']}, média {resultado['fila']['media']:.2f}")
+    print(f"Resultados em {args.saida}")
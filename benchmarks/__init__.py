@@ -0,0 +1,15 @@
+"""
+Benchmarks reprodutíveis do servidor de urgências (python -m benchmarks).
+
+Cada módulo mede uma parte do caminho crítico com parâmetros e sementes fixos:
+
+- rooms: enqueue/dequeue de uma Room com várias threads e custo da desistência
+  (purge_worker) em função da profundidade da fila;
+- logs: custo de log_event em função do tamanho do registo, para cada sink;
+- ingest: chegadas aceites por segundo pelo runurgencias (motores threads e asyncio,
+  protocolos v1 e v2), num subprocesso;
+- endpoints: latência dos endpoints do dashboard e da API em função do nº de registos.
+
+Os resultados vão para um JSON (com commit, Python e máquina) que pode ser comparado
+com o de outro commit através de --comparar.
+"""
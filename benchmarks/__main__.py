@@ -0,0 +1,111 @@
+"""
+python -m benchmarks [--rapido] [--apenas rooms,logs] [--saida benchmarks.json]
+                     [--comparar base.json] [--tolerancia 10]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmarks import endpoints, ingest, logs, rooms
+
+VERSAO = 1
+
+# nome: (função, métricas, maior é melhor)
+BENCHMARKS = {
+    'rooms.enqueue_dequeue': (rooms.enqueue_dequeue, ('ops_s',), True),
+    'rooms.purge': (rooms.purge, ('us',), False),
+    'logs.log_event': (logs.log_event, ('us',), False),
+    'ingest.accepts': (ingest.accepts, ('chegadas_s',), True),
+    'endpoints.latencia': (endpoints.latencia, ('frio_ms', 'quente_ms'), False),
+}
+
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _ambiente(rapido):
+    return {
+        'versao': VERSAO,
+        'data': datetime.now(timezone.utc).isoformat(timespec='seconds').replace('+00:00', 'Z'),
+        'commit': _git('rev-parse', 'HEAD'),
+        'alteracoes_locais': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'rapido': rapido,
+    }
+
+
+def _chave(linha, metricas):
+    return tuple(sorted((k, v) for k, v in linha.items() if k not in metricas))
+
+
+def comparar(base, atual, tolerancia):
+    """Imprime a variação de cada métrica face a `base`; devolve o nº de regressões"""
+    regressoes = 0
+    for nome, resultado in atual['resultados'].items():
+        if nome not in BENCHMARKS or nome not in base.get('resultados', {}):
+            continue
+        _, metricas, maior_melhor = BENCHMARKS[nome]
+        anteriores = {_chave(l, metricas): l for l in base['resultados'][nome]}
+        for linha in resultado:
+            antes = anteriores.get(_chave(linha, metricas))
+            if antes is None:
+                continue
+            for m in metricas:
+                a, b = antes.get(m), linha.get(m)
+                if not a or b is None:
+                    continue
+                variacao = (b - a) / a * 100
+                pior = variacao < -tolerancia if maior_melhor else variacao > tolerancia
+                regressoes += pior
+                params = ', '.join(f"{k}={v}" for k, v in _chave(linha, metricas))
+                print(f"{'REGRESSÃO ' if pior else ''}{nome} [{params}] {m}: "
+                      f"{a:g} -> {b:g} ({variacao:+.1f}%)")
+    return regressoes
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Benchmarks do servidor de urgências")
+    p.add_argument('--rapido', action='store_true',
+                   help="Tamanhos menores (para verificação rápida)")
+    p.add_argument('--apenas', default=None,
+                   help="Prefixos dos benchmarks a correr, ex.: rooms,logs")
+    p.add_argument('--saida', default='benchmarks.json', help="Ficheiro JSON de resultados")
+    p.add_argument('--comparar', default=None,
+                   help="JSON de outro commit: mostra a variação e falha se houver regressões")
+    p.add_argument('--tolerancia', type=float, default=10.0,
+                   help="Variação (%%) a partir da qual uma piora conta como regressão")
+    args = p.parse_args()
+
+    prefixos = args.apenas.split(',') if args.apenas else None
+    saida = {**_ambiente(args.rapido), 'resultados': {}, 'duracao': {}}
+    for nome, (fn, _, _) in BENCHMARKS.items():
+        if prefixos and not any(nome.startswith(pref) for pref in prefixos):
+            continue
+        print(f"{nome}...", flush=True)
+        t0 = time.perf_counter()
+        saida['resultados'][nome] = linhas = fn(rapido=args.rapido)
+        saida['duracao'][nome] = round(time.perf_counter() - t0, 2)
+        for linha in linhas:
+            print(f"  {linha}")
+
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump(saida, f, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        if comparar(base, saida, args.tolerancia):
+            sys.exit(1)
@@ -0,0 +1,61 @@
+"""Utilitários partilhados pelos benchmarks"""
+import socket
+import statistics
+import time
+
+
+class NullWriter:
+    """Writer que descarta tudo (isola a Room do custo de escrita)"""
+
+    def log_event(self, record):
+        pass
+
+    def update_med_status(self, med_key, room, ocupado):
+        pass
+
+
+class NullTimer:
+    def cancel(self):
+        pass
+
+
+class SemAgenda:
+    """Scheduler que nunca dispara: o benchmark chama os callbacks diretamente"""
+
+    def call_at(self, when, fn, *args):
+        return NullTimer()
+
+    def call_soon(self, fn, *args):
+        pass
+
+
+def medir(fn, repeticoes=5):
+    """Mediana (s) de `repeticoes` execuções de fn()"""
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - t0)
+    return statistics.median(tempos)
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def esperar_porta(host, port, timeout=15.0):
+    """Espera até o servidor aceitar ligações"""
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Servidor não respondeu em {host}:{port}")
+
+
+def paciente(pid, nivel='verde'):
+    return {'pid': pid, 'timestamp': '2026-01-01T00:00:00.000000Z', 'urgência': nivel}
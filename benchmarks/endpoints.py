@@ -0,0 +1,105 @@
+"""Latência dos endpoints do dashboard e da API em função do nº de registos"""
+import os
+import tempfile
+import time
+from unittest import mock
+
+from servidor.des import Scenario, simulate
+from servidor.journal import write_snapshot
+from servidor.live_state import LiveState
+
+API_KEY = 'benchmark'
+ENDPOINTS = (
+    '/api/filas/',
+    '/api/stats/',
+    '/api/medicos/',
+    '/api/metricas/',
+    '/api/logs/?limite=100',
+    '/api/logs/?nivel=vermelho&desistencia=true&limite=100',
+    '/api/logs/',
+)
+
+
+def _django():
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'simulacao_de_urgencia.settings')
+    django.setup()
+
+
+def _dados(pasta, registos, estado):
+    """logs.json com `registos` pacientes do motor DES e, se `estado`, o estado.json"""
+    sim = simulate(Scenario(salas=3, medicos=2, pacientes=registos, taxa=2.0, seed=1))
+    logs = os.path.join(pasta, 'logs.json')
+    write_snapshot(logs, sim.snapshot())
+    if estado:
+        live = LiveState(salas_totais=3, medicos={
+            f"{s}-{m}": {'room': None, 'ocupado': False} for s in range(3) for m in (1, 2)
+        })
+        for pid in sorted(sim.records):
+            live.apply(sim.records[pid])
+        live.publish(os.path.join(pasta, 'estado.json'))
+
+
+def _ficheiros(pasta):
+    """Aponta as views para os ficheiros da pasta temporária"""
+    from dashboard import views as dash
+    from simulation_api import views as api
+    path = lambda nome: os.path.join(pasta, nome)  # noqa: E731
+    return (
+        mock.patch.multiple(
+            dash, LOG_FILE=path('logs.json'), STATE_FILE=path('estado.json'),
+            STATUS_FILE=path('med_status.json'), SLOTS_FILE=path('medicos.slots'),
+            FILAS_FILES=(path('estado.json'), path('logs.json'), *dash.DB_FILES),
+            MEDICOS_FILES=(path('estado.json'), path('med_status.json'), path('logs.json')),
+        ),
+        mock.patch.multiple(
+            api, LOGS_PATH=path('logs.json'), JOURNAL_PATH=path('logs.jsonl'),
+            LOGS_FILES=(path('logs.json'), *api.LOGS_FILES[1:]),
+        ),
+    )
+
+
+def _pedido(client, url):
+    t0 = time.perf_counter()
+    resp = client.get(url, HTTP_HOST='localhost', HTTP_X_API_KEY=API_KEY)
+    if resp.streaming:
+        b''.join(resp.streaming_content)
+    elapsed = time.perf_counter() - t0
+    assert resp.status_code == 200, (url, resp.status_code)
+    return elapsed
+
+
+def latencia(rapido=False):
+    """ms por pedido, sem cache (frio) e com a resposta em cache (quente)"""
+    _django()
+    from django.test import Client
+    from django.test.utils import override_settings
+    from dashboard import views as dash
+    from simulation_api import views as api
+
+    tamanhos = (1000, 10000) if rapido else (1000, 10000, 100000)
+    linhas = []
+    client = Client()
+    for registos in tamanhos:
+        for estado in (True, False):
+            with tempfile.TemporaryDirectory() as pasta:
+                _dados(pasta, registos, estado)
+                p_dash, p_api = _ficheiros(pasta)
+                with p_dash, p_api, override_settings(API_KEY=API_KEY):
+                    for url in ENDPOINTS:
+                        frio = []
+                        for _ in range(3 if registos >= 100000 else 7):
+                            dash._cache.clear()
+                            api._logs_cache.clear()
+                            frio.append(_pedido(client, url))
+                        quente = [_pedido(client, url) for _ in range(20)]
+                        frio.sort()
+                        quente.sort()
+                        linhas.append({
+                            'endpoint': url,
+                            'registos': registos,
+                            'estado': estado,
+                            'frio_ms': round(frio[len(frio) // 2] * 1000, 3),
+                            'quente_ms': round(quente[len(quente) // 2] * 1000, 3),
+                        })
+    return linhas
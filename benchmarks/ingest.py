@@ -0,0 +1,83 @@
+"""Chegadas aceites por segundo pelo runurgencias, num subprocesso"""
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from benchmarks.comum import esperar_porta, paciente, porta_livre
+from servidor.cliente import PatientConnection
+from servidor.protocol import ACK_CHEGADA
+
+HOST = '127.0.0.1'
+MANAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'manage.py')
+CONCORRENCIA = 64
+
+
+@contextmanager
+def servidor(engine):
+    """runurgencias numa pasta temporária (logs e estado não tocam nos do projeto)"""
+    port = porta_livre()
+    with tempfile.TemporaryDirectory() as pasta:
+        proc = subprocess.Popen(
+            [sys.executable, MANAGE, 'runurgencias', '--host', HOST, '--port', str(port),
+             '--engine', engine, '--salas', '3', '--medicos', '2'],
+            cwd=pasta, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            esperar_porta(HOST, port)
+            yield port
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+async def _v1(port, n):
+    """Uma ligação por paciente, `CONCORRENCIA` ligações em paralelo"""
+    limite = asyncio.Semaphore(CONCORRENCIA)
+    acks = 0
+
+    async def um(pid):
+        nonlocal acks
+        async with limite:
+            reader, writer = await asyncio.open_connection(HOST, port)
+            try:
+                writer.write(json.dumps(paciente(pid)).encode('utf-8'))
+                if await reader.readexactly(len(ACK_CHEGADA)) == ACK_CHEGADA:
+                    acks += 1
+            finally:
+                writer.close()
+
+    await asyncio.gather(*(um(pid) for pid in range(n)))
+    return acks
+
+
+def accepts(rapido=False):
+    """Chegadas confirmadas por segundo, por motor e protocolo"""
+    n_v1 = 2000 if rapido else 10000
+    n_v2 = 20000 if rapido else 100000
+    linhas = []
+    for engine in ('threads', 'asyncio'):
+        with servidor(engine) as port:
+            t0 = time.perf_counter()
+            acks = asyncio.run(_v1(port, n_v1))
+            elapsed = time.perf_counter() - t0
+            linhas.append({'engine': engine, 'protocolo': 1, 'pacientes': n_v1,
+                           'confirmados': acks, 'chegadas_s': round(acks / elapsed, 1)})
+
+            t0 = time.perf_counter()
+            with PatientConnection(HOST, port) as conn:
+                resposta = conn.send_many((paciente(n_v1 + i) for i in range(n_v2)),
+                                          batch_size=500)
+            elapsed = time.perf_counter() - t0
+            acks = sum(a.get('recebidos', 0) for a in resposta)
+            linhas.append({'engine': engine, 'protocolo': 2, 'pacientes': n_v2,
+                           'confirmados': acks, 'chegadas_s': round(acks / elapsed, 1)})
+    return linhas
@@ -0,0 +1,48 @@
+"""Custo de log_event em função do tamanho do registo, para cada sink"""
+import os
+import tempfile
+import time
+
+from benchmarks.comum import paciente
+from servidor.journal import JournalSink, JsonFileSink
+
+
+def _registo(pid):
+    rec = paciente(pid)
+    return {
+        'pid': pid, 'medico': None, 'room': None, 'chegada': rec['timestamp'],
+        'nivel': rec['urgência'], 'inicio': None, 'saida': None, 'espera': None,
+        'duracao': None, 'desistencia': False,
+    }
+
+
+def _sink(nome, pasta):
+    if nome == 'json':
+        return JsonFileSink(os.path.join(pasta, 'logs.json'))
+    return JournalSink(os.path.join(pasta, 'logs.jsonl'), os.path.join(pasta, 'logs.json'))
+
+
+def log_event(rapido=False):
+    """µs por log_event com `registos` pacientes já no registo"""
+    casos = {
+        # A reescrita integral é O(n) por evento: tamanhos e amostras menores
+        'json': ((100, 1000) if rapido else (100, 1000, 10000), 20),
+        'journal': ((1000, 10000) if rapido else (1000, 10000, 100000), 2000),
+    }
+    linhas = []
+    for nome, (tamanhos, eventos) in casos.items():
+        for registos in tamanhos:
+            with tempfile.TemporaryDirectory() as pasta:
+                sink = _sink(nome, pasta)
+                sink.write_batch([_registo(pid) for pid in range(registos)])
+                t0 = time.perf_counter()
+                for pid in range(registos, registos + eventos):
+                    sink.log_event(_registo(pid))
+                elapsed = time.perf_counter() - t0
+                sink.close()
+            linhas.append({
+                'sink': nome,
+                'registos': registos,
+                'us': round(elapsed / eventos * 1e6, 2),
+            })
+    return linhas
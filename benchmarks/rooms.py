@@ -0,0 +1,90 @@
+"""Room: enqueue/dequeue com contenção e custo da desistência vs profundidade da fila"""
+import threading
+import time
+
+from benchmarks.comum import NullWriter, SemAgenda, medir, paciente
+from servidor import clock
+from servidor.constants import TIMEOUTS
+from servidor.rooms import Room
+
+NIVEIS = ('vermelho', 'amarelo', 'verde')
+
+
+def _room():
+    # Sem médicos: os consumidores retiram pacientes com steal(), como um médico
+    return Room(0, num_medicos=0, writer=NullWriter(), scheduler=SemAgenda())
+
+
+def enqueue_dequeue(rapido=False):
+    """Operações/s com `threads` produtores e `threads` consumidores na mesma Room"""
+    n = 20000 if rapido else 100000
+    linhas = []
+    for threads in (1, 2, 4, 8):
+        room = _room()
+        produzidos = threading.Event()
+        consumidos = [0] * threads
+
+        def produtor(i):
+            for j in range(i, n, threads):
+                room.enqueue(j, None, paciente(j, NIVEIS[j % 3]))
+
+        def consumidor(i):
+            while True:
+                if room.steal() is not None:
+                    consumidos[i] += 1
+                elif produzidos.is_set() and not room.size():
+                    return
+                else:
+                    # Fila vazia: cede o GIL em vez de girar
+                    time.sleep(0)
+
+        prods = [threading.Thread(target=produtor, args=(i,)) for i in range(threads)]
+        cons = [threading.Thread(target=consumidor, args=(i,)) for i in range(threads)]
+        t0 = time.perf_counter()
+        for t in cons + prods:
+            t.start()
+        for t in prods:
+            t.join()
+        produzidos.set()
+        for t in cons:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        assert sum(consumidos) == n
+        linhas.append({
+            'threads': threads,
+            'operacoes': 2 * n,
+            'ops_s': round(2 * n / elapsed, 1),
+        })
+    return linhas
+
+
+def purge(rapido=False):
+    """Custo de purge_worker (µs) com `expirados` desistências numa fila de `profundidade`"""
+    profundidades = (100, 1000, 10000) if rapido else (100, 1000, 10000, 100000)
+    linhas = []
+    for profundidade in profundidades:
+        room = _room()
+        for j in range(profundidade):
+            room.enqueue(j, None, paciente(j, NIVEIS[j % 3]))
+        for expirados in (0, 10):
+            pid = [profundidade]
+
+            def preparar():
+                # Chegadas antigas cujo prazo já passou
+                antiga = clock.now() - max(TIMEOUTS.values()) - 1
+                for _ in range(expirados):
+                    room.enqueue(pid[0], None, paciente(pid[0]), chegada=antiga)
+                    pid[0] += 1
+
+            tempos = []
+            for _ in range(21):
+                preparar()
+                tempos.append(medir(room.purge_worker, repeticoes=1))
+            tempos.sort()
+            linhas.append({
+                'profundidade': profundidade,
+                'expirados': expirados,
+                'us': round(tempos[len(tempos) // 2] * 1e6, 2),
+            })
+            assert room.size() == profundidade
+    return linhas
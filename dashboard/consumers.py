@@ -0,0 +1,130 @@
+"""
+WebSocket do dashboard (/ws/dashboard/).
+
+Um único StateWatcher por processo segue o estado.json publicado pelo servidor de
+urgências (um stat por ciclo; só relê quando o ficheiro muda) e difunde ao grupo
+"dashboard" apenas as secções que mudaram (filas, stats, medicos). Cada cliente junta
+os deltas recebidos e envia no máximo uma mensagem por intervalo (coalescing), pelo que
+um surto de eventos não inunda browsers lentos.
+"""
+import asyncio
+import os
+import time
+
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from servidor.live_state import read_state
+
+STATE_FILE = os.path.join(settings.BASE_DIR, 'estado.json')
+GROUP = 'dashboard'
+SECCOES = ('filas', 'stats', 'medicos')
+POLL_INTERVAL = 0.1
+MIN_INTERVALO = 0.1
+INTERVALO_PADRAO = 0.25
+
+
+class StateWatcher:
+    """Segue o estado.json e difunde deltas enquanto houver clientes ligados"""
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.clients = 0
+        self.state = read_state(path) or {}
+        self._signature = None
+        self._task = None
+
+    def attach(self):
+        self.clients += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def detach(self):
+        self.clients -= 1
+        if self.clients <= 0 and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    async def _run(self):
+        layer = get_channel_layer()
+        while True:
+            signature = self._stat()
+            if signature is not None and signature != self._signature:
+                self._signature = signature
+                novo = read_state(self.path)
+                if novo is not None:
+                    delta = {k: novo[k] for k in SECCOES if novo.get(k) != self.state.get(k)}
+                    self.state = novo
+                    if delta:
+                        await layer.group_send(GROUP, {'type': 'estado.delta', 'delta': delta})
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+_watcher = None
+
+
+def get_watcher():
+    global _watcher
+    if _watcher is None:
+        _watcher = StateWatcher()
+    return _watcher
+
+
+class DashboardConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Envia {"tipo": "snapshot", ...} ao ligar e depois {"tipo": "delta", ...} só com as
+    secções alteradas. `?intervalo=<ms>` ajusta o intervalo mínimo entre mensagens.
+    """
+
+    async def connect(self):
+        self.intervalo = INTERVALO_PADRAO
+        query = self.scope.get('query_string', b'').decode()
+        for part in query.split('&'):
+            key, _, value = part.partition('=')
+            if key == 'intervalo':
+                try:
+                    self.intervalo = max(MIN_INTERVALO, int(value) / 1000)
+                except ValueError:
+                    pass
+        self._pendente = {}
+        self._flush = None
+        self._ultimo_envio = 0.0
+
+        await self.channel_layer.group_add(GROUP, self.channel_name)
+        await self.accept()
+        watcher = get_watcher()
+        watcher.attach()
+        # Lido agora: o estado do watcher pode ser de antes de um período sem clientes.
+        # O watcher não é atualizado aqui para os outros clientes ainda receberem o delta
+        state = read_state(watcher.path) or watcher.state or {}
+        await self.send_json({'tipo': 'snapshot', **{k: state.get(k) for k in SECCOES}})
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(GROUP, self.channel_name)
+        get_watcher().detach()
+        if self._flush is not None:
+            self._flush.cancel()
+
+    async def estado_delta(self, event):
+        # Junta deltas: a versão mais recente de cada secção substitui a anterior
+        self._pendente.update(event['delta'])
+        if self._flush is None:
+            espera = self._ultimo_envio + self.intervalo - time.monotonic()
+            self._flush = asyncio.ensure_future(self._enviar(max(0.0, espera)))
+
+    async def _enviar(self, espera):
+        if espera:
+            await asyncio.sleep(espera)
+        pendente, self._pendente = self._pendente, {}
+        self._flush = None
+        self._ultimo_envio = time.monotonic()
+        if pendente:
+            await self.send_json({'tipo': 'delta', **pendente})
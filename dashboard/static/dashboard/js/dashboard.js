@@ -26,8 +26,53 @@ async function fetchData() {
   }
 }
 
+// Atualizações por WebSocket (deltas empurrados pelo servidor); se o socket
+// não abrir ou cair, volta ao polling das APIs
+let pollTimer = null;
+
+function startPolling() {
+  if (pollTimer === null) {
+    fetchData();
+    pollTimer = setInterval(fetchData, 2_000);
+  }
+}
+
+function stopPolling() {
+  if (pollTimer !== null) {
+    clearInterval(pollTimer);
+    pollTimer = null;
+  }
+}
+
+function applyState(msg) {
+  if (msg.filas)   renderFilas(msg.filas);
+  if (msg.stats)   renderTaxa(msg.stats);
+  if (msg.medicos) renderMedicosChart(msg.medicos);
+}
+
+function connectSocket(retry = 1_000) {
+  if (!('WebSocket' in window)) {
+    startPolling();
+    return;
+  }
+  const scheme = location.protocol === 'https:' ? 'wss' : 'ws';
+  const ws = new WebSocket(`${scheme}://${location.host}/ws/dashboard/`);
+  let opened = false;
+
+  ws.onopen = () => {
+    opened = true;
+    stopPolling();
+  };
+  ws.onmessage = (ev) => applyState(JSON.parse(ev.data));
+  ws.onclose = () => {
+    startPolling();
+    const next = opened ? 1_000 : Math.min(retry * 2, 30_000);
+    setTimeout(() => connectSocket(next), next);
+  };
+}
+
 fetchData();
-setInterval(fetchData, 2_000);
+connectSocket();
 
 // Gráficos e tabela
 function renderFilas({ verde, amarelo, vermelho }) {
@@ -1,3 +1,54 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
 from django.test import TestCase
 
-# Create your tests here.
+from servidor.file_cache import FileCache
+from servidor.journal import write_snapshot
+from . import views
+
+
+class ContagensTests(TestCase):
+    """Contagens de /api/filas/ e /api/stats/ a partir do logs.json (sem estado.json)"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        log_file = os.path.join(tmp.name, 'logs.json')
+        write_snapshot(log_file, {
+            'medicos_totais': 3,
+            'salas_totais': 3,
+            'total_surtos': 1,
+            '0': {'pid': 0, 'nivel': 'verde', 'saida': None},
+            '1': {'pid': 1, 'nivel': 'verde', 'saida': None},
+            '2': {'pid': 2, 'nivel': 'vermelho', 'saida': None},
+            '3': {'pid': 3, 'nivel': 'amarelo', 'saida': '2025-01-01T10:00:00Z'},
+            '4': {'pid': 4, 'nivel': 'amarelo', 'saida': '2025-01-01T10:00:00Z',
+                  'desistencia': True},
+        })
+        for name, value in (('LOG_FILE', log_file),
+                            ('STATE_FILE', os.path.join(tmp.name, 'estado.json')),
+                            ('_cache', FileCache())):
+            patcher = mock.patch.object(views, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_filas(self):
+        r = self.client.get('/api/filas/')
+        self.assertEqual(r.json(), {'verde': 2, 'amarelo': 0, 'vermelho': 1})
+
+    def test_stats(self):
+        r = self.client.get('/api/stats/')
+        self.assertEqual(r.json(), {'atendidos': 1, 'desistencias': 1, 'total': 5,
+                                    'esperando': 3})
+
+    def test_etag(self):
+        r = self.client.get('/api/filas/')
+        self.assertNotIn('Last-Modified', r)
+        r = self.client.get('/api/filas/', HTTP_IF_NONE_MATCH=r['ETag'])
+        self.assertEqual(r.status_code, 304)
+        r = self.client.get('/api/filas/', HTTP_IF_NONE_MATCH='"outro"')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(json.loads(r.content)['verde'], 2)
@@ -6,4 +6,6 @@ urlpatterns = [
     path('api/filas/', views.estado_filas, name='estado_filas'),
     path('api/stats/', views.estatisticas, name='estatisticas'),
     path('api/medicos/', views.listar_medicos, name='api_medicos'),
+    path('api/metricas/', views.metricas, name='api_metricas'),
+    path('metrics', views.prometheus, name='metrics'),
 ]
@@ -1,20 +1,75 @@
 import os
 import json
 from json import JSONDecodeError
+from urllib.error import URLError
+from urllib.request import urlopen
 
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.views.decorators.http import condition
+
+from servidor import event_store
+from servidor.file_cache import FileCache, etag, file_signature
+from servidor.instrumentacao import CONTENT_TYPE, juntar, texto
+from servidor.journal import iter_snapshot
+from servidor.live_state import read_state, resumo_medicos
+from servidor.med_slots import open_slots
+from servidor.metricas import RunMetrics
 
 STATUS_FILE = os.path.join(settings.BASE_DIR, 'med_status.json')
+# Slots dos médicos em memória partilhada, escritos pelo runurgencias sem lock global
+SLOTS_FILE = os.path.join(settings.BASE_DIR, 'medicos.slots')
 LOG_FILE = os.path.join(settings.BASE_DIR, 'logs.json')
+# Contadores publicados pelo servidor de urgências (O(1) por pedido)
+STATE_FILE = os.path.join(settings.BASE_DIR, 'estado.json')
+
+# Base de dados do runurgencias --sink sqlite (o ficheiro -wal muda a cada commit)
+DB_FILE = str(settings.DATABASES['default']['NAME'])
+DB_FILES = (DB_FILE, f"{DB_FILE}-wal")
+
+# Respostas calculadas, válidas enquanto os ficheiros de origem não mudarem
+_cache = FileCache()
+FILAS_FILES = (STATE_FILE, LOG_FILE, *DB_FILES)
+MEDICOS_FILES = (STATE_FILE, STATUS_FILE, LOG_FILE)
+
+
+def _conditional(paths):
+    """
+    ETag a partir da assinatura dos ficheiros (304 se nada mudou). Sem Last-Modified: a
+    resolução de 1 s daria 304 a um If-Modified-Since com estado mudado nesse segundo
+    """
+    return condition(
+        etag_func=lambda request, *args, **kwargs: etag(file_signature(*paths)),
+    )
+
 
+@_conditional(FILAS_FILES)
 def estado_filas(request):
     """
         GET /api/filas/
         { 'verde': n1, 'amarelo': n2, 'vermelho': n3 }
         Apenas conta quem ainda não saiu nem desistiu.
     """
+    return JsonResponse(_cache.get('filas', FILAS_FILES, _filas))
+
+
+def _filas():
+    state = read_state(STATE_FILE)
+    if state is not None:
+        return state['filas']
+    if _use_db():
+        return event_store.filas()
+    return _filas_from_logs()
+
+
+def _use_db():
+    """Sem logs.json, os registos estão na base de dados (--sink sqlite)"""
+    return not os.path.exists(LOG_FILE) and event_store.has_records()
+
+
+def _filas_from_logs():
+    """Recontagem a partir do logs.json, quando não há estado publicado"""
     filas = {'verde': 0, 'amarelo': 0, 'vermelho': 0}
     try:
         with open(LOG_FILE, 'r', encoding='utf-8') as f:
@@ -23,17 +78,32 @@ def estado_filas(request):
             # Só pacientes em espera
             if isinstance(rec, dict) and rec.get('saida') is None and not rec.get('desistencia', False):
                 nivel = rec.get('nivel')
-                filas[nivel] += 1
+                if nivel in filas:
+                    filas[nivel] += 1
     except (FileNotFoundError, json.JSONDecodeError):
         pass
-    return JsonResponse(filas)
+    return filas
 
 
+@_conditional(FILAS_FILES)
 def estatisticas(request):
     """
         GET /api/stats/
         { 'atendidos': x, 'desistencias': y, 'total': z }
     """
+    return JsonResponse(_cache.get('stats', FILAS_FILES, _stats))
+
+
+def _stats():
+    state = read_state(STATE_FILE)
+    if state is not None:
+        return state['stats']
+    if _use_db():
+        return event_store.stats()
+    return _stats_from_logs()
+
+
+def _stats_from_logs():
     stats = {'atendidos': 0, 'desistencias': 0, 'total': 0}
     try:
         with open(LOG_FILE, 'r', encoding='utf-8') as f:
@@ -49,9 +119,19 @@ def estatisticas(request):
             stats['esperando'] = stats['total'] - (stats['atendidos'] + stats['desistencias'])
     except (FileNotFoundError, json.JSONDecodeError):
         stats['esperando'] = 0
-    return JsonResponse(stats)
+    return stats
+
 
+def _medicos_etag(request, *args, **kwargs):
+    # Os slots mudam por mmap (o mtime não é fiável): o ETag usa o seu conteúdo
+    slots = open_slots(SLOTS_FILE)
+    if slots is None:
+        return etag(file_signature(*MEDICOS_FILES))
+    with slots:
+        return etag(file_signature(SLOTS_FILE), slots.digest())
 
+
+@condition(etag_func=_medicos_etag)
 def listar_medicos(request):
     """
         GET /api/medicos
@@ -66,6 +146,22 @@ def listar_medicos(request):
             'salas_ocupadas':   int
         }
     """
+    slots = open_slots(SLOTS_FILE)
+    if slots is not None:
+        # Leitura consistente de cada slot (seqlock), sem lock partilhado com o servidor
+        with slots:
+            return JsonResponse(resumo_medicos(slots.snapshot(), slots.salas))
+    return JsonResponse(_cache.get('medicos', MEDICOS_FILES, _medicos))
+
+
+def _medicos():
+    state = read_state(STATE_FILE)
+    if state is not None:
+        return state['medicos']
+    return _medicos_from_files()
+
+
+def _medicos_from_files():
     try:
         with open(STATUS_FILE, 'r', encoding='utf-8') as f:
             status = json.load(f)
@@ -107,7 +203,60 @@ def listar_medicos(request):
         'salas_livres': salas_livres,
         'salas_ocupadas': salas_ocupadas,
     }
-    return JsonResponse(resp)
+    return resp
+
+
+@_conditional(FILAS_FILES)
+def metricas(request):
+    """
+        GET /api/metricas/
+        {
+            "espera":  {"global": {...}, "nivel": {nivel: {...}}, "sala": {sala: {...}}},
+            "duracao": {...},
+            "debito":  {"10s": {"chegadas": r, "atendidos": r, "desistencias": r}, ...},
+            "serie":   {"resolucao": 1.0, "fim": iso, "chegadas": [...], ...}
+        }
+        Cada resumo tem n, media, min, max, p50, p90 e p99 (segundos).
+    """
+    return JsonResponse(_cache.get('metricas', FILAS_FILES, _metricas))
+
+
+def _metricas():
+    state = read_state(STATE_FILE)
+    if state is not None and 'metricas' in state:
+        return state['metricas']
+    # Sem estado publicado: uma passagem pelos registos, sem ordenar o histórico
+    run = RunMetrics()
+    if _use_db():
+        for rec in event_store.iter_records():
+            run.apply(rec)
+        return run.resumo()
+    for key, rec in iter_snapshot(LOG_FILE):
+        if key.isdigit() and isinstance(rec, dict):
+            run.apply(rec)
+    return run.resumo()
+
+
+def prometheus(request):
+    """
+        GET /metrics
+        Métricas dos servidores de urgências em settings.METRICAS_URLS, somadas, no
+        formato de texto do Prometheus; urgencias_up indica que servidores responderam.
+    """
+    snap = {}
+    up = []
+    for url in settings.METRICAS_URLS:
+        try:
+            with urlopen(f"{url.rstrip('/')}/metrics.json", timeout=1) as resp:
+                juntar(snap, json.load(resp))
+            up.append([[url], 1])
+        except (URLError, OSError, ValueError):
+            up.append([[url], 0])
+    snap['urgencias_up'] = {
+        'tipo': 'gauge', 'ajuda': "Servidor de urgências respondeu à recolha",
+        'rotulos': ['alvo'], 'limites': None, 'series': up,
+    }
+    return HttpResponse(texto(snap), content_type=CONTENT_TYPE)
 
 
 def index(request):
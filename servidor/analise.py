@@ -0,0 +1,220 @@
+"""
+Análise offline dos registos de uma execução com NumPy.
+
+load_columns lê o logs.json (linha a linha, via iter_snapshot) ou um arquivo colunar
+(servidor.arquivo, mapeado em memória) para arrays colunares:
+códigos de nível, sala e médico, tempos de chegada/início/saída em segundos desde a
+primeira chegada (NaN quando não existem), espera, duração e desistência. As métricas são
+calculadas sobre essas colunas de forma vetorizada (bincount, máscaras, cumsum sobre os
+eventos ordenados), sem ciclos Python por registo, pelo que milhões de registos se
+analisam em segundos.
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from servidor.des import NIVEIS
+from servidor.journal import LOG_FILE, iter_snapshot
+
+QUANTIS = (50, 90, 99)
+SEM_SALA = -1
+
+
+@dataclass
+class Colunas:
+    """Registos de uma execução em colunas (uma posição por pid)"""
+    pid: np.ndarray
+    nivel: np.ndarray        # int8, índice em NIVEIS (-1 se desconhecido)
+    room: np.ndarray         # int32 (SEM_SALA se o paciente nunca foi atendido)
+    medico: np.ndarray       # int32, índice em `medicos` (-1 se nenhum)
+    chegada: np.ndarray      # float64, segundos desde `origem`
+    inicio: np.ndarray
+    saida: np.ndarray
+    espera: np.ndarray
+    duracao: np.ndarray
+    desistencia: np.ndarray  # bool
+    medicos: list = field(default_factory=list)
+    origem: np.datetime64 | None = None
+    meta: dict = field(default_factory=dict)
+
+    def __len__(self):
+        return len(self.pid)
+
+
+def _timestamps(values):
+    """Timestamps ISO (com ou sem 'Z') em datetime64[us]; None passa a NaT"""
+    # O NumPy não aceita o sufixo de fuso; a conversão das strings é vetorizada
+    return np.array(['NaT' if v is None else v[:-1] if v[-1:] == 'Z' else v for v in values],
+                    dtype='datetime64[us]')
+
+
+def _float(values):
+    # None passa a NaN na conversão para float64
+    return np.array(values, dtype=np.float64)
+
+
+def from_records(items, meta=None):
+    """Constrói as Colunas a partir de pares (pid, registo) no formato do logs.json"""
+    niveis = {nivel: i for i, nivel in enumerate(NIVEIS)}
+    medicos = {None: -1}
+    cols = {k: [] for k in ('pid', 'nivel', 'room', 'medico', 'chegada', 'inicio',
+                            'saida', 'espera', 'duracao', 'desistencia')}
+    meta = dict(meta or {})
+    # Uma passagem: só escalares nas listas (o GC não os segue) e métodos já resolvidos
+    (add_pid, add_nivel, add_room, add_medico, add_chegada, add_inicio,
+     add_saida, add_espera, add_duracao, add_desistencia) = (v.append for v in cols.values())
+    nivel_de = niveis.get
+    for key, rec in items:
+        if not str(key).isdigit() or not isinstance(rec, dict):
+            meta[key] = rec
+            continue
+        get = rec.get
+        add_pid(key)
+        add_nivel(nivel_de(get('nivel'), -1))
+        add_room(get('room'))
+        med = get('medico')
+        code = medicos.get(med)
+        if code is None:
+            code = medicos[med] = len(medicos) - 1
+        add_medico(code)
+        add_chegada(get('chegada'))
+        add_inicio(get('inicio'))
+        add_saida(get('saida'))
+        add_espera(get('espera'))
+        add_duracao(get('duracao'))
+        add_desistencia(get('desistencia', False))
+    del medicos[None]
+
+    chegada = _timestamps(cols['chegada'])
+    validas = chegada[~np.isnat(chegada)]
+    origem = validas.min() if len(validas) else None
+
+    def rel(ts):
+        if origem is None:
+            return np.full(len(ts), np.nan)
+        return (ts - origem) / np.timedelta64(1, 's')
+
+    return Colunas(
+        pid=np.array(cols['pid']).astype(np.int64),
+        nivel=np.array(cols['nivel'], dtype=np.int8),
+        room=np.nan_to_num(_float(cols['room']), nan=SEM_SALA).astype(np.int32),
+        medico=np.array(cols['medico'], dtype=np.int32),
+        chegada=rel(chegada),
+        inicio=rel(_timestamps(cols['inicio'])),
+        saida=rel(_timestamps(cols['saida'])),
+        espera=_float(cols['espera']),
+        duracao=_float(cols['duracao']),
+        desistencia=np.array(cols['desistencia'], dtype=bool),
+        medicos=list(medicos),
+        origem=origem,
+        meta=meta,
+    )
+
+
+def load_columns(path=LOG_FILE):
+    """
+    Lê o logs.json (ou outro snapshot no mesmo formato) para Colunas. Um arquivo
+    colunar (servidor.arquivo) é mapeado em memória, sem parsing.
+    """
+    from servidor.arquivo import is_archive, open_archive
+    if is_archive(path):
+        return open_archive(path).to_colunas()
+    return from_records(iter_snapshot(path))
+
+
+def _resumo(values):
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {'n': 0, 'media': None, **{f'p{q}': None for q in QUANTIS}}
+    pct = np.percentile(values, QUANTIS)
+    return {
+        'n': int(len(values)),
+        'media': float(values.mean()),
+        **{f'p{q}': float(v) for q, v in zip(QUANTIS, pct)},
+    }
+
+
+def esperas(c):
+    """Espera até ao atendimento (pacientes atendidos), global e por nível"""
+    atendidos = ~c.desistencia & ~np.isnan(c.inicio)
+    out = {'global': _resumo(c.espera[atendidos])}
+    for i, nivel in enumerate(NIVEIS):
+        out[nivel] = _resumo(c.espera[atendidos & (c.nivel == i)])
+    return out
+
+
+def desistencias(c):
+    """Taxa de desistência global e por nível"""
+    validos = c.nivel >= 0
+    totais = np.bincount(c.nivel[validos], minlength=len(NIVEIS))
+    desist = np.bincount(c.nivel[validos & c.desistencia], minlength=len(NIVEIS))
+    out = {'global': float(c.desistencia.mean()) if len(c) else None}
+    for i, nivel in enumerate(NIVEIS):
+        out[nivel] = float(desist[i] / totais[i]) if totais[i] else None
+    return out
+
+
+def horizonte(c):
+    """Duração observada da execução (da primeira chegada ao último evento), em segundos"""
+    fins = np.concatenate([c.chegada, c.inicio, c.saida])
+    fins = fins[~np.isnan(fins)]
+    return float(fins.max()) if len(fins) else 0.0
+
+
+def utilizacao(c):
+    """Fração do horizonte em que cada médico esteve ocupado (atendimentos concluídos)"""
+    h = horizonte(c)
+    concluidos = (c.medico >= 0) & ~np.isnan(c.saida) & ~np.isnan(c.inicio)
+    ocupado = np.bincount(c.medico[concluidos],
+                          weights=(c.saida - c.inicio)[concluidos],
+                          minlength=len(c.medicos))
+    return {med: float(ocupado[i] / h) if h else 0.0 for i, med in enumerate(c.medicos)}
+
+
+def fila_ao_longo_do_tempo(c, resolucao=1.0, nivel=None):
+    """
+    Nº de pacientes em espera amostrado a cada `resolucao` segundos: (instantes, tamanhos).
+    Cada paciente entra na chegada e sai no início do atendimento ou na desistência.
+    """
+    mask = np.ones(len(c), dtype=bool) if nivel is None else c.nivel == NIVEIS.index(nivel)
+    entradas = c.chegada[mask]
+    entradas = entradas[~np.isnan(entradas)]
+    saidas = np.where(c.desistencia, c.saida, c.inicio)[mask]
+    saidas = saidas[~np.isnan(saidas)]
+    tempos = np.concatenate([entradas, saidas])
+    deltas = np.concatenate([np.ones(len(entradas), np.int64), -np.ones(len(saidas), np.int64)])
+    # Saídas antes de entradas no mesmo instante
+    ordem = np.lexsort((deltas, tempos))
+    tempos, tamanho = tempos[ordem], np.cumsum(deltas[ordem])
+    instantes = np.arange(0.0, horizonte(c) + resolucao, resolucao)
+    idx = np.searchsorted(tempos, instantes, side='right') - 1
+    curva = np.where(idx >= 0, tamanho[np.maximum(idx, 0)], 0)
+    return instantes, curva
+
+
+def analisar(c, resolucao=1.0):
+    """Resumo completo de uma execução (serializável em JSON)"""
+    instantes, curva = fila_ao_longo_do_tempo(c, resolucao)
+    util = utilizacao(c)
+    valores = np.array(list(util.values())) if util else np.zeros(0)
+    return {
+        'pacientes': len(c),
+        'meta': c.meta,
+        'horizonte': horizonte(c),
+        'espera': esperas(c),
+        'duracao': _resumo(c.duracao),
+        'desistencia': desistencias(c),
+        'utilizacao': {
+            'media': float(valores.mean()) if len(valores) else None,
+            'min': float(valores.min()) if len(valores) else None,
+            'max': float(valores.max()) if len(valores) else None,
+            'medicos': util,
+        },
+        'fila': {
+            'resolucao': resolucao,
+            'max': int(curva.max()) if len(curva) else 0,
+            'media': float(curva.mean()) if len(curva) else 0.0,
+            'curva': curva.tolist(),
+            **{nivel: fila_ao_longo_do_tempo(c, resolucao, nivel)[1].tolist() for nivel in NIVEIS},
+        },
+    }
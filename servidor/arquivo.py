@@ -0,0 +1,162 @@
+"""
+Arquivo colunar de execuções terminadas (.col).
+
+Formato (little-endian):
+    MAGIC (8 bytes) | tamanho do cabeçalho (uint32) | cabeçalho JSON | colunas
+
+O cabeçalho guarda os metadados da execução (salas_totais, medicos_totais,
+total_surtos), o nº de registos, a origem dos tempos, os rótulos dos médicos e, para cada
+coluna, o tipo e o offset no ficheiro. Cada coluna é um array de largura fixa alinhado a
+64 bytes, pelo que open_archive mapeia o ficheiro com mmap e devolve cada coluna como
+uma vista NumPy sem ler nem converter os dados; só as páginas usadas são lidas do disco.
+"""
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from servidor.analise import Colunas
+from servidor.des import NIVEIS
+
+MAGIC = b'URGCOL1\n'
+VERSAO = 1
+ALINHAMENTO = 64
+
+# Nome e tipo (largura fixa, little-endian) de cada coluna
+COLUNAS = (
+    ('pid', '<i8'),
+    ('nivel', '|i1'),
+    ('room', '<i4'),
+    ('medico', '<i4'),
+    ('chegada', '<f8'),
+    ('inicio', '<f8'),
+    ('saida', '<f8'),
+    ('espera', '<f8'),
+    ('duracao', '<f8'),
+    ('desistencia', '|b1'),
+)
+
+
+def _alinhar(n):
+    return -(-n // ALINHAMENTO) * ALINHAMENTO
+
+
+def is_archive(path):
+    """True se o ficheiro começa pelo MAGIC do formato colunar"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def write_archive(path, colunas):
+    """Grava as Colunas de uma execução no formato colunar (de forma atómica)"""
+    n = len(colunas)
+    arrays = [(nome, np.ascontiguousarray(getattr(colunas, nome), dtype=dtype))
+              for nome, dtype in COLUNAS]
+    header = {
+        'versao': VERSAO,
+        'n': n,
+        'meta': colunas.meta,
+        'origem': None if colunas.origem is None else str(colunas.origem) + 'Z',
+        'niveis': list(NIVEIS),
+        'medicos': list(colunas.medicos),
+        'colunas': [],
+    }
+    # O offset das colunas depende do tamanho do cabeçalho, que inclui os offsets:
+    # reserva-se espaço para os números e ajusta-se até estabilizar
+    inicio = 0
+    while True:
+        header['colunas'] = []
+        offset = inicio
+        for nome, arr in arrays:
+            header['colunas'].append({'nome': nome, 'tipo': arr.dtype.str,
+                                      'offset': offset, 'bytes': arr.nbytes})
+            offset = _alinhar(offset + arr.nbytes)
+        raw = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        necessario = _alinhar(len(MAGIC) + 4 + len(raw))
+        if necessario == inicio:
+            break
+        inicio = necessario
+
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(raw)))
+        f.write(raw)
+        for col, (_, arr) in zip(header['colunas'], arrays):
+            f.write(b'\0' * (col['offset'] - f.tell()))
+            f.write(arr.tobytes())
+    os.replace(tmp, path)
+
+
+def read_header(f):
+    """Lê o cabeçalho de um ficheiro aberto em binário"""
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Não é um arquivo colunar de execução")
+    (size,) = struct.unpack('<I', f.read(4))
+    header = json.loads(f.read(size))
+    if header.get('versao') != VERSAO:
+        raise ValueError(f"Versão de arquivo não suportada: {header.get('versao')}")
+    return header
+
+
+class Arquivo:
+    """Execução arquivada, mapeada em memória; as colunas são vistas sobre o mmap"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.header = read_header(f)
+            size = os.fstat(f.fileno()).st_size
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._colunas = {c['nome']: c for c in self.header['colunas']}
+
+    @property
+    def meta(self):
+        return self.header['meta']
+
+    def __len__(self):
+        return self.header['n']
+
+    def nomes(self):
+        return list(self._colunas)
+
+    def column(self, nome):
+        """Vista só de leitura de uma coluna (sem cópia)"""
+        c = self._colunas[nome]
+        if not c['bytes']:
+            return np.zeros(0, dtype=c['tipo'])
+        return np.frombuffer(self._mmap, dtype=c['tipo'], count=self.header['n'], offset=c['offset'])
+
+    def to_colunas(self):
+        """Colunas prontas para servidor.analise, ainda apoiadas no mmap"""
+        origem = self.header['origem']
+        return Colunas(
+            **{nome: self.column(nome) for nome, _ in COLUNAS},
+            medicos=list(self.header['medicos']),
+            origem=None if origem is None else np.datetime64(origem.rstrip('Z'), 'us'),
+            meta=dict(self.meta),
+        )
+
+    def close(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Ainda há colunas em uso; o mapeamento fecha quando forem libertadas
+                pass
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_archive(path):
+    return Arquivo(path)
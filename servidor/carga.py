@@ -0,0 +1,326 @@
+"""
+Gerador de carga em malha aberta para o runurgencias (manage.py runcarga).
+
+As chegadas seguem um calendário fixo (Poisson, ritmo constante ou a repetição de um
+registo) e são enviadas no instante previsto, quer o servidor já tenha confirmado as
+anteriores quer não. Assim a carga não abranda quando o servidor satura, ao contrário
+dos clientes com uma thread por paciente. Tudo corre num único event loop asyncio:
+
+- protocolo 2 (por omissão): `ligacoes` ligações persistentes reutilizadas em
+  round-robin; as chegadas devidas no mesmo instante seguem num só lote;
+- protocolo 1: uma ligação por paciente (servidores antigos), com no máximo `ligacoes`
+  abertas ao mesmo tempo.
+
+A latência de cada chegada conta desde o instante previsto até ao ack, pelo que inclui o
+atraso do próprio gerador e não esconde a fila de espera (coordinated omission).
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import time
+
+from servidor import clock
+from servidor.journal import iter_snapshot
+from servidor.metricas import LogHistogram, _epoch
+from servidor.protocol import ACK_CHEGADA, PROTOCOLO_V2, encode_line
+
+ARRIVALS = ('poisson', 'constante', 'trace')
+QUANTIS = (0.5, 0.9, 0.99, 0.999)
+# Abaixo desta fração da taxa pedida (ou com erros) o passo conta como saturado
+LIMIAR_SATURACAO = 0.95
+
+
+def poisson(taxa, rng):
+    """Instantes (s) de um processo de Poisson com `taxa` chegadas/s"""
+    t = 0.0
+    while True:
+        t += rng.expovariate(taxa)
+        yield t, None
+
+
+def constante(taxa):
+    """Uma chegada a cada 1/taxa segundos"""
+    for i in itertools.count():
+        yield i / taxa, None
+
+
+def trace(path, velocidade=1.0):
+    """
+    Repete as chegadas de um registo: um logs.json (instante e nível de cada pid) ou um
+    ficheiro de texto com uma chegada por linha, `segundos[,nivel]`. Com `velocidade` 2
+    o registo corre duas vezes mais depressa.
+    """
+    with open(path, 'rb') as f:
+        primeiro = f.read(1)
+    if primeiro == b'{':
+        chegadas = []
+        for key, rec in iter_snapshot(path):
+            if key.isdigit() and isinstance(rec, dict) and rec.get('chegada'):
+                t = _epoch(rec['chegada'])
+                if t is not None:
+                    chegadas.append((t, rec.get('nivel')))
+        chegadas.sort(key=lambda c: c[0])
+        t0 = chegadas[0][0] if chegadas else 0.0
+        for t, nivel in chegadas:
+            yield (t - t0) / velocidade, nivel
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            t, _, nivel = line.partition(',')
+            yield float(t) / velocidade, nivel.strip() or None
+
+
+class Resultado:
+    """Contadores e histograma de latência (ms) de um passo de carga"""
+
+    def __init__(self, taxa=None):
+        self.taxa = taxa
+        self.enviados = 0
+        self.confirmados = 0
+        self.rejeitados = 0
+        self.erros = {}
+        self.latencia = LogHistogram()
+        # Atraso máximo do gerador em relação ao calendário (s)
+        self.atraso_max = 0.0
+        self.inicio = None
+        self.fim_envio = None
+        self.ultimo_ack = None
+
+    def erro(self, tipo, n=1):
+        self.erros[tipo] = self.erros.get(tipo, 0) + n
+
+    def ack(self, agendados, agora, rejeitados=0):
+        for due in agendados:
+            self.latencia.add((agora - due) * 1000)
+        self.rejeitados += rejeitados
+        self.confirmados += len(agendados) - rejeitados
+        self.ultimo_ack = agora
+
+    def resumo(self):
+        envio = (self.fim_envio or self.inicio) - self.inicio if self.inicio else 0.0
+        total = (self.ultimo_ack or self.inicio or 0.0) - (self.inicio or 0.0)
+        taxa_enviada = self.enviados / envio if envio else 0.0
+        taxa_confirmada = self.confirmados / total if total else 0.0
+        lat = self.latencia
+        erros = sum(self.erros.values())
+        return {
+            'taxa_pedida': self.taxa,
+            'enviados': self.enviados,
+            'confirmados': self.confirmados,
+            'rejeitados': self.rejeitados,
+            'erros': dict(self.erros),
+            'duracao_envio': round(envio, 3),
+            'taxa_enviada': round(taxa_enviada, 1),
+            'taxa_confirmada': round(taxa_confirmada, 1),
+            'atraso_gerador_max_ms': round(self.atraso_max * 1000, 3),
+            'latencia_ms': {
+                'n': lat.n,
+                'media': round(lat.soma / lat.n, 3) if lat.n else None,
+                'max': round(lat.max, 3) if lat.n else None,
+                **{f"p{q * 100:g}": None if v is None else round(v, 3)
+                   for q, v in zip(QUANTIS, lat.quantiles(QUANTIS))},
+            },
+            'saturado': bool(
+                erros or self.rejeitados
+                or (self.taxa and taxa_confirmada < LIMIAR_SATURACAO * self.taxa)
+            ),
+        }
+
+
+class _Ligacao:
+    """Ligação persistente v2 com vários lotes em trânsito"""
+
+    def __init__(self, gerador):
+        self.g = gerador
+        self.writer = None
+        self.pendentes = {}
+        self.lote = 0
+        self.viva = False
+        self._leitor = None
+
+    async def abrir(self):
+        reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.g.host, self.g.port), self.g.timeout)
+        sock = self.writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.writer.write(encode_line({'protocolo': PROTOCOLO_V2}))
+        reply = json.loads(await asyncio.wait_for(reader.readline(), self.g.timeout) or b'{}')
+        if reply.get('protocolo') != PROTOCOLO_V2:
+            self.writer.close()
+            raise ConnectionError(f"servidor recusou o protocolo v2: {reply}")
+        self.viva = True
+        self._leitor = asyncio.create_task(self._ler_acks(reader))
+
+    def enviar(self, pacientes, agendados):
+        lote = self.lote
+        self.lote += 1
+        self.pendentes[lote] = agendados
+        self.writer.write(encode_line({'lote': lote, 'pacientes': pacientes}))
+
+    async def _ler_acks(self, reader):
+        res = self.g.resultado
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionError('ligação fechada pelo servidor')
+                agora = time.monotonic()
+                ack = json.loads(line)
+                agendados = self.pendentes.pop(ack.get('ack'), None)
+                if agendados is not None:
+                    res.ack(agendados, agora, ack.get('rejeitados', 0))
+        except (ConnectionError, OSError, ValueError) as e:
+            self.viva = False
+            perdidos = sum(len(a) for a in self.pendentes.values())
+            self.pendentes.clear()
+            if perdidos:
+                res.erro(type(e).__name__, perdidos)
+
+    async def fechar(self):
+        if self._leitor is not None:
+            self._leitor.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+
+class LoadGenerator:
+    """
+    Envia as chegadas de um calendário (pares (segundos, nivel) a partir do início) e
+    mede o que o servidor confirma. Chegadas sem nível recebem um nível sorteado de `mix`.
+    """
+
+    def __init__(self, host='127.0.0.1', port=9000, ligacoes=8, protocolo=PROTOCOLO_V2,
+                 mix=None, seed=None, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.ligacoes = ligacoes
+        self.protocolo = protocolo
+        self.rng = random.Random(seed)
+        mix = mix or {'vermelho': 1.0, 'amarelo': 1.0, 'verde': 1.0}
+        self.niveis = list(mix)
+        self.pesos = list(mix.values())
+        self.timeout = timeout
+        self._pids = itertools.count((os.getpid() & 0x7FF) << 32)
+        self.resultado = None
+
+    def _paciente(self, nivel):
+        if nivel is None:
+            nivel = self.rng.choices(self.niveis, self.pesos)[0]
+        return {'pid': next(self._pids), 'timestamp': clock.iso_now(), 'urgência': nivel}
+
+    async def run(self, chegadas, taxa=None):
+        """Executa um passo de carga e devolve o Resultado"""
+        self.resultado = Resultado(taxa)
+        if self.protocolo == PROTOCOLO_V2:
+            await self._run_v2(chegadas)
+        else:
+            await self._run_v1(chegadas)
+        return self.resultado
+
+    async def _calendario(self, chegadas):
+        """Gera grupos de (instante previsto, nível) à medida que ficam devidos"""
+        res = self.resultado
+        t0 = res.inicio = time.monotonic()
+        grupo = []
+        for offset, nivel in chegadas:
+            due = t0 + offset
+            atraso = time.monotonic() - due
+            if atraso < 0:
+                if grupo:
+                    yield grupo
+                    grupo = []
+                await asyncio.sleep(-atraso)
+                atraso = time.monotonic() - due
+            if atraso > res.atraso_max:
+                res.atraso_max = atraso
+            grupo.append((due, nivel))
+        if grupo:
+            yield grupo
+        res.fim_envio = time.monotonic()
+
+    async def _run_v2(self, chegadas):
+        res = self.resultado
+        ligacoes = [_Ligacao(self) for _ in range(self.ligacoes)]
+        for lig in ligacoes:
+            try:
+                await lig.abrir()
+            except (OSError, asyncio.TimeoutError, ConnectionError) as e:
+                res.erro(type(e).__name__)
+        ciclo = itertools.cycle(ligacoes)
+        async for grupo in self._calendario(chegadas):
+            lig = next((c for c in itertools.islice(ciclo, len(ligacoes)) if c.viva), None)
+            if lig is None:
+                res.erro('sem_ligacao', len(grupo))
+                continue
+            lig.enviar([self._paciente(nivel) for _, nivel in grupo], [due for due, _ in grupo])
+            res.enviados += len(grupo)
+            # Deixa o event loop escrever e ler acks entre grupos
+            await asyncio.sleep(0)
+        # Espera pelos acks em falta
+        limite = time.monotonic() + self.timeout
+        while any(lig.pendentes for lig in ligacoes) and time.monotonic() < limite:
+            await asyncio.sleep(0.01)
+        sem_resposta = sum(sum(len(a) for a in lig.pendentes.values()) for lig in ligacoes)
+        if sem_resposta:
+            res.erro('timeout', sem_resposta)
+        for lig in ligacoes:
+            await lig.fechar()
+
+    async def _run_v1(self, chegadas):
+        res = self.resultado
+        limite = asyncio.Semaphore(self.ligacoes)
+        tarefas = set()
+
+        async def um(due, nivel):
+            async with limite:
+                try:
+                    reader, writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port), self.timeout)
+                    try:
+                        writer.write(json.dumps(self._paciente(nivel)).encode('utf-8'))
+                        resp = await asyncio.wait_for(
+                            reader.readexactly(len(ACK_CHEGADA)), self.timeout)
+                    finally:
+                        writer.close()
+                except asyncio.TimeoutError:
+                    res.erro('timeout')
+                    return
+                except (OSError, asyncio.IncompleteReadError) as e:
+                    res.erro(type(e).__name__)
+                    return
+                if resp == ACK_CHEGADA:
+                    res.ack((due,), time.monotonic())
+                else:
+                    res.erro('resposta_invalida')
+
+        async for grupo in self._calendario(chegadas):
+            for due, nivel in grupo:
+                t = asyncio.create_task(um(due, nivel))
+                tarefas.add(t)
+                t.add_done_callback(tarefas.discard)
+                res.enviados += 1
+        if tarefas:
+            await asyncio.gather(*tarefas)
+
+
+def calendario(arrivals, taxa=None, duracao=None, pacientes=None, trace_path=None,
+               velocidade=1.0, seed=None):
+    """Chegadas de um passo, limitadas a `duracao` segundos e/ou `pacientes` chegadas"""
+    if arrivals == 'poisson':
+        it = poisson(taxa, random.Random(seed))
+    elif arrivals == 'constante':
+        it = constante(taxa)
+    else:
+        it = trace(trace_path, velocidade)
+    if duracao is not None:
+        it = itertools.takewhile(lambda c: c[0] < duracao, it)
+    if pacientes is not None:
+        it = itertools.islice(it, pacientes)
+    return it
@@ -0,0 +1,102 @@
+"""
+Clientes do protocolo de chegada de pacientes.
+
+send_legacy abre uma ligação por paciente (protocolo v1, CHEGADA_RECEBIDA).
+PatientConnection mantém uma ligação aberta (protocolo v2) e envia os pacientes em
+lotes JSON-lines, com um acknowledgement por lote.
+"""
+import json
+import socket
+
+from servidor.protocol import PROTOCOLO_V2, encode_line
+
+
+class ProtocolError(RuntimeError):
+    """O servidor não aceitou o protocolo v2 ou respondeu algo inesperado"""
+
+
+def send_legacy(host, port, payload, timeout=None):
+    """Envia um paciente numa ligação própria e devolve a resposta do servidor"""
+    with socket.create_connection((host, port), timeout=timeout) as s:
+        s.sendall(json.dumps(payload).encode('utf-8'))
+        return s.recv(128)
+
+
+class PatientConnection:
+    """
+    Ligação persistente (protocolo v2).
+
+    `send_batch` envia um lote e espera pelo ack; `send_many` divide uma sequência de
+    pacientes em lotes e mantém até `window` lotes em trânsito antes de ler os acks.
+    """
+
+    def __init__(self, host, port, timeout=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self._rfile = None
+        self._next_lote = 0
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._rfile = self.sock.makefile('rb')
+        self.sock.sendall(encode_line({'protocolo': PROTOCOLO_V2}))
+        reply = self._read_reply()
+        if reply.get('protocolo') != PROTOCOLO_V2:
+            self.close()
+            raise ProtocolError(f"Servidor recusou o protocolo v2: {reply}")
+        return self
+
+    def _read_reply(self):
+        line = self._rfile.readline()
+        if not line:
+            raise ProtocolError("Ligação fechada pelo servidor")
+        return json.loads(line)
+
+    def _send(self, patients):
+        lote = self._next_lote
+        self._next_lote += 1
+        self.sock.sendall(encode_line({'lote': lote, 'pacientes': list(patients)}))
+        return lote
+
+    def send_batch(self, patients):
+        """Envia um lote e devolve o ack {'ack', 'recebidos', 'rejeitados'}"""
+        self._send(patients)
+        return self._read_reply()
+
+    def send_many(self, patients, batch_size=100, window=8):
+        """Envia todos os pacientes em lotes e devolve a lista de acks"""
+        acks = []
+        in_flight = 0
+        batch = []
+        for pay in patients:
+            batch.append(pay)
+            if len(batch) >= batch_size:
+                self._send(batch)
+                batch = []
+                in_flight += 1
+                if in_flight >= window:
+                    acks.append(self._read_reply())
+                    in_flight -= 1
+        if batch:
+            self._send(batch)
+            in_flight += 1
+        for _ in range(in_flight):
+            acks.append(self._read_reply())
+        return acks
+
+    def close(self):
+        if self._rfile:
+            self._rfile.close()
+            self._rfile = None
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,34 @@
+"""
+Relógio interno da simulação.
+
+O motor trabalha com tempos monotónicos em segundos (float), imunes a saltos do
+relógio de parede; os timestamps ISO ('...Z') só são gerados ao serializar registos.
+"""
+import time
+from datetime import datetime, timezone
+
+# Âncora que liga o relógio monotónico ao relógio de parede
+_MONO0 = time.monotonic()
+_WALL0 = time.time()
+
+now = time.monotonic
+
+
+def epoch_to_iso(seconds):
+    """Converte segundos desde a epoch em timestamp ISO UTC com sufixo 'Z'"""
+    wall = datetime.fromtimestamp(seconds, timezone.utc)
+    return wall.replace(tzinfo=None).isoformat(timespec='microseconds') + 'Z'
+
+
+def to_iso(t):
+    """Converte um tempo monotónico em timestamp ISO UTC com sufixo 'Z'"""
+    return epoch_to_iso(_WALL0 + (t - _MONO0))
+
+
+def iso_now():
+    return to_iso(now())
+
+
+def seconds(delta):
+    """Arredonda durações à resolução dos timestamps ISO (microssegundos)"""
+    return round(delta, 6)
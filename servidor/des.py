@@ -0,0 +1,280 @@
+"""
+Motor de simulação por eventos discretos (relógio virtual).
+
+Reproduz a semântica das Room (prioridades URGENCIA_PRIORIDADES, tempos
+TEMPOS_ATENDIMENTO e desistências por TIMEOUTS, usando a mesma PatientQueue), mas em vez
+de threads e time.sleep avança um relógio virtual através de um heap de eventos. Um
+cenário de milhares de pacientes corre em milissegundos e produz registos com o mesmo
+esquema do logs.json.
+"""
+import heapq
+import itertools
+import random
+import time
+from dataclasses import dataclass, field
+
+from servidor import clock
+from servidor.constants import TEMPOS_ATENDIMENTO, TIMEOUTS, URGENCIA_PRIORIDADES
+from servidor.dispatch import make_policy
+from servidor.patient_queue import ARRIVAL, PAYLOAD, PID, TS, PatientQueue
+
+NIVEIS = list(URGENCIA_PRIORIDADES)
+
+# Tipos de evento
+CHEGADA, FIM_ATENDIMENTO, DESISTENCIA = range(3)
+
+
+@dataclass
+class Scenario:
+    """
+    Cenário de simulação. Por omissão segue o padrão do simulate_multi_salas.py:
+    surtos de `surto` pacientes espaçados `intervalo` segundos, com `pausa` segundos
+    entre surtos. Com `taxa` as chegadas passam a ser um processo de Poisson.
+    `politica` e `roubo` correspondem às opções --politica e --roubo do runurgencias.
+    """
+    salas: int = 3
+    medicos: int = 1
+    pacientes: int = 20
+    surto: int = 5
+    intervalo: float = 0.05
+    pausa: float = 2.0
+    taxa: float | None = None
+    mix: dict = field(default_factory=lambda: {nivel: 1.0 for nivel in NIVEIS})
+    tempos: dict = field(default_factory=lambda: dict(TEMPOS_ATENDIMENTO))
+    timeouts: dict = field(default_factory=lambda: dict(TIMEOUTS))
+    servico: str = 'fixo'
+    politica: str = 'round-robin'
+    roubo: bool = False
+    seed: int | None = None
+
+    def __post_init__(self):
+        # Valores que fariam o motor falhar a meio (divisões por zero) ou mudar de modo
+        if self.salas < 1 or self.medicos < 1 or self.surto < 1:
+            raise ValueError("salas, medicos e surto devem ser >= 1")
+        if self.taxa is not None and not self.taxa > 0:
+            raise ValueError("taxa deve ser > 0 (ou None para surtos)")
+        if self.pacientes < 0:
+            raise ValueError("pacientes deve ser >= 0")
+
+    @property
+    def total_surtos(self):
+        if self.taxa:
+            return 0
+        return -(-self.pacientes // self.surto)
+
+
+def parse_mix(text):
+    """Converte 'vermelho=1,amarelo=2,verde=3' no dicionário de pesos do cenário"""
+    mix = {}
+    for part in text.split(','):
+        nivel, _, peso = part.partition('=')
+        nivel = nivel.strip()
+        if nivel not in URGENCIA_PRIORIDADES:
+            raise ValueError(f"Nível de urgência desconhecido: {nivel!r}")
+        mix[nivel] = float(peso) if peso else 1.0
+    return mix
+
+
+class VirtualRoom:
+    """Sala do motor de eventos: fila de pacientes e médicos livres"""
+
+    def __init__(self, room_id, num_medicos, sim):
+        self.room_id = room_id
+        self.num_medicos = num_medicos
+        self.queue = PatientQueue()
+        self.livres = list(range(num_medicos, 0, -1))
+        # Fim previsto de cada atendimento em curso, por médico
+        self.em_atendimento = {}
+        self.sim = sim
+
+    def size(self):
+        return len(self.queue)
+
+    def pending_work(self):
+        now = self.sim.now
+        restante = sum(max(0.0, fim - now) for fim in self.em_atendimento.values())
+        return (self.queue.work + restante) / max(self.num_medicos, 1)
+
+
+class Simulation:
+    """
+    Executa um Scenario. Os registos ficam em `records` (estado mais recente por pid,
+    como no logs.json); se for dado um `sink` (ex.: JournalSink), cada evento é também
+    entregue a `sink.log_event`.
+    """
+
+    def __init__(self, scenario, sink=None, start_epoch=None):
+        self.scenario = scenario
+        self.sink = sink
+        self.rng = random.Random(scenario.seed)
+        self.rooms = [VirtualRoom(i, scenario.medicos, self) for i in range(scenario.salas)]
+        self.politica = make_policy(scenario.politica)
+        self.start_epoch = time.time() if start_epoch is None else start_epoch
+        self.now = 0.0
+        self.records = {}
+        self._events = []
+        self._seq = itertools.count()
+        self._niveis = list(scenario.mix)
+        self._pesos = [scenario.mix[n] for n in self._niveis]
+
+    def schedule(self, t, kind, data):
+        heapq.heappush(self._events, (t, next(self._seq), kind, data))
+
+    def iso(self, t):
+        return clock.epoch_to_iso(self.start_epoch + t)
+
+    def log_event(self, record):
+        self.records[record['pid']] = record
+        if self.sink is not None:
+            self.sink.log_event(record)
+
+    def arrivals(self):
+        """Gera (instante, pid, nível, surto) pela ordem de chegada"""
+        sc = self.scenario
+        choices = self.rng.choices
+        t = 0.0
+        for pid in range(sc.pacientes):
+            nivel = choices(self._niveis, self._pesos)[0]
+            if sc.taxa:
+                t += self.rng.expovariate(sc.taxa)
+                yield t, pid, nivel, None
+            else:
+                surto, pos = divmod(pid, sc.surto)
+                start = surto * (sc.surto * sc.intervalo + sc.pausa)
+                yield start + pos * sc.intervalo, pid, nivel, surto + 1
+
+    def service_time(self, nivel):
+        mean = self.scenario.tempos.get(nivel, 10)
+        if self.scenario.servico == 'exponencial':
+            return self.rng.expovariate(1 / mean)
+        return mean
+
+    def choose_room(self, nivel):
+        """Sala escolhida pela política de encaminhamento do cenário"""
+        return self.politica.choose(self.rooms)
+
+    def run(self):
+        arrivals = self.arrivals()
+        first = next(arrivals, None)
+        if first is not None:
+            self.schedule(first[0], CHEGADA, (first, arrivals))
+        while self._events:
+            t, _, kind, data = heapq.heappop(self._events)
+            self.now = t
+            if kind == CHEGADA:
+                self._on_arrival(*data)
+            elif kind == FIM_ATENDIMENTO:
+                self._on_end(*data)
+            else:
+                self._on_deadline(data)
+        return self.records
+
+    def _on_arrival(self, arrival, arrivals):
+        t, pid, nivel, surto = arrival
+        nxt = next(arrivals, None)
+        if nxt is not None:
+            self.schedule(nxt[0], CHEGADA, (nxt, arrivals))
+
+        ts = self.iso(t)
+        chegada = {
+            "pid": pid,
+            "medico": None,
+            "room": None,
+            "chegada": ts,
+            "nivel": nivel,
+            "inicio": None,
+            "saida": None,
+            "espera": None,
+            "duracao": None,
+            "desistencia": False
+        }
+        if surto is not None:
+            chegada["surto"] = surto
+        self.log_event(chegada)
+
+        room = self.choose_room(nivel)
+        deadline = t + self.scenario.timeouts.get(nivel, 0)
+        payload = {'urgencia': nivel, 'surto': surto}
+        room.queue.push(URGENCIA_PRIORIDADES.get(nivel, 99), t, pid, payload, deadline,
+                        ts=ts, work=self.scenario.tempos.get(nivel, 10))
+        self.schedule(deadline, DESISTENCIA, room)
+        if room.livres:
+            self._start(room)
+        elif self.scenario.roubo:
+            # Um médico parado noutra sala rouba o paciente
+            for other in self.rooms:
+                if other.livres:
+                    self._start(other, source=room)
+                    break
+
+    def _record(self, room, entry, medico, inicio, saida, desistencia):
+        payload = entry[PAYLOAD]
+        rec = {
+            "pid": entry[PID],
+            "medico": medico,
+            "room": room.room_id,
+            "chegada": entry[TS],
+            "nivel": payload['urgencia'],
+            "inicio": None if inicio is None else self.iso(inicio),
+            "saida": None if saida is None else self.iso(saida),
+            "espera": clock.seconds((saida if desistencia else inicio) - entry[ARRIVAL]),
+            "duracao": None if saida is None or inicio is None else clock.seconds(saida - inicio),
+            "desistencia": desistencia,
+        }
+        if payload['surto'] is not None:
+            rec["surto"] = payload['surto']
+        return rec
+
+    def _start(self, room, source=None):
+        """Um médico livre de `room` atende o próximo paciente de `source` (ou da sala)"""
+        med_id = room.livres.pop()
+        entry = (source or room).queue.pop()
+        med_key = f"{room.room_id}-{med_id}"
+        self.log_event(self._record(room, entry, med_key, self.now, None, False))
+        dur = self.service_time(entry[PAYLOAD]['urgencia'])
+        room.em_atendimento[med_id] = self.now + dur
+        self.schedule(self.now + dur, FIM_ATENDIMENTO, (room, med_id, entry, self.now))
+
+    def _on_end(self, room, med_id, entry, inicio):
+        med_key = f"{room.room_id}-{med_id}"
+        self.log_event(self._record(room, entry, med_key, inicio, self.now, False))
+        room.livres.append(med_id)
+        del room.em_atendimento[med_id]
+        if room.queue:
+            self._start(room)
+        elif self.scenario.roubo:
+            self._steal(room)
+
+    def _steal(self, room):
+        """Médico livre de `room` rouba o paciente mais prioritário das outras salas"""
+        best = None
+        for other in self.rooms:
+            head = other.queue.peek() if other is not room else None
+            if head is not None and (best is None or head[:2] < best[0]):
+                best = (head[:2], other)
+        if best is not None:
+            self._start(room, source=best[1])
+
+    def _on_deadline(self, room):
+        for entry in room.queue.expire(self.now):
+            self.log_event(self._record(room, entry, None, None, self.now, True))
+
+    def snapshot(self):
+        """Conteúdo equivalente ao logs.json de uma execução real"""
+        sc = self.scenario
+        data = {
+            'medicos_totais': sc.salas * sc.medicos,
+            'salas_totais': sc.salas,
+        }
+        if sc.total_surtos:
+            data['total_surtos'] = sc.total_surtos
+        for pid in sorted(self.records):
+            data[str(pid)] = self.records[pid]
+        return data
+
+
+def simulate(scenario, sink=None, start_epoch=None):
+    """Executa um cenário e devolve a Simulation terminada"""
+    sim = Simulation(scenario, sink=sink, start_epoch=start_epoch)
+    sim.run()
+    return sim
@@ -0,0 +1,56 @@
+"""
+Políticas de encaminhamento das chegadas para as salas.
+
+- round-robin: alterna as salas sem olhar para o seu estado (comportamento original);
+- jsq: join-shortest-queue, a sala com menos pacientes em espera (Room.size());
+- least-loaded: a sala com menos trabalho pendente por médico (tempo de atendimento
+  dos pacientes em espera mais o que falta aos atendimentos em curso).
+
+Funcionam tanto com Room (servidor real) como com VirtualRoom (motor de eventos).
+O roubo de pacientes por médicos livres é complementar e está na própria sala.
+"""
+import itertools
+
+
+class RoundRobin:
+    def __init__(self):
+        # next() sobre itertools.count é atómico: seguro entre threads
+        self._next = itertools.count()
+
+    def choose(self, rooms):
+        return rooms[next(self._next) % len(rooms)]
+
+
+class ShortestQueue:
+    def __init__(self):
+        self._next = itertools.count()
+
+    def choose(self, rooms):
+        # Empates desfeitos em rotação, para não favorecer sempre a sala 0
+        offset = next(self._next)
+        n = len(rooms)
+        return min(rooms, key=lambda r: (r.size(), (r.room_id - offset) % n))
+
+
+class LeastLoaded:
+    def __init__(self):
+        self._next = itertools.count()
+
+    def choose(self, rooms):
+        offset = next(self._next)
+        n = len(rooms)
+        return min(rooms, key=lambda r: (r.pending_work(), (r.room_id - offset) % n))
+
+
+POLITICAS = {
+    'round-robin': RoundRobin,
+    'jsq': ShortestQueue,
+    'least-loaded': LeastLoaded,
+}
+
+
+def make_policy(name):
+    try:
+        return POLITICAS[name]()
+    except KeyError:
+        raise ValueError(f"Política desconhecida: {name!r} (opções: {', '.join(POLITICAS)})")
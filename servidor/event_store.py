@@ -0,0 +1,145 @@
+"""
+Sink de eventos em base de dados (runurgencias --sink sqlite).
+
+Cada lote do LogWriter é gravado numa única transação como um upsert (INSERT ... ON
+CONFLICT(pid) DO UPDATE) na tabela RegistoPaciente, que guarda o estado mais recente de
+cada pid com índices em pid, room, nivel, chegada e saida. A ligação do sink põe a base
+em modo WAL (synchronous=NORMAL, transações IMMEDIATE), pelo que o dashboard e a API leem
+enquanto o servidor escreve; as restantes ligações do Django ficam com a configuração
+por omissão.
+"""
+import threading
+
+from django.db import DatabaseError, connection, models, transaction
+
+from servidor.models import RegistoPaciente
+
+# Executados na ligação que escreve (o journal_mode=WAL fica gravado na base)
+PRAGMAS = ('PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL')
+
+CAMPOS = ('seq', 'medico', 'room', 'nivel', 'chegada', 'inicio', 'saida',
+          'espera', 'duracao', 'desistencia', 'surto')
+
+
+def to_model(record, seq=0):
+    return RegistoPaciente(
+        pid=record['pid'],
+        seq=seq,
+        medico=record.get('medico'),
+        room=record.get('room'),
+        nivel=record.get('nivel') or '',
+        chegada=record.get('chegada') or '',
+        inicio=record.get('inicio'),
+        saida=record.get('saida'),
+        espera=record.get('espera'),
+        duracao=record.get('duracao'),
+        desistencia=bool(record.get('desistencia')),
+        surto=record.get('surto'),
+    )
+
+
+def to_record(obj):
+    """Registo no formato do logs.json a partir de uma linha (modelo ou dict de values())"""
+    get = obj.get if isinstance(obj, dict) else lambda k: getattr(obj, k)
+    record = {
+        'pid': get('pid'),
+        'medico': get('medico'),
+        'room': get('room'),
+        'chegada': get('chegada'),
+        'nivel': get('nivel'),
+        'inicio': get('inicio'),
+        'saida': get('saida'),
+        'espera': get('espera'),
+        'duracao': get('duracao'),
+        'desistencia': get('desistencia'),
+    }
+    if get('surto') is not None:
+        record['surto'] = get('surto')
+    return record
+
+
+class SqliteSink:
+    """Upsert por lote na tabela RegistoPaciente; cada execução começa com a tabela vazia"""
+
+    def __init__(self, limpar=True, batch_size=500):
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._seq = 0
+        # Ligação sqlite3 já configurada com PRAGMAS (muda se o Django religar)
+        self._preparada = None
+        if limpar:
+            RegistoPaciente.objects.all().delete()
+            # As ligações do Django são por thread: esta não volta a ser usada
+            connection.close()
+
+    def _preparar(self):
+        """Configura a ligação da thread que escreve (só ela usa WAL e BEGIN IMMEDIATE)"""
+        connection.ensure_connection()
+        if connection.connection is self._preparada:
+            return
+        with connection.cursor() as cursor:
+            for pragma in PRAGMAS:
+                cursor.execute(pragma)
+        # Lido pelo backend sqlite do Django ao abrir cada transação
+        connection.transaction_mode = 'IMMEDIATE'
+        self._preparada = connection.connection
+
+    def log_event(self, record):
+        self.write_batch((record,))
+
+    def write_batch(self, records):
+        with self._lock:
+            self._preparar()
+            # Um upsert não pode tocar duas vezes no mesmo pid: fica o estado mais recente
+            latest = {}
+            for record in records:
+                self._seq += 1
+                latest[record['pid']] = to_model(record, self._seq)
+            with transaction.atomic():
+                RegistoPaciente.objects.bulk_create(
+                    latest.values(),
+                    batch_size=self.batch_size,
+                    update_conflicts=True,
+                    unique_fields=['pid'],
+                    update_fields=CAMPOS,
+                )
+
+    def close(self):
+        """Fecha a ligação desta thread: chamar na thread que escreveu (LogWriter)"""
+        connection.close()
+
+
+def has_records():
+    """False também sem a tabela (migrações por aplicar): as views usam o logs.json"""
+    try:
+        return RegistoPaciente.objects.exists()
+    except DatabaseError:
+        return False
+
+
+def filas():
+    """Pacientes em espera por nível (índice registo_estado_idx)"""
+    contagem = {'verde': 0, 'amarelo': 0, 'vermelho': 0}
+    em_espera = RegistoPaciente.objects.filter(desistencia=False, saida__isnull=True)
+    for row in em_espera.values('nivel').annotate(n=models.Count('id')):
+        if row['nivel'] in contagem:
+            contagem[row['nivel']] = row['n']
+    return contagem
+
+
+def stats():
+    """Mesmo formato de GET /api/stats/, numa única agregação"""
+    s = RegistoPaciente.objects.aggregate(
+        total=models.Count('id'),
+        desistencias=models.Count('id', filter=models.Q(desistencia=True)),
+        atendidos=models.Count('id', filter=models.Q(desistencia=False, saida__isnull=False)),
+    )
+    s['esperando'] = s['total'] - (s['atendidos'] + s['desistencias'])
+    return {k: s[k] for k in ('atendidos', 'desistencias', 'total', 'esperando')}
+
+
+def iter_records(queryset=None, chunk_size=2000):
+    """Registos (formato logs.json) por ordem de pid, lidos em blocos"""
+    qs = RegistoPaciente.objects.all() if queryset is None else queryset
+    for row in qs.order_by('pid').values(*('pid',) + CAMPOS).iterator(chunk_size=chunk_size):
+        yield to_record(row)
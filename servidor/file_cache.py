@@ -0,0 +1,61 @@
+"""
+Cache de leitura para as respostas calculadas a partir de ficheiros (logs.json,
+estado.json, med_status.json).
+
+A validade de cada entrada é a assinatura (inode, tamanho, mtime) dos ficheiros de que
+depende: enquanto nenhum mudar, o valor guardado é devolvido sem reler nem reprocessar
+nada. A mesma assinatura dá o ETag usado pelo decorador `condition` do Django, pelo que
+um cliente com a versão atual recebe 304 sem corpo. Não há Last-Modified: os ficheiros
+mudam várias vezes por segundo e a resolução de 1 s do cabeçalho daria 304 errados.
+"""
+import hashlib
+import os
+import threading
+
+
+def file_signature(*paths):
+    """(inode, tamanho, mtime_ns) de cada ficheiro; None para os que não existem"""
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            signature.append(None)
+        else:
+            signature.append((st.st_ino, st.st_size, st.st_mtime_ns))
+    return tuple(signature)
+
+
+def etag(signature, *extra):
+    """ETag (sem aspas) de uma assinatura e de parâmetros que mudem a resposta"""
+    return hashlib.sha1(repr((signature, extra)).encode()).hexdigest()[:20]
+
+
+class FileCache:
+    """
+    Cache read-through: `get(key, paths, compute)` só chama `compute()` quando a
+    assinatura dos `paths` mudou desde o último cálculo para essa chave.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, paths, compute):
+        signature = file_signature(*paths)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                return entry[1]
+        value = compute()
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (signature, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,168 @@
+"""
+Servidor de chegadas baseado em asyncio (runurgencias --engine asyncio).
+
+Cada ligação é atendida por uma corrotina, pelo que milhares de chegadas simultâneas
+não ficam presas no backlog do kernel à espera de um accept sequencial. O protocolo é o
+mesmo do motor com threads: objetos JSON enquadrados pelo JsonFramer e resposta
+CHEGADA_RECEBIDA por mensagem. Ligações que abrem com {"protocolo": 2} passam ao
+protocolo v2 (lotes em JSON-lines com ack por lote).
+
+O registo das chegadas (on_arrival) corre num pequeno ThreadPoolExecutor e não no event
+loop: pode bloquear quando a fila do escritor de logs está cheia (backpressure) e pode
+iniciar atendimentos e pedidos de roubo, e nada disso deve parar o accept e a leitura das
+outras ligações. Cada ligação espera pelas suas chegadas, o que mantém a ordem e a
+backpressure por ligação.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from servidor.protocol import (
+    ACK_CHEGADA, MAX_LINE, RECV_SIZE, FrameError, JsonFramer,
+    handshake_reply, is_handshake, process_batch,
+)
+
+BACKLOG = 4096
+# Threads que executam on_arrival
+THREADS = 4
+# Período (s) da medição do atraso do event loop (com instrumentação)
+VIGIA = 0.1
+
+
+class AsyncIngestServer:
+    """
+    Aceita pacientes em paralelo e entrega cada mensagem a `on_arrival(payload)`, numa
+    das `threads` threads do executor. `on_arrival` é síncrona (log em fila + enqueue na
+    sala), tem de ser thread-safe e devolve False quando a mensagem não é uma chegada
+    válida, caso em que a ligação é fechada.
+    Com `inst` (servidor.instrumentacao) mede o atraso do event loop, que é o tempo que
+    uma nova ligação espera para ser aceite.
+    """
+
+    def __init__(self, host, port, on_arrival, log=None, inst=None, threads=THREADS):
+        self.host = host
+        self.port = port
+        self.on_arrival = on_arrival
+        self.threads = threads
+        self._executor = None
+        self.log = log or (lambda msg: None)
+        self.inst = inst
+        self.connections = 0
+        self.errors = 0
+
+    async def handle_client(self, reader, writer):
+        self.connections += 1
+        framer = JsonFramer()
+        try:
+            first = None
+            while first is None:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    return
+                messages = framer.feed(data, limit=1)
+                if messages:
+                    first = messages[0]
+            if is_handshake(first):
+                reply, version = handshake_reply(first)
+                writer.write(reply)
+                await writer.drain()
+                if version is not None:
+                    await self.handle_v2(reader, writer, framer.take_remaining())
+                return
+            await self.handle_v1(reader, writer, framer, first)
+        except FrameError as e:
+            self.errors += 1
+            self.log(f"Mensagem inválida de {writer.get_extra_info('peername')}: {e}")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.errors += 1
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def _arrivals(self, messages):
+        """Regista as mensagens até à primeira inválida; devolve quantas aceitou"""
+        accepted = 0
+        for pay in messages:
+            if not self.on_arrival(pay):
+                break
+            accepted += 1
+        return accepted
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def handle_v1(self, reader, writer, framer, first):
+        """Protocolo original: CHEGADA_RECEBIDA por objeto JSON"""
+        messages = [first] + framer.feed(b'')
+        while True:
+            accepted = await self._run(self._arrivals, messages)
+            if accepted < len(messages):
+                self.errors += 1
+            if accepted:
+                writer.write(ACK_CHEGADA * accepted)
+                await writer.drain()
+            if accepted < len(messages):
+                return
+            data = await reader.read(RECV_SIZE)
+            if not data:
+                return
+            messages = framer.feed(data)
+
+    async def handle_v2(self, reader, writer, pending):
+        """Protocolo v2: um lote por linha e um ack por lote"""
+        lines = pending.split(b'\n')
+        buffered, partial = lines[:-1], lines[-1]
+        for line in buffered:
+            if line.strip():
+                writer.write(await self._run(process_batch, line, self.on_arrival))
+        await writer.drain()
+        while True:
+            try:
+                line = await reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                # Último lote sem '\n' antes do EOF: também é processado e confirmado
+                line = partial + e.partial
+                if line.strip():
+                    writer.write(await self._run(process_batch, line, self.on_arrival))
+                    await writer.drain()
+                return
+            except asyncio.LimitOverrunError:
+                self.errors += 1
+                return
+            if partial:
+                line, partial = partial + line, b''
+            if line.strip():
+                writer.write(await self._run(process_batch, line, self.on_arrival))
+                # Só espera pelo socket quando o buffer de envio acumula
+                if writer.transport.get_write_buffer_size() > 64 * 1024:
+                    await writer.drain()
+
+    async def vigiar_loop(self, hist):
+        """Regista quanto cada sleep(VIGIA) acorda atrasado (event loop ocupado)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(VIGIA)
+            hist.observe(max(0.0, loop.time() - t0 - VIGIA))
+
+    async def serve_forever(self):
+        server = await asyncio.start_server(
+            self.handle_client, self.host, self.port,
+            backlog=BACKLOG, reuse_address=True, limit=MAX_LINE,
+        )
+        if self.inst is not None:
+            # Referência guardada para a tarefa não ser recolhida pelo GC
+            self._vigia = asyncio.create_task(
+                self.vigiar_loop(self.inst.accept.labels(engine='asyncio')))
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.threads,
+                                            thread_name_prefix='chegadas')
+        try:
+            asyncio.run(self.serve_forever())
+        finally:
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,324 @@
+"""
+Instrumentação do caminho crítico do servidor (runurgencias --metricas PORTA).
+
+Desligada por omissão: as Room, o LogWriter e o ciclo de accept recebem `inst=None`, os
+locks continuam a ser threading.Lock e não há nada a medir nem a agregar. Ligada:
+
+- cada Contador e Histograma guarda uma cópia por thread (threading.local), pelo que
+  observar um valor não usa locks nem perde incrementos; as cópias só são somadas quando
+  as métricas são lidas (e as das threads que terminaram são acumuladas e descartadas);
+- os locks medidos são TimedLock, que regista o tempo à espera de cada acquire;
+- os Medidores (ex.: profundidade das filas) são lidos das Room no momento da recolha.
+
+O processo expõe em http://HOST:PORTA/metrics o formato de texto do Prometheus e em
+/metrics.json o mesmo conteúdo em JSON. Os snapshots JSON somam-se com `juntar`: os
+processos de salas enviam o seu ao principal e o Django junta os de vários servidores
+em GET /metrics.
+"""
+import json
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from servidor import clock
+from servidor.constants import URGENCIA_PRIORIDADES
+
+# Limites (segundos) dos baldes: operações curtas (locks, I/O, accept) e esperas de pacientes
+LIMITES = (1e-06, 5e-06, 1e-05, 5e-05, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05,
+           0.1, 0.5, 1.0, 5.0)
+LIMITES_ESPERA = (0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 240.0, 600.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Intervalo (s) entre snapshots enviados pelos processos de salas
+INTERVALO = 1.0
+
+
+def nivel(urg):
+    """Rótulo do nível de urgência ('outro' para níveis desconhecidos)"""
+    return urg if urg in URGENCIA_PRIORIDADES else 'outro'
+
+
+class _PorThread:
+    """Valores com uma cópia por thread; `valores()` devolve a soma de todas"""
+
+    def __init__(self, tamanho):
+        self._tamanho = tamanho
+        self._local = threading.local()
+        self._copias = []
+        # Soma das cópias de threads que já terminaram
+        self._mortas = [0] * tamanho
+        # Só entre leitores (recolhas em paralelo); quem observa nunca o usa
+        self._leitura = threading.Lock()
+
+    def _copia(self):
+        copia = self._local.copia = [0] * self._tamanho
+        # list.append é atómico; a cópia só é escrita pela própria thread
+        self._copias.append((threading.current_thread(), copia))
+        return copia
+
+    def valores(self):
+        with self._leitura:
+            total = list(self._mortas)
+            for item in list(self._copias):
+                thread, copia = item
+                if not thread.is_alive():
+                    self._mortas = [a + b for a, b in zip(self._mortas, copia)]
+                    # list.remove é atómico: não perde cópias acrescentadas entretanto
+                    self._copias.remove(item)
+                total = [a + b for a, b in zip(total, copia)]
+            return total
+
+
+class Contador(_PorThread):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, n=1):
+        try:
+            copia = self._local.copia
+        except AttributeError:
+            copia = self._copia()
+        copia[0] += n
+
+    def valores(self):
+        return super().valores()[0]
+
+
+class Histograma(_PorThread):
+    """Contagens por balde (não cumulativas, a última é +Inf) seguidas da soma"""
+
+    def __init__(self, limites=LIMITES):
+        super().__init__(len(limites) + 2)
+        self.limites = limites
+
+    def observe(self, valor):
+        try:
+            copia = self._local.copia
+        except AttributeError:
+            copia = self._copia()
+        copia[bisect_left(self.limites, valor)] += 1
+        copia[-1] += valor
+
+
+class Medidor:
+    """Valor instantâneo, atualizado no momento da recolha"""
+
+    def __init__(self):
+        self.valor = 0
+
+    def set(self, valor):
+        self.valor = valor
+
+    def valores(self):
+        return self.valor
+
+
+class Familia:
+    """Métrica com rótulos: um filho (Contador, Histograma ou Medidor) por combinação"""
+
+    def __init__(self, nome, ajuda, tipo, fabrica, rotulos=(), limites=None):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.tipo = tipo
+        self.rotulos = rotulos
+        self.limites = limites
+        self._fabrica = fabrica
+        self._filhos = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **rotulos):
+        chave = tuple(str(rotulos.get(r, '')) for r in self.rotulos)
+        filho = self._filhos.get(chave)
+        if filho is None:
+            # Só na primeira utilização de cada combinação
+            with self._lock:
+                filho = self._filhos.setdefault(chave, self._fabrica())
+        return filho
+
+    def observe(self, valor):
+        self.labels().observe(valor)
+
+    def inc(self, n=1):
+        self.labels().inc(n)
+
+    def set(self, valor):
+        self.labels().set(valor)
+
+    def snapshot(self):
+        return {
+            'tipo': self.tipo,
+            'ajuda': self.ajuda,
+            'rotulos': list(self.rotulos),
+            'limites': None if self.limites is None else list(self.limites),
+            'series': [[list(chave), filho.valores()]
+                       for chave, filho in list(self._filhos.items())],
+        }
+
+
+class Instrumentos:
+    """Registo das métricas de um processo (e dos snapshots recebidos de outros)"""
+
+    def __init__(self):
+        self.familias = {}
+        self._recolhas = []
+        # Snapshots mais recentes de outros processos (ex.: processos de salas)
+        self.externos = {}
+
+        self.lock_espera = self.histograma(
+            'urgencias_lock_espera_segundos', "Tempo à espera de um lock (Room.cv e log_lock)",
+            ('lock', 'sala'))
+        self.fila = self.medidor(
+            'urgencias_fila_pacientes', "Pacientes em espera por sala e nível",
+            ('sala', 'nivel'))
+        self.espera = self.histograma(
+            'urgencias_espera_segundos', "Tempo entre a chegada e o início do atendimento",
+            ('sala', 'nivel'), LIMITES_ESPERA)
+        self.escrita = self.histograma(
+            'urgencias_escrita_segundos', "Duração de cada lote gravado pelo escritor de logs")
+        self.escrita_bloqueio = self.histograma(
+            'urgencias_escrita_bloqueio_segundos',
+            "Tempo bloqueado à espera de lugar na fila do escritor de logs")
+        self.escrita_fila = self.medidor(
+            'urgencias_escrita_fila', "Registos na fila do escritor de logs")
+        self.accept = self.histograma(
+            'urgencias_accept_segundos',
+            "Latência do ciclo de accept (threads: atendimento de cada ligação; "
+            "asyncio: atraso do event loop)", ('engine',))
+        self.chegada = self.histograma(
+            'urgencias_chegada_segundos', "Registo e encaminhamento de uma chegada")
+        self.chegadas = self.contador(
+            'urgencias_chegadas_total', "Mensagens de chegada recebidas", ('resultado',))
+
+    def _familia(self, nome, *args, **kwargs):
+        familia = self.familias[nome] = Familia(nome, *args, **kwargs)
+        return familia
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._familia(nome, ajuda, 'counter', Contador, rotulos)
+
+    def histograma(self, nome, ajuda, rotulos=(), limites=LIMITES):
+        return self._familia(nome, ajuda, 'histogram', lambda: Histograma(limites),
+                             rotulos, limites)
+
+    def medidor(self, nome, ajuda, rotulos=()):
+        return self._familia(nome, ajuda, 'gauge', Medidor, rotulos)
+
+    def ao_recolher(self, fn):
+        """`fn(inst)` é chamada antes de cada snapshot (para atualizar Medidores)"""
+        self._recolhas.append(fn)
+
+    def snapshot(self):
+        """Todas as métricas, deste processo e dos externos, num dict serializável"""
+        for fn in list(self._recolhas):
+            fn(self)
+        snap = {nome: familia.snapshot() for nome, familia in self.familias.items()}
+        for externo in list(self.externos.values()):
+            juntar(snap, externo)
+        return snap
+
+
+def juntar(destino, snap):
+    """Soma o snapshot `snap` em `destino` (séries com os mesmos rótulos somam-se)"""
+    for nome, familia in snap.items():
+        atual = destino.get(nome)
+        if atual is None:
+            destino[nome] = {**familia, 'series': [list(s) for s in familia['series']]}
+            continue
+        indice = {tuple(serie[0]): serie for serie in atual['series']}
+        for chave, valores in familia['series']:
+            serie = indice.get(tuple(chave))
+            if serie is None:
+                atual['series'].append([chave, valores])
+            elif isinstance(valores, list):
+                serie[1] = [a + b for a, b in zip(serie[1], valores)]
+            else:
+                serie[1] += valores
+    return destino
+
+
+def _rotulos(nomes, valores, extra=None):
+    pares = [(n, v) for n, v in zip(nomes, valores) if v != '']
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ''
+    esc = lambda v: str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')  # noqa: E731
+    return '{' + ','.join(f'{n}="{esc(v)}"' for n, v in pares) + '}'
+
+
+def texto(snap):
+    """Formato de texto do Prometheus (0.0.4) de um snapshot"""
+    linhas = []
+    for nome in sorted(snap):
+        familia = snap[nome]
+        linhas.append(f"# HELP {nome} {familia['ajuda']}")
+        linhas.append(f"# TYPE {nome} {familia['tipo']}")
+        rotulos = familia['rotulos']
+        for chave, valores in sorted(familia['series']):
+            if familia['tipo'] != 'histogram':
+                linhas.append(f"{nome}{_rotulos(rotulos, chave)} {valores}")
+                continue
+            acumulado = 0
+            for limite, n in zip([*familia['limites'], '+Inf'], valores[:-1]):
+                acumulado += n
+                le = limite if limite == '+Inf' else repr(float(limite))
+                linhas.append(f"{nome}_bucket{_rotulos(rotulos, chave, ('le', le))} {acumulado}")
+            linhas.append(f"{nome}_sum{_rotulos(rotulos, chave)} {valores[-1]}")
+            linhas.append(f"{nome}_count{_rotulos(rotulos, chave)} {acumulado}")
+    return '\n'.join(linhas) + '\n'
+
+
+class TimedLock:
+    """Lock que regista em `hist` o tempo à espera de cada acquire (0 sem contenção)"""
+
+    def __init__(self, hist, lock=None):
+        self._lock = lock or threading.Lock()
+        self._hist = hist
+        self.release = self._lock.release
+        self.locked = self._lock.locked
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            self._hist.observe(0.0)
+            return True
+        if not blocking:
+            return False
+        t0 = clock.now()
+        ok = self._lock.acquire(True, timeout)
+        self._hist.observe(clock.now() - t0)
+        return ok
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        caminho = self.path.split('?', 1)[0]
+        if caminho == '/metrics':
+            body = texto(self.server.inst.snapshot()).encode('utf-8')
+            tipo = CONTENT_TYPE
+        elif caminho == '/metrics.json':
+            body = json.dumps(self.server.inst.snapshot()).encode('utf-8')
+            tipo = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def servir(inst, host, port):
+    """Serve /metrics e /metrics.json numa thread; devolve o servidor (para shutdown)"""
+    httpd = ThreadingHTTPServer((host, port), _Handler)
+    httpd.daemon_threads = True
+    httpd.inst = inst
+    threading.Thread(target=httpd.serve_forever, name='metricas', daemon=True).start()
+    return httpd
@@ -0,0 +1,344 @@
+"""
+Destinos (sinks) dos eventos de pacientes.
+
+JsonFileSink mantém o comportamento original: relê e reescreve o logs.json inteiro a cada
+evento. JournalSink acrescenta cada evento a um diário append-only em JSON-lines
+(logs.jsonl), faz fsync em lote e produz periodicamente um snapshot compactado em
+logs.json com o estado mais recente de cada pid, pelo que cada evento custa O(1). O
+snapshot é mantido em memória (só é relido se outro processo alterar o ficheiro) e a
+reescrita, que custa O(pids), é espaçada de forma a ocupar no máximo 1/COMPACT_RATIO do
+tempo de uma thread.
+
+O diário abre com uma linha de cabeçalho {"diario": 1, "execucao": <id>, ...} e cada
+evento leva um número de sequência `seq` crescente, atribuído pela ordem de escrita.
+read_changes usa-os para devolver só os eventos acrescentados depois de um cursor.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+
+from servidor import clock
+from servidor.file_cache import file_signature
+
+LOG_FILE = 'logs.json'
+JOURNAL_FILE = 'logs.jsonl'
+JOURNAL_VERSION = 1
+# A compactação espera pelo menos COMPACT_RATIO vezes o que demorou a anterior
+COMPACT_RATIO = 10
+
+
+def read_snapshot(path=LOG_FILE):
+    """Lê o snapshot logs.json; devolve {} se não existir ou estiver corrompido"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def iter_snapshot(path=LOG_FILE):
+    """
+    Percorre o snapshot entrada a entrada, devolvendo pares (chave, valor) sem carregar
+    o ficheiro inteiro. Funciona no formato de write_snapshot (uma entrada por linha);
+    ficheiros noutro formato (ex.: o indent=2 do JsonFileSink) são lidos por inteiro.
+    Um ficheiro inexistente não produz entradas.
+    """
+    for key, value, _ in iter_snapshot_offsets(path):
+        yield key, value
+
+
+def iter_snapshot_offsets(path=LOG_FILE, offset=None):
+    """
+    Como iter_snapshot, mas devolve (chave, valor, offset), com o offset em bytes do
+    início da linha de cada entrada. Com `offset` (um offset devolvido antes) começa
+    nessa linha, com um seek; se não for o início de uma entrada começa do princípio.
+    Noutros formatos que não o de write_snapshot os offsets são None.
+    """
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        first = f.readline()
+        pos = f.tell()
+        second = f.readline()
+        if first.strip() != b'{' or not (second.startswith(b'"') or second.startswith(b'}')):
+            f.seek(0)
+            try:
+                data = json.load(f)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                return
+            for key, value in data.items():
+                yield key, value, None
+            return
+        line = second
+        if offset is not None and offset > pos:
+            # Só retoma em fronteiras de linha (o ficheiro pode ter sido reescrito)
+            f.seek(offset - 1)
+            if f.read(1) == b'\n':
+                retomada = f.readline()
+                if retomada.startswith(b'"'):
+                    line, pos = retomada, offset
+        # Cada linha é '"chave": valor' (com ',' no fim, exceto a última)
+        decode = json.JSONDecoder().raw_decode
+        while line and not line.startswith(b'}'):
+            text = line.decode('utf-8')
+            key, end = decode(text)
+            value, _ = decode(text, end + 2)
+            yield key, value, pos
+            pos += len(line)
+            line = f.readline()
+
+
+def write_snapshot(path, data):
+    """
+    Grava o snapshot de forma atómica (ficheiro temporário + os.replace).
+    Cada entrada ocupa uma linha, o que mantém o JSON válido sem a indentação
+    que ocupava a maior parte do ficheiro.
+    """
+    os.replace(_write_tmp(path, data), path)
+
+
+def _write_tmp(path, data):
+    """Escreve o snapshot num ficheiro temporário ao lado de `path` e devolve o seu caminho"""
+    # Um temporário por processo: o simulate_multi_salas também grava o logs.json
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write('{')
+        sep = '\n'
+        for key, value in data.items():
+            f.write(sep)
+            f.write(json.dumps(str(key), ensure_ascii=False))
+            f.write(': ')
+            f.write(json.dumps(value, ensure_ascii=False))
+            sep = ',\n'
+        f.write('\n}\n')
+    return tmp
+
+
+class JsonFileSink:
+    """Reescreve o logs.json completo a cada evento (comportamento original)"""
+
+    def __init__(self, path=LOG_FILE, lock=None):
+        self.path = path
+        self.lock = lock or threading.Lock()
+
+    def log_event(self, record):
+        self.write_batch((record,))
+
+    def write_batch(self, records):
+        with self.lock:
+            data = read_snapshot(self.path)
+            for record in records:
+                data[str(record['pid'])] = record
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def close(self):
+        pass
+
+
+class JournalSink:
+    """
+    Diário append-only com fsync em lote e compactação periódica.
+
+    - Cada evento é uma linha JSON acrescentada a `journal_path`, com o campo `seq`;
+      a primeira linha identifica a execução (`run_id`).
+    - O fsync é feito a cada `fsync_every` eventos ou `fsync_interval` segundos.
+    - Uma thread de compactação junta, a cada `compact_interval` segundos (ou mais,
+      quando o snapshot é grande: ver COMPACT_RATIO), o estado mais recente de cada pid
+      ao snapshot `snapshot_path` (logs.json), lido pelo dashboard e pela API.
+    """
+
+    def __init__(self, journal_path=JOURNAL_FILE, snapshot_path=LOG_FILE,
+                 fsync_every=256, fsync_interval=1.0, compact_interval=1.0):
+        self.journal_path = journal_path
+        self.snapshot_path = snapshot_path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_interval = compact_interval
+
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        # Cada execução do servidor começa um diário novo, identificado por run_id
+        self.run_id = uuid.uuid4().hex
+        self._seq = 0
+        self._file = open(journal_path, 'w', encoding='utf-8')
+        self._file.write(json.dumps({
+            'diario': JOURNAL_VERSION,
+            'execucao': self.run_id,
+            'inicio': clock.iso_now(),
+        }) + '\n')
+        self._file.flush()
+        self._pending_sync = 0
+        self._last_sync = time.monotonic()
+        # Estado mais recente por pid ainda não compactado no snapshot
+        self._dirty = {}
+        # Conteúdo do snapshot em memória e assinatura do ficheiro que lhe corresponde
+        self._snapshot = None
+        self._snapshot_sig = None
+        self._next_compact = 0.0
+        self._closed = threading.Event()
+
+        t = threading.Thread(target=self._compact_worker, daemon=True)
+        t.start()
+
+    def log_event(self, record):
+        self.write_batch((record,))
+
+    def write_batch(self, records):
+        with self._lock:
+            lines = []
+            for record in records:
+                self._seq += 1
+                record = {**record, 'seq': self._seq}
+                lines.append(json.dumps(record, ensure_ascii=False) + '\n')
+                self._dirty[str(record['pid'])] = record
+            self._file.write(''.join(lines))
+            # Visível para quem segue o diário já neste lote; o fsync continua agrupado
+            self._file.flush()
+            self._pending_sync += len(records)
+            now = time.monotonic()
+            if (self._pending_sync >= self.fsync_every
+                    or now - self._last_sync >= self.fsync_interval):
+                self._sync(now)
+
+    def _sync(self, now=None):
+        """Despeja o buffer e faz fsync (chamar com self._lock adquirido)"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending_sync = 0
+        self._last_sync = now if now is not None else time.monotonic()
+
+    def compact(self):
+        """Junta os eventos pendentes ao snapshot logs.json"""
+        with self._compact_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                if self._pending_sync:
+                    self._sync()
+            if not dirty:
+                return
+            t0 = time.monotonic()
+            while True:
+                # Só relê o snapshot se outro processo o alterou (ex.: metadados gravados
+                # pelo simulate_multi_salas); caso contrário usa a cópia em memória
+                sig = file_signature(self.snapshot_path)
+                if self._snapshot is None or sig != self._snapshot_sig:
+                    self._snapshot = read_snapshot(self.snapshot_path)
+                self._snapshot.update(dirty)
+                tmp = _write_tmp(self.snapshot_path, self._snapshot)
+                # Alterado durante a escrita: relê para não apagar as chaves do outro
+                # processo (resta a janela entre esta verificação e o replace)
+                if file_signature(self.snapshot_path) != sig:
+                    self._snapshot_sig = None
+                    continue
+                # os.replace mantém inode e mtime: é a assinatura que logs.json vai ter
+                self._snapshot_sig = file_signature(tmp)
+                os.replace(tmp, self.snapshot_path)
+                break
+            elapsed = time.monotonic() - t0
+            self._next_compact = time.monotonic() + max(self.compact_interval,
+                                                        COMPACT_RATIO * elapsed)
+
+    def _compact_worker(self):
+        while not self._closed.wait(self.compact_interval):
+            if time.monotonic() >= self._next_compact:
+                self.compact()
+
+    def close(self):
+        self._closed.set()
+        self.compact()
+        with self._lock:
+            self._file.close()
+
+
+def read_journal_header(path=JOURNAL_FILE):
+    """Cabeçalho do diário (dict) e tamanho em bytes da sua linha; None se não existir"""
+    try:
+        with open(path, 'rb') as f:
+            line = f.readline()
+    except FileNotFoundError:
+        return None
+    if not line.endswith(b'\n'):
+        return None
+    try:
+        header = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(header, dict) or 'execucao' not in header:
+        return None
+    return header, len(line)
+
+
+def format_cursor(run_id, seq, offset):
+    return f"{run_id}.{seq}.{offset}"
+
+
+def parse_cursor(cursor):
+    """(execução, seq, offset) de um cursor de read_changes; ValueError se inválido"""
+    run_id, seq, offset = cursor.split('.')
+    return run_id, int(seq), int(offset)
+
+
+def read_changes(path=JOURNAL_FILE, cursor=None, limit=1000):
+    """
+    Eventos do diário acrescentados depois de `cursor` (todos, se None).
+
+    O cursor guarda a execução, o último seq entregue e o offset em bytes a seguir a
+    esse evento, pelo que retomar custa um seek. Se a execução mudou (o servidor
+    reiniciou e começou um diário novo) a leitura recomeça do início.
+    Devolve (eventos, cursor seguinte, execução, reiniciado) ou None sem diário.
+    """
+    found = read_journal_header(path)
+    if found is None:
+        return None
+    header, offset = found
+    run_id = header['execucao']
+    seq = 0
+    reiniciado = False
+    if cursor is not None:
+        c_run, c_seq, c_offset = parse_cursor(cursor)
+        if c_run == run_id:
+            seq, offset = c_seq, max(c_offset, offset)
+        else:
+            reiniciado = True
+    events = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while len(events) < limit:
+            line = f.readline()
+            # Linha ainda a meio de ser escrita: fica para a próxima leitura
+            if not line.endswith(b'\n'):
+                break
+            record = json.loads(line)
+            offset += len(line)
+            if record.get('seq', 0) <= seq:
+                continue
+            events.append(record)
+            seq = record['seq']
+    return events, format_cursor(run_id, seq, offset), run_id, reiniciado
+
+
+def _sqlite_sink(**kwargs):
+    # Importado só quando usado: precisa do Django configurado (runurgencias)
+    from servidor.event_store import SqliteSink
+    return SqliteSink(**kwargs)
+
+
+SINKS = {
+    'journal': JournalSink,
+    'json': JsonFileSink,
+    'sqlite': _sqlite_sink,
+}
+
+
+def make_sink(name, **kwargs):
+    """Instancia o sink pelo nome usado na opção --sink do runurgencias"""
+    try:
+        cls = SINKS[name]
+    except KeyError:
+        raise ValueError(f"Sink desconhecido: {name!r} (opções: {', '.join(SINKS)})")
+    return cls(**kwargs)
@@ -0,0 +1,152 @@
+"""
+Estado ao vivo da simulação, mantido incrementalmente.
+
+O LogWriter aplica cada registo e cada atualização de médico ao LiveState (O(1) por
+evento) e publica após cada lote um snapshot pequeno em estado.json: filas por nível,
+contadores de atendidos/desistências/espera e ocupação dos médicos, já no formato das
+respostas do dashboard, e os percentis/débitos de servidor.metricas. As views leem esse
+ficheiro em vez de reprocessar o logs.json.
+"""
+import json
+import os
+import time
+
+from servidor import clock
+from servidor.constants import URGENCIA_PRIORIDADES
+from servidor.metricas import RunMetrics
+
+STATE_FILE = 'estado.json'
+
+# Estado de cada pid (o mais recente, como no logs.json)
+FILA, ATENDIDO, DESISTENCIA = range(3)
+
+
+def resumo_medicos(medicos, salas_totais):
+    """Mesmo formato da resposta de GET /api/medicos/"""
+    lista = []
+    ocupados = 0
+    salas_ocupadas = set()
+    for med_key, v in medicos.items():
+        ocupado = bool(v.get('ocupado'))
+        if ocupado:
+            ocupados += 1
+            salas_ocupadas.add(v.get('room'))
+        lista.append({
+            'id': med_key,
+            'sala': v.get('room') if ocupado else None,
+            # None: estado desconhecido (slot a meio de uma escrita interrompida)
+            'ocupado': None if v.get('ocupado') is None else ocupado,
+        })
+    return {
+        'medicos': lista,
+        'medicos_totais': len(medicos),
+        'medicos_livres': len(medicos) - ocupados,
+        'medicos_ocupados': ocupados,
+        'salas_totais': salas_totais,
+        'salas_livres': max(0, salas_totais - len(salas_ocupadas)),
+        'salas_ocupadas': len(salas_ocupadas),
+    }
+
+
+class LiveState:
+    """
+    Contadores de uma execução. Com `ao_vivo` (servidor a correr) os débitos das métricas
+    terminam no instante da publicação; sem ele, no último evento (execução terminada).
+    """
+
+    def __init__(self, salas_totais=0, medicos=None, slots=None, ao_vivo=False):
+        self.salas_totais = salas_totais
+        self.ao_vivo = ao_vivo
+        self.medicos = dict(medicos or {})
+        # Com slots (servidor.med_slots) o estado dos médicos é lido de lá ao publicar
+        self.slots = slots
+        self.filas = {nivel: 0 for nivel in reversed(list(URGENCIA_PRIORIDADES))}
+        self.atendidos = 0
+        self.desistencias = 0
+        self._pids = {}
+        self.metricas = RunMetrics()
+        self.publicacoes = 0
+
+    def apply(self, record):
+        """Atualiza os contadores com o estado mais recente de um pid"""
+        pid = str(record['pid'])
+        if record.get('desistencia'):
+            novo = DESISTENCIA
+        elif record.get('saida') is not None:
+            novo = ATENDIDO
+        else:
+            novo = FILA
+        nivel = record.get('nivel')
+        anterior = self._pids.get(pid)
+        if anterior is not None:
+            self._count(*anterior, -1)
+        self._pids[pid] = (novo, nivel)
+        self._count(novo, nivel, 1)
+        self.metricas.apply(record)
+
+    def _count(self, estado, nivel, delta):
+        if estado == FILA:
+            if nivel in self.filas:
+                self.filas[nivel] += delta
+        elif estado == ATENDIDO:
+            self.atendidos += delta
+        else:
+            self.desistencias += delta
+
+    def update_medico(self, med_key, value):
+        self.medicos[med_key] = value
+
+    def stats(self):
+        total = len(self._pids)
+        return {
+            'atendidos': self.atendidos,
+            'desistencias': self.desistencias,
+            'total': total,
+            'esperando': total - (self.atendidos + self.desistencias),
+        }
+
+    def terminar(self):
+        """
+        Execução terminada: os médicos ficam livres (já ninguém está a ser atendido), os
+        slots deixam de ser lidos e os débitos passam a terminar no último evento
+        """
+        if self.slots is not None:
+            self.medicos = self.slots.snapshot()
+            self.slots = None
+        self.medicos = {med_key: {'room': None, 'ocupado': False} for med_key in self.medicos}
+        self.ao_vivo = False
+
+    def medicos_resumo(self):
+        """Mesmo formato da resposta de GET /api/medicos/"""
+        if self.slots is not None:
+            self.medicos = self.slots.snapshot()
+        return resumo_medicos(self.medicos, self.salas_totais)
+
+    def snapshot(self):
+        self.publicacoes += 1
+        return {
+            'versao': self.publicacoes,
+            'atualizado': clock.iso_now(),
+            # False no estado final (servidor parado ou simulação por eventos discretos)
+            'ao_vivo': self.ao_vivo,
+            'filas': dict(self.filas),
+            'stats': self.stats(),
+            'medicos': self.medicos_resumo(),
+            'metricas': self.metricas.resumo(time.time() if self.ao_vivo else None),
+        }
+
+    def publish(self, path=STATE_FILE):
+        """Grava o snapshot de forma atómica (leitores nunca veem um ficheiro a meio)"""
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+
+def read_state(path=STATE_FILE):
+    """Lê o estado publicado; None se não existir (ex.: servidor nunca arrancou)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
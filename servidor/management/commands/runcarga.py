@@ -0,0 +1,120 @@
+"""
+Gerador de carga em malha aberta para o servidor de urgências.
+
+Envia chegadas a um ritmo fixo (Poisson, constante ou repetição de um registo),
+independentemente das confirmações, e mede o débito alcançado, a latência dos acks e os
+erros. Com várias taxas (--taxa 200,400,800) corre um passo por taxa e indica a partir
+de qual o servidor satura.
+"""
+import asyncio
+import json
+
+from django.core.management import BaseCommand, CommandError
+
+from servidor.carga import ARRIVALS, LoadGenerator, calendario
+from servidor.des import parse_mix
+from servidor.protocol import PROTOCOLOS
+
+
+class Command(BaseCommand):
+    help = 'Gera carga em malha aberta (Poisson, constante ou trace) contra o runurgencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=9000)
+        parser.add_argument('--chegadas', choices=ARRIVALS, default='poisson',
+                            help='Processo de chegadas: poisson, constante ou trace '
+                                 '(repete --trace)')
+        parser.add_argument('--taxa', default='100',
+                            help='Chegadas/s; uma lista (ex.: 100,200,400) corre um '
+                                 'passo por taxa')
+        parser.add_argument('--duracao', type=float, default=10.0,
+                            help='Duração de cada passo (segundos)')
+        parser.add_argument('--pacientes', type=int, default=None,
+                            help='Nº máximo de chegadas por passo')
+        parser.add_argument('--trace', default=None,
+                            help='logs.json ou ficheiro com uma chegada por linha '
+                                 '(segundos[,nivel]) para --chegadas trace')
+        parser.add_argument('--velocidade', type=float, default=1.0,
+                            help='Fator de aceleração da repetição do trace')
+        parser.add_argument('--mix', default='vermelho=1,amarelo=1,verde=1',
+                            help='Pesos dos níveis de urgência (ex.: vermelho=1,verde=3)')
+        parser.add_argument('--ligacoes', type=int, default=8,
+                            help='Ligações persistentes (protocolo 2) ou máximo de '
+                                 'ligações abertas (protocolo 1)')
+        parser.add_argument('--protocolo', type=int, choices=PROTOCOLOS, default=2,
+                            help='2: ligações reutilizadas com lotes; 1: uma ligação '
+                                 'por paciente')
+        parser.add_argument('--timeout', type=float, default=10.0,
+                            help='Tempo máximo (s) à espera de ligação ou de ack')
+        parser.add_argument('--pausa', type=float, default=1.0,
+                            help='Pausa entre passos (segundos)')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--saida', default=None,
+                            help='Grava os resultados de todos os passos neste JSON')
+
+    def handle(self, *args, **opts):
+        try:
+            mix = parse_mix(opts['mix'])
+            taxas = [float(t) for t in opts['taxa'].split(',') if t]
+        except ValueError as e:
+            raise CommandError(str(e))
+        if opts['chegadas'] == 'trace':
+            if not opts['trace']:
+                raise CommandError('--chegadas trace precisa de --trace')
+            taxas = [None]
+        elif not taxas or min(taxas) <= 0:
+            raise CommandError('--taxa deve ser positiva')
+
+        gerador = LoadGenerator(
+            opts['host'], opts['port'], ligacoes=opts['ligacoes'],
+            protocolo=opts['protocolo'], mix=mix, seed=opts['seed'],
+            timeout=opts['timeout'],
+        )
+        resultados = asyncio.run(self.run_steps(gerador, taxas, opts))
+
+        saturados = [r['taxa_pedida'] for r in resultados if r['saturado']]
+        if len(resultados) > 1:
+            if saturados:
+                self.stdout.write(f"Saturação a partir de {saturados[0]:g} chegadas/s")
+            else:
+                self.stdout.write('Sem saturação nas taxas testadas')
+        if opts['saida']:
+            with open(opts['saida'], 'w', encoding='utf-8') as f:
+                json.dump(resultados, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Resultados gravados em {opts['saida']}")
+
+    async def run_steps(self, gerador, taxas, opts):
+        resultados = []
+        for i, taxa in enumerate(taxas):
+            if i:
+                await asyncio.sleep(opts['pausa'])
+            chegadas = calendario(
+                opts['chegadas'], taxa=taxa,
+                duracao=None if opts['chegadas'] == 'trace' else opts['duracao'],
+                pacientes=opts['pacientes'], trace_path=opts['trace'],
+                velocidade=opts['velocidade'],
+                seed=None if opts['seed'] is None else opts['seed'] + i,
+            )
+            resumo = (await gerador.run(chegadas, taxa=taxa)).resumo()
+            resultados.append(resumo)
+            self.report(resumo)
+        return resultados
+
+    def report(self, r):
+        lat = r['latencia_ms']
+
+        def ms(v):
+            return '-' if v is None else f"{v:.1f}"
+
+        pedida = '-' if r['taxa_pedida'] is None else f"{r['taxa_pedida']:g}"
+        erros = sum(r['erros'].values())
+        self.stdout.write(
+            f"taxa {pedida}/s: enviados {r['enviados']} ({r['taxa_enviada']:.0f}/s), "
+            f"confirmados {r['confirmados']} ({r['taxa_confirmada']:.0f}/s), "
+            f"rejeitados {r['rejeitados']}, erros {erros} | ack ms p50 {ms(lat['p50'])} "
+            f"p90 {ms(lat['p90'])} p99 {ms(lat['p99'])} max {ms(lat['max'])}"
+            + (' [saturado]' if r['saturado'] else '')
+        )
+        if r['erros']:
+            self.stdout.write(f"  erros: {r['erros']}")
@@ -2,6 +2,7 @@
 Servidor paciente TCP que chega de forma  autónoma.
 A cada execução o cliente espera um intervalo aleatório, ligando ao servidor de urgências,
 Envia PID, timestamp e nível de urgência, aguarda a confirmação e termina.
+Com --lote, o surto é enviado numa única ligação persistente (protocolo v2), em lotes.
 """
 import json
 import os
@@ -13,6 +14,8 @@ import time
 import random
 from django.core.management import BaseCommand
 
+from servidor.cliente import PatientConnection, ProtocolError
+
 
 class Command(BaseCommand):
     """
@@ -47,6 +50,11 @@ class Command(BaseCommand):
             '--surto', type=int, default=0,
             help='Número de clientes para disparar o surto'
         )
+        parser.add_argument(
+            '--lote', type=int, default=0,
+            help='Envia o surto numa ligação persistente em lotes deste tamanho '
+                 '(0 = uma ligação por paciente)'
+        )
 
     def handle(self, *args, **options):
         host = options['host']
@@ -55,6 +63,7 @@ class Command(BaseCommand):
         max_wait = options['max_wait']
         urgencia = options['urgencia']
         surto = options['surto']
+        lote = options['lote']
 
         def send_pacient():
             pid = threading.get_ident()
@@ -70,7 +79,35 @@ class Command(BaseCommand):
             except ConnectionRefusedError:
                 print(f"[{pid}] Não conseguiu conectar em {host}:{port}")
 
-        if surto:
+        def send_batched():
+            wait = random.uniform(min_wait, max_wait)
+            time.sleep(wait)
+            base = os.getpid() << 20
+            pacientes = (
+                {'pid': base + i, 'timestamp': datetime.utcnow().isoformat() + 'Z',
+                 'urgência': urgencia}
+                for i in range(max(surto, 1))
+            )
+            t0 = time.monotonic()
+            try:
+                with PatientConnection(host, port) as conn:
+                    acks = conn.send_many(pacientes, batch_size=lote)
+            except ConnectionRefusedError:
+                print(f"Não conseguiu conectar em {host}:{port}")
+                return
+            except ProtocolError as e:
+                print(f"Erro de protocolo: {e}")
+                return
+            elapsed = time.monotonic() - t0
+            recebidos = sum(a.get('recebidos', 0) for a in acks)
+            print(
+                f"Esperou {wait:.2f}s -> {recebidos} chegadas confirmadas em "
+                f"{len(acks)} lotes ({recebidos / elapsed if elapsed else 0:.0f}/s)"
+            )
+
+        if lote:
+            send_batched()
+        elif surto:
             threads = []
             for _ in range(surto):
                 t = threading.Thread(target=send_pacient)
@@ -1,27 +1,33 @@
+import logging
 import os
+import signal
 import socket
+import sys
 import threading
-import time
 from django.core.management.base import BaseCommand
-import heapq
-import json
-from datetime import datetime
 
-from servidor.rooms import Room
-from servidor.constants import (
-    URGENCIA_PRIORIDADES,
-    TEMPOS_ATENDIMENTO,
-    TIMEOUTS,
-    MAX_PACIENTES
+from servidor import clock
+from servidor.dispatch import POLITICAS, make_policy
+from servidor.ingest import AsyncIngestServer
+from servidor.instrumentacao import Instrumentos, TimedLock, servir
+from servidor.journal import SINKS, make_sink
+from servidor.med_slots import SLOTS_FILE, MedSlots
+from servidor.protocol import (
+    ACK_CHEGADA, FrameError, JsonFramer, handshake_reply, is_handshake,
+    recv_message, serve_v2_socket,
 )
+from servidor.rooms import Room
+from servidor.scheduler import THREADS, Scheduler
+from servidor.shards import ShardSet
+from servidor.writer import LogWriter
 
 MED_STATUS_FILE = 'med_status.json'
 LOG_FILE = 'logs.json'
 
 """
-Iniciar servidor TCP de urgências 
+Iniciar servidor TCP de urgências
 
-Criação do socket TCP, faz bind numa interface e porta configuráveis, 
+Criação do socket TCP, faz bind numa interface e porta configuráveis,
 escuta conexões de pacientes (processos clientes) e envia a confirmação de chegada
 """
 
@@ -36,51 +42,197 @@ class Command(BaseCommand):
                             help='Número de salas independentes')
         parser.add_argument('--medicos', type=int, default=1,
                             help='Número de médicos por sala')
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Lock único para todas as escritas em logs.json
-        self._log_lock = threading.Lock()
+        parser.add_argument('--sink', choices=sorted(SINKS), default='journal',
+                            help='Destino dos eventos: diário append-only (journal), '
+                                 'reescrita integral do logs.json (json) ou tabela '
+                                 'indexada na base de dados (sqlite)')
+        parser.add_argument('--limpar', action='store_true',
+                            help='Com --sink sqlite, apaga o logs.json de execuções '
+                                 'anteriores para o dashboard e a API lerem a base de dados')
+        parser.add_argument('--fila-escrita', type=int, default=10000,
+                            help='Capacidade da fila do escritor de logs')
+        parser.add_argument('--lote', type=int, default=256,
+                            help='Nº máximo de registos por escrita em disco')
+        parser.add_argument('--lote-ms', type=float, default=50,
+                            help='Tempo máximo (ms) que um registo espera pela escrita')
+        parser.add_argument('--engine', choices=['threads', 'asyncio'], default='threads',
+                            help='Ciclo de accept sequencial (threads) ou asyncio para '
+                                 'milhares de chegadas simultâneas')
+        parser.add_argument('--politica', choices=list(POLITICAS), default='round-robin',
+                            help='Escolha da sala: round-robin, fila mais curta (jsq) '
+                                 'ou menor trabalho pendente (least-loaded)')
+        parser.add_argument('--roubo', action='store_true',
+                            help='Médicos livres atendem o paciente mais prioritário '
+                                 'de outras salas')
+        parser.add_argument('--processos', type=int, default=1,
+                            help='Reparte as salas por N processos (um GIL por processo); '
+                                 'com --roubo só se rouba entre salas do mesmo processo')
+        parser.add_argument('--threads-medicos', type=int, default=THREADS,
+                            help='Threads que executam os fins de atendimento e as '
+                                 'desistências de todas as salas (por processo)')
+        parser.add_argument('--metricas', type=int, default=None, metavar='PORTA',
+                            help='Expõe métricas Prometheus em http://HOST:PORTA/metrics '
+                                 '(desligadas por omissão, sem custo)')
 
     def log_event(self, record):
-        """Grava um registo em logs.json."""
-        with self._log_lock:
-            try:
-                with open(LOG_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                data = {}
-            data[str(record['pid'])] = record
-            with open(LOG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+        """Entrega um registo ao escritor de logs (gravado em background)."""
+        self.writer.log_event(record)
+
+    def registar_chegada(self, pay):
+        """
+        Regista a chegada de um paciente e coloca-o numa sala.
+        Devolve False se a mensagem não for uma chegada válida.
+        """
+        if not isinstance(pay, dict) or 'pid' not in pay or 'timestamp' not in pay:
+            return False
+        recebido = clock.now()
+        pid = pay['pid']
+        urg = pay.get('urgencia') or pay.get('urgência')
+        ts = pay['timestamp']
+
+        # Log de chegada
+        chegada = {
+            "pid": pid,
+            "medico": None,
+            "room": None,
+            "chegada": ts,
+            "nivel": urg,
+            "inicio": None,
+            "saida": None,
+            "espera": None,
+            "duracao": None,
+            "desistencia": False
+        }
+        # Surto do simulate_multi_salas: fica em todos os registos do paciente
+        if pay.get('surto') is not None:
+            chegada["surto"] = pay['surto']
+        self.log_event(chegada)
+
+        # Escolhe a sala pela política configurada e enfileira
+        self.politica.choose(self.rooms).enqueue(pid, ts, pay, chegada=recebido)
+        return True
+
+    def registar_chegada_medida(self, pay):
+        """registar_chegada com a duração e o resultado registados nas métricas"""
+        t0 = clock.now()
+        ok = self.registar_chegada(pay)
+        self.inst.chegada.observe(clock.now() - t0)
+        self.inst.chegadas.labels(resultado='aceite' if ok else 'rejeitada').inc()
+        return ok
 
     def handle(self, *args, **opts):
         host = opts['host']
         port = opts['port']
         n_salas = opts['salas']
         n_medicos = opts['medicos']
+        if opts['verbosity'] >= 2:
+            # -v 2: uma linha por atendimento terminado (escrita síncrona por paciente)
+            rooms_log = logging.getLogger('servidor.rooms')
+            rooms_log.setLevel(logging.DEBUG)
+            rooms_log.addHandler(logging.StreamHandler(sys.stdout))
+        # Instrumentação só quando pedida; sem ela nada é medido nem trocado
+        self.inst = Instrumentos() if opts['metricas'] is not None else None
+        self.on_arrival = self.registar_chegada
+        if self.inst is not None:
+            self.on_arrival = self.registar_chegada_medida
+        if opts['sink'] == 'json':
+            # Lock único para todas as escritas em logs.json
+            log_lock = threading.Lock()
+            if self.inst is not None:
+                log_lock = TimedLock(self.inst.lock_espera.labels(lock='log'))
+            sink = make_sink('json', path=LOG_FILE, lock=log_lock)
+        elif opts['sink'] == 'sqlite':
+            sink = make_sink('sqlite')
+            # Sem logs.json as views e a API passam a consultar a base de dados; o
+            # histórico de execuções anteriores só é apagado quando pedido
+            if os.path.exists(LOG_FILE):
+                if opts['limpar']:
+                    os.remove(LOG_FILE)
+                else:
+                    self.stderr.write(
+                        f"Aviso: {LOG_FILE} existe e continua a ser lido pelo dashboard e "
+                        f"pela API; use --limpar para o apagar e ler a base de dados."
+                    )
+        else:
+            sink = make_sink('journal', snapshot_path=LOG_FILE)
 
-        # Limpa med_status.json de execuções anteriores
+        # Limpa med_status.json de execuções anteriores (o estado está nos slots)
         if os.path.exists(MED_STATUS_FILE):
             os.remove(MED_STATUS_FILE)
 
-        # Recria med_status.json com todos os médicos (ocupado=False)
-        initial = {
-            f"{room_id}-{med_id}": {'room': room_id, 'ocupado': False}
-            for room_id in range(n_salas)
-            for med_id in range(1, n_medicos + 1)
-        }
-        with open(MED_STATUS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(initial, f, ensure_ascii=False, indent=2)
+        # Um slot por médico em memória partilhada: cada médico atualiza o seu sem lock
+        self.slots = MedSlots.create(SLOTS_FILE, n_salas, n_medicos)
 
-        # Instancia as Room e inicia threads de médicos e purge
-        self.rooms = [
-            Room(room_id=i, num_medicos=n_medicos, log_lock=self._log_lock)
-            for i in range(n_salas)
-        ]
-        self._next_sala = 0
+        # Toda a escrita em disco passa pela thread do escritor
+        self.writer = LogWriter(
+            sink,
+            status_file=MED_STATUS_FILE,
+            maxsize=opts['fila_escrita'],
+            batch_size=opts['lote'],
+            flush_interval=opts['lote_ms'] / 1000,
+            salas_totais=n_salas,
+            slots=self.slots,
+            inst=self.inst,
+        )
 
-        # Servidor TCP
+        # SIGTERM (ex.: simulate_multi_salas) também drena o escritor
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+        self.shards = None
+        if opts['processos'] > 1:
+            # As Room vivem nos processos de salas; aqui ficam os proxies
+            self.shards = ShardSet(n_salas, n_medicos, opts['processos'], self.writer,
+                                   roubo=opts['roubo'], threads=opts['threads_medicos'],
+                                   slots_path=SLOTS_FILE, inst=self.inst)
+            self.rooms = self.shards.rooms
+        else:
+            # Instancia as Room; médicos e purge partilham o mesmo Scheduler
+            scheduler = Scheduler(threads=opts['threads_medicos'])
+            self.rooms = [
+                Room(room_id=i, num_medicos=n_medicos, writer=self.writer,
+                     scheduler=scheduler, slots=self.slots, inst=self.inst)
+                for i in range(n_salas)
+            ]
+            if opts['roubo']:
+                for room in self.rooms:
+                    room.set_peers(self.rooms)
+        self.politica = make_policy(opts['politica'])
+
+        metricas = None
+        if self.inst is not None:
+            metricas = servir(self.inst, host, opts['metricas'])
+            self.stdout.write(f"Métricas em http://{host}:{opts['metricas']}/metrics")
+
+        try:
+            if opts['engine'] == 'asyncio':
+                self.stdout.write(
+                    f"Escutando em {host}:{port} (asyncio) com "
+                    f"{n_salas} salas e {n_medicos} médicos/sala"
+                )
+                AsyncIngestServer(host, port, self.on_arrival,
+                                  log=self.stdout.write, inst=self.inst).run()
+            else:
+                self.serve_threads(host, port, n_salas, n_medicos)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if metricas is not None:
+                metricas.shutdown()
+            if self.shards is not None:
+                # Os últimos registos dos processos de salas passam ainda pelo escritor
+                self.shards.close()
+            # Garante que eventos pendentes chegam ao disco (e publica o estado final)
+            self.writer.close()
+            # Sem servidor os slots deixam de ser lidos como estado ao vivo; o mapeamento
+            # continua válido para temporizadores que ainda terminem
+            try:
+                os.remove(SLOTS_FILE)
+            except OSError:
+                pass
+            self.stdout.write(f"Escritor de logs: {self.writer.stats()}")
+
+    def serve_threads(self, host, port, n_salas, n_medicos):
+        """Ciclo de accept sequencial original"""
         with socket.socket() as srv:
             srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             srv.bind((host, port))
@@ -89,40 +241,45 @@ class Command(BaseCommand):
                 f"Escutando em {host}:{port} com "
                 f"{n_salas} salas e {n_medicos} médicos/sala"
             )
+            accept = None if self.inst is None else self.inst.accept.labels(engine='threads')
             while True:
                 conn, addr = srv.accept()
-                with conn:
-                    now = datetime.utcnow().isoformat() + 'Z'
-                    self.stdout.write(f"[{now}] Conexão de {addr}")
-                    raw = conn.recv(1024)
-                    try:
-                        pay = json.loads(raw.decode())
-                    except json.JSONDecodeError:
-                        continue
-
-                    pid = pay['pid']
-                    urg = pay.get('urgencia') or pay.get('urgência')
-                    ts = pay['timestamp']
-
-                    # Log de chegada
-                    chegada = {
-                        "pid": pid,
-                        "medico": None,
-                        "room": None,
-                        "chegada": ts,
-                        "nivel": urg,
-                        "inicio": None,
-                        "saida": None,
-                        "espera": None,
-                        "duracao": None,
-                        "desistencia": False
-                    }
-                    self.log_event(chegada)
-
-                    # Round-robin para escolher sala e enfileirar
-                    sala = self._next_sala % n_salas
-                    self._next_sala += 1
-                    self.rooms[sala].enqueue(pid, ts, pay)
-
-                    # Confirma chegada ao cliente
-                    conn.sendall(b'CHEGADA_RECEBIDA')
+                if accept is None:
+                    self.atender(conn, addr)
+                else:
+                    t0 = clock.now()
+                    self.atender(conn, addr)
+                    accept.observe(clock.now() - t0)
+
+    def atender(self, conn, addr):
+        """Uma ligação aceite pelo ciclo sequencial (v2 segue para uma thread própria)"""
+        self.stdout.write(f"[{clock.iso_now()}] Conexão de {addr}")
+        framer = JsonFramer()
+        try:
+            pay = recv_message(conn, framer)
+        except (FrameError, ConnectionError):
+            conn.close()
+            return
+        if pay is not None and is_handshake(pay):
+            # Ligação persistente (v2): atendida numa thread própria
+            threading.Thread(
+                target=self.serve_v2, args=(conn, framer, pay), daemon=True
+            ).start()
+            return
+        with conn:
+            if pay is None or not self.on_arrival(pay):
+                return
+
+            # Confirma chegada ao cliente
+            conn.sendall(ACK_CHEGADA)
+
+    def serve_v2(self, conn, framer, hello):
+        """Sessão do protocolo v2 no motor com threads"""
+        with conn:
+            try:
+                reply, version = handshake_reply(hello)
+                conn.sendall(reply)
+                if version is not None:
+                    serve_v2_socket(conn, framer, self.on_arrival)
+            except ConnectionError:
+                pass
@@ -0,0 +1,125 @@
+"""
+Estado dos médicos em memória partilhada (medicos.slots).
+
+Um ficheiro de tamanho fixo mapeado com mmap, com um slot de 16 bytes por médico,
+indexado por (sala, médico). Cada médico só escreve no seu slot, sem lock nenhum: as
+atualizações de salas (ou processos, com --processos) diferentes nunca se cruzam e não
+passam pela fila do escritor. As leituras (dashboard, estado.json) usam um seqlock por
+slot: o contador fica ímpar durante a escrita e o leitor repete os slots que mudaram a
+meio da leitura, até TENTATIVAS vezes. Um slot que continua ímpar (ex.: processo de
+salas morto a meio de uma escrita) é devolvido como desconhecido (ocupado None).
+
+Formato (little-endian):
+    MAGIC (8 bytes) | salas (uint32) | médicos por sala (uint32) | slots
+    slot: seq (uint32) | ocupado (bool) | 3 bytes livres | sala (int32) | 4 bytes livres
+"""
+import mmap
+import os
+import struct
+import time
+import zlib
+
+SLOTS_FILE = 'medicos.slots'
+MAGIC = b'URGMED1\n'
+HEADER = struct.Struct('<8sII')
+SLOT = struct.Struct('<I?3xi4x')
+SEQ = struct.Struct('<I')
+BODY = struct.Struct('<?3xi')
+SEM_SALA = -1
+# Releituras de um slot a ser escrito antes de o dar como desconhecido
+TENTATIVAS = 100
+
+
+class MedSlots:
+    """Slots dos médicos de `salas` salas com `medicos` médicos cada"""
+
+    def __init__(self, path=SLOTS_FILE, write=False):
+        self.path = path
+        with open(path, 'r+b' if write else 'rb') as f:
+            magic, self.salas, self.medicos = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("Não é um ficheiro de slots de médicos")
+            access = mmap.ACCESS_WRITE if write else mmap.ACCESS_READ
+            self._mmap = mmap.mmap(f.fileno(), 0, access=access)
+        self._fim = HEADER.size + self.salas * self.medicos * SLOT.size
+        if len(self._mmap) < self._fim:
+            raise ValueError("Ficheiro de slots de médicos truncado")
+
+    @classmethod
+    def create(cls, path, salas, medicos):
+        """Cria (de forma atómica) os slots com todos os médicos livres e abre-os para escrita"""
+        livre = SLOT.pack(0, False, SEM_SALA)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, salas, medicos))
+            f.write(livre * (salas * medicos))
+        os.replace(tmp, path)
+        return cls(path, write=True)
+
+    def _offset(self, room, med_id):
+        return HEADER.size + (room * self.medicos + med_id - 1) * SLOT.size
+
+    def set(self, room, med_id, ocupado):
+        """Atualiza o slot do médico `med_id` (1..medicos) da sala `room`"""
+        off = self._offset(room, med_id)
+        seq = SEQ.unpack_from(self._mmap, off)[0]
+        # Ímpar enquanto o slot está a ser escrito
+        SEQ.pack_into(self._mmap, off, (seq + 1) & 0xFFFFFFFF)
+        BODY.pack_into(self._mmap, off + SEQ.size, ocupado, room if ocupado else SEM_SALA)
+        SEQ.pack_into(self._mmap, off, (seq + 2) & 0xFFFFFFFF)
+
+    def _read_slot(self, off):
+        """(ocupado, sala) lidos de forma consistente, ou None ao fim de TENTATIVAS"""
+        for _ in range(TENTATIVAS):
+            seq = SEQ.unpack_from(self._mmap, off)[0]
+            if not seq & 1:
+                body = BODY.unpack_from(self._mmap, off + SEQ.size)
+                if SEQ.unpack_from(self._mmap, off)[0] == seq:
+                    return body
+            # Cede o CPU ao processo que está a escrever
+            time.sleep(0)
+        return None
+
+    def snapshot(self):
+        """
+        {'sala-médico': {'room', 'ocupado'}}, cada slot lido de forma consistente;
+        ocupado None se o slot ficou a meio de uma escrita
+        """
+        # Duas cópias: um slot com o mesmo seq (par) nas duas não mudou entre elas
+        antes = self._mmap[HEADER.size:self._fim]
+        depois = self._mmap[HEADER.size:self._fim]
+        status = {}
+        slots = zip(SLOT.iter_unpack(antes), SLOT.iter_unpack(depois))
+        for i, ((seq, ocupado, room), (seq_depois, _, _)) in enumerate(slots):
+            if seq & 1 or seq != seq_depois:
+                lido = self._read_slot(HEADER.size + i * SLOT.size)
+                ocupado, room = lido if lido is not None else (None, SEM_SALA)
+            sala, med_id = divmod(i, self.medicos)
+            status[f"{sala}-{med_id + 1}"] = {
+                'room': room if ocupado else None,
+                'ocupado': ocupado,
+            }
+        return status
+
+    def digest(self):
+        """Soma de verificação dos slots (muda sempre que algum médico muda de estado)"""
+        return zlib.crc32(self._mmap[HEADER.size:self._fim])
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_slots(path=SLOTS_FILE):
+    """Abre os slots só para leitura; None se o ficheiro não existir ou for inválido"""
+    try:
+        return MedSlots(path)
+    except (FileNotFoundError, ValueError, struct.error):
+        return None
@@ -0,0 +1,259 @@
+"""
+Métricas de desempenho mantidas incrementalmente (percentis e séries temporais).
+
+- LogHistogram: sketch de quantis com baldes logarítmicos (erro relativo limitado,
+  como no DDSketch). Acrescentar um valor é O(1) e calcular p50/p90/p99 só percorre os
+  baldes ocupados (algumas centenas), nunca o histórico.
+- RingSeries: contadores por balde de tempo num buffer circular, para débitos em janelas
+  deslizantes sem guardar eventos individuais.
+- RunMetrics: espera e duração por nível e por sala, e débito de chegadas, atendimentos e
+  desistências; o LiveState aplica-lhe cada registo e publica o resumo em estado.json.
+"""
+import math
+from datetime import datetime, timezone
+
+from servidor.constants import URGENCIA_PRIORIDADES
+
+QUANTIS = (0.5, 0.9, 0.99)
+ERRO_RELATIVO = 0.01
+# Janelas de débito (segundos) e resolução/extensão da série
+JANELAS = (10, 60, 300)
+RESOLUCAO = 1.0
+BALDES = 300
+SERIE_PONTOS = 60
+
+# Marcas por pid em RunMetrics
+CHEGADA, ESPERA, FIM = 1, 2, 4
+
+
+class LogHistogram:
+    """Histograma com baldes geométricos: quantis com erro relativo <= `erro`"""
+
+    def __init__(self, erro=ERRO_RELATIVO):
+        self.gamma = (1 + erro) / (1 - erro)
+        self._log_gamma = math.log(self.gamma)
+        self.baldes = {}
+        # Valores <= 0 (ex.: espera nula com médicos livres)
+        self.zeros = 0
+        self.n = 0
+        self.soma = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._resumo = None
+
+    def add(self, value):
+        self.n += 1
+        self.soma += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value <= 0:
+            self.zeros += 1
+        else:
+            i = math.ceil(math.log(value) / self._log_gamma)
+            self.baldes[i] = self.baldes.get(i, 0) + 1
+        self._resumo = None
+
+    def merge(self, other):
+        for i, count in other.baldes.items():
+            self.baldes[i] = self.baldes.get(i, 0) + count
+        self.zeros += other.zeros
+        self.n += other.n
+        self.soma += other.soma
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._resumo = None
+
+    def quantiles(self, qs=QUANTIS):
+        """Valores aproximados dos quantis `qs` (por ordem crescente)"""
+        result = []
+        if not self.n:
+            return [None] * len(qs)
+        targets = iter(qs)
+        q = next(targets)
+        acumulado = self.zeros
+        # Quantis que caem nos zeros
+        while q is not None and acumulado > q * (self.n - 1):
+            result.append(0.0)
+            q = next(targets, None)
+        for i in sorted(self.baldes):
+            if q is None:
+                break
+            acumulado += self.baldes[i]
+            while q is not None and acumulado > q * (self.n - 1):
+                # Ponto médio do balde, limitado ao intervalo observado
+                value = 2 * self.gamma ** i / (self.gamma + 1)
+                result.append(min(max(value, self.min), self.max))
+                q = next(targets, None)
+        while len(result) < len(qs):
+            result.append(self.max)
+        return result
+
+    def resumo(self):
+        """{'n', 'media', 'min', 'max', 'p50', 'p90', 'p99'} (em cache até ao próximo add)"""
+        if self._resumo is None:
+            resumo = {
+                'n': self.n,
+                'media': self.soma / self.n if self.n else None,
+                'min': self.min if self.n else None,
+                'max': self.max if self.n else None,
+            }
+            for q, value in zip(QUANTIS, self.quantiles()):
+                resumo[f"p{round(q * 100)}"] = None if value is None else round(value, 6)
+            self._resumo = resumo
+        return self._resumo
+
+
+class RingSeries:
+    """Contadores por balde de `resolucao` segundos, guardando os últimos `baldes`"""
+
+    def __init__(self, resolucao=RESOLUCAO, baldes=BALDES):
+        self.resolucao = resolucao
+        self.n = baldes
+        self.counts = [0] * baldes
+        # Índice absoluto (t // resolucao) de cada posição, para detetar baldes antigos
+        self.ids = [-1] * baldes
+        self.ultimo = None
+
+    def add(self, t, count=1):
+        b = int(t // self.resolucao)
+        pos = b % self.n
+        if self.ids[pos] != b:
+            if self.ultimo is not None and b <= self.ultimo - self.n:
+                return  # Mais antigo que a janela guardada
+            self.ids[pos] = b
+            self.counts[pos] = 0
+        self.counts[pos] += count
+        if self.ultimo is None or b > self.ultimo:
+            self.ultimo = b
+
+    def values(self, pontos, fim=None):
+        """Contagens dos últimos `pontos` baldes até `fim` (índice absoluto), mais antigas primeiro"""
+        fim = self.ultimo if fim is None else fim
+        if fim is None:
+            return [0] * pontos
+        out = []
+        for b in range(fim - pontos + 1, fim + 1):
+            pos = b % self.n
+            out.append(self.counts[pos] if self.ids[pos] == b else 0)
+        return out
+
+    def rate(self, janela, fim=None):
+        """Eventos por segundo na janela de `janela` segundos que termina em `fim`"""
+        pontos = max(1, int(janela // self.resolucao))
+        return sum(self.values(pontos, fim)) / (pontos * self.resolucao)
+
+
+def _epoch(ts):
+    """Timestamp ISO dos registos em segundos desde a epoch (None se inválido)"""
+    try:
+        t = datetime.fromisoformat(ts)
+    except (TypeError, ValueError):
+        return None
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return t.timestamp()
+
+
+class RunMetrics:
+    """Percentis de espera/duração por nível e sala e débitos em janelas deslizantes"""
+
+    SERIES = ('chegadas', 'atendidos', 'desistencias')
+
+    def __init__(self):
+        self.espera = {}
+        self.duracao = {}
+        self.series = {nome: RingSeries() for nome in self.SERIES}
+        # O que já foi contabilizado de cada pid (CHEGADA | ESPERA | FIM)
+        self._pids = {}
+
+    def _add(self, tabela, nivel, room, value):
+        for chave in (('nivel', nivel), ('sala', room)):
+            if chave[1] is None:
+                continue
+            hist = tabela.get(chave)
+            if hist is None:
+                hist = tabela[chave] = LogHistogram()
+            hist.add(value)
+
+    def apply(self, record):
+        """
+        Contabiliza o estado mais recente de um pid. Cada paciente conta uma vez na
+        chegada, uma vez na espera (no início do atendimento) e uma vez no fim, mesmo que
+        só se apliquem os registos finais (ex.: snapshot do motor DES). Como em
+        servidor.analise e servidor.replicacoes, a espera só inclui pacientes atendidos:
+        as desistências contam no débito de desistências.
+        """
+        pid = record['pid']
+        vistos = self._pids.get(pid, 0)
+        nivel = record.get('nivel')
+        room = record.get('room')
+        if not vistos & CHEGADA:
+            vistos |= CHEGADA
+            self._tick('chegadas', record.get('chegada'))
+        if (not vistos & ESPERA and record.get('espera') is not None
+                and record.get('inicio') is not None and not record.get('desistencia')):
+            vistos |= ESPERA
+            self._add(self.espera, nivel, room, record['espera'])
+        if not vistos & FIM:
+            if record.get('desistencia'):
+                vistos |= FIM
+                self._tick('desistencias', record.get('saida'))
+            elif record.get('saida') is not None:
+                vistos |= FIM
+                if record.get('duracao') is not None:
+                    self._add(self.duracao, nivel, room, record['duracao'])
+                self._tick('atendidos', record['saida'])
+        self._pids[pid] = vistos
+
+    def _tick(self, serie, ts):
+        t = _epoch(ts)
+        if t is not None:
+            self.series[serie].add(t)
+
+    def _tabela(self, tabela):
+        total = LogHistogram()
+        niveis = {}
+        salas = {}
+        for (tipo, chave), hist in tabela.items():
+            if tipo == 'nivel':
+                niveis[chave] = hist.resumo()
+                total.merge(hist)
+            else:
+                salas[str(chave)] = hist.resumo()
+        ordem = {nivel: i for i, nivel in enumerate(URGENCIA_PRIORIDADES)}
+        return {
+            'global': total.resumo(),
+            'nivel': dict(sorted(niveis.items(), key=lambda kv: ordem.get(kv[0], 99))),
+            'sala': dict(sorted(salas.items(), key=lambda kv: int(kv[0]) if kv[0].isdigit() else kv[0])),
+        }
+
+    def resumo(self, agora=None):
+        """
+        Secção 'metricas' do estado.json (e resposta de GET /api/metricas/).
+        Com `agora` (epoch, servidor ao vivo) as janelas terminam no último balde completo
+        antes desse instante, pelo que os débitos descem a zero quando deixa de haver
+        eventos; sem ele (execução terminada, ex.: DES) terminam no último evento.
+        """
+        if agora is not None:
+            fim = int(agora // RESOLUCAO) - 1
+        else:
+            ultimos = [s.ultimo for s in self.series.values() if s.ultimo is not None]
+            fim = max(ultimos) if ultimos else None
+        debito = {}
+        for janela in JANELAS:
+            debito[f"{janela}s"] = {
+                nome: round(serie.rate(janela, fim), 3) for nome, serie in self.series.items()
+            }
+        return {
+            'espera': self._tabela(self.espera),
+            'duracao': self._tabela(self.duracao),
+            'debito': debito,
+            'serie': {
+                'resolucao': RESOLUCAO,
+                'fim': None if fim is None else datetime.fromtimestamp(
+                    (fim + 1) * RESOLUCAO, timezone.utc).isoformat().replace('+00:00', 'Z'),
+                **{nome: serie.values(SERIE_PONTOS, fim) for nome, serie in self.series.items()},
+            },
+        }
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-18 10:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistoPaciente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pid', models.BigIntegerField(unique=True)),
+                ('seq', models.BigIntegerField(default=0)),
+                ('medico', models.CharField(blank=True, max_length=32, null=True)),
+                ('room', models.IntegerField(blank=True, db_index=True, null=True)),
+                ('nivel', models.CharField(db_index=True, max_length=16)),
+                ('chegada', models.CharField(db_index=True, max_length=40)),
+                ('inicio', models.CharField(blank=True, max_length=40, null=True)),
+                ('saida', models.CharField(blank=True, db_index=True, max_length=40, null=True)),
+                ('espera', models.FloatField(blank=True, null=True)),
+                ('duracao', models.FloatField(blank=True, null=True)),
+                ('desistencia', models.BooleanField(default=False)),
+                ('surto', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['desistencia', 'saida', 'nivel'], name='registo_estado_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,30 @@
 from django.db import models
 
-# Create your models here.
+
+class RegistoPaciente(models.Model):
+    """
+    Estado mais recente de cada paciente, com os mesmos campos de uma entrada do
+    logs.json. Preenchido pelo runurgencias --sink sqlite (servidor.event_store).
+    """
+    pid = models.BigIntegerField(unique=True)
+    seq = models.BigIntegerField(default=0)
+    medico = models.CharField(max_length=32, null=True, blank=True)
+    room = models.IntegerField(null=True, blank=True, db_index=True)
+    nivel = models.CharField(max_length=16, db_index=True)
+    # Timestamps ISO tal como no logs.json (a ordem lexicográfica é a cronológica)
+    chegada = models.CharField(max_length=40, db_index=True)
+    inicio = models.CharField(max_length=40, null=True, blank=True)
+    saida = models.CharField(max_length=40, null=True, blank=True, db_index=True)
+    espera = models.FloatField(null=True, blank=True)
+    duracao = models.FloatField(null=True, blank=True)
+    desistencia = models.BooleanField(default=False)
+    surto = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Pacientes em espera por nível (GET /api/filas/)
+            models.Index(fields=['desistencia', 'saida', 'nivel'], name='registo_estado_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.pid} [{self.nivel}]"
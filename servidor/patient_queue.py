@@ -0,0 +1,96 @@
+"""
+Fila de pacientes de uma sala: heap de prioridade + índice de prazos de desistência.
+
+Os tempos (chegada e prazo) são numéricos, do relógio monotónico (servidor.clock) ou
+de um relógio virtual; o timestamp ISO recebido do cliente segue só como dado.
+
+Cada paciente entra em dois heaps: por (prioridade, chegada) para os médicos e por prazo
+(chegada + TIMEOUTS[nivel]) para as desistências. As remoções são preguiçosas: a entrada
+fica marcada como inativa e é descartada quando chega ao topo do outro heap, pelo que
+expirar um paciente custa O(log n) e não obriga a percorrer nem a reconstruir a fila.
+A classe não é thread-safe; a Room protege-a com o seu lock.
+"""
+import heapq
+import itertools
+
+# Campos de uma entrada (lista, para comparar por prioridade, chegada e ordem de chegada)
+PRIORITY, ARRIVAL, SEQ, PID, PAYLOAD, DEADLINE, ACTIVE, TS, WORK = range(9)
+
+
+class PatientQueue:
+    def __init__(self):
+        self._heap = []
+        self._deadlines = []
+        self._seq = itertools.count()
+        self._size = 0
+        # Soma dos tempos de atendimento previstos dos pacientes em espera
+        self.work = 0.0
+
+    def __len__(self):
+        return self._size
+
+    def push(self, priority, arrival, pid, payload, deadline, ts=None, work=0.0):
+        """Acrescenta um paciente; devolve True se o seu prazo passa a ser o mais próximo"""
+        entry = [priority, arrival, next(self._seq), pid, payload, deadline, True, ts, work]
+        heapq.heappush(self._heap, entry)
+        heapq.heappush(self._deadlines, (deadline, entry[SEQ], entry))
+        self._size += 1
+        self.work += work
+        return self._deadlines[0][2] is entry
+
+    def pop(self):
+        """Retira e devolve a entrada do paciente mais prioritário"""
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if entry[ACTIVE]:
+                entry[ACTIVE] = False
+                self._size -= 1
+                self.work -= entry[WORK]
+                self._maybe_compact()
+                return entry
+        raise IndexError('pop from empty PatientQueue')
+
+    def peek(self):
+        """Entrada mais prioritária sem a retirar (ou None)"""
+        while self._heap and not self._heap[0][ACTIVE]:
+            heapq.heappop(self._heap)
+        return self._heap[0] if self._heap else None
+
+    def expire(self, now):
+        """Retira e devolve as entradas cujo prazo já passou (só toca nessas)"""
+        expired = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, _, entry = heapq.heappop(self._deadlines)
+            if entry[ACTIVE]:
+                entry[ACTIVE] = False
+                self._size -= 1
+                self.work -= entry[WORK]
+                expired.append(entry)
+        if expired:
+            self._maybe_compact()
+        return expired
+
+    def por_prioridade(self):
+        """{prioridade: nº de pacientes em espera}; O(n), só para recolha de métricas"""
+        contagem = {}
+        for entry in self._heap:
+            if entry[ACTIVE]:
+                contagem[entry[PRIORITY]] = contagem.get(entry[PRIORITY], 0) + 1
+        return contagem
+
+    def next_deadline(self):
+        """Prazo do próximo paciente a desistir (None se a fila estiver vazia)"""
+        while self._deadlines and not self._deadlines[0][2][ACTIVE]:
+            heapq.heappop(self._deadlines)
+        return self._deadlines[0][0] if self._deadlines else None
+
+    def _maybe_compact(self):
+        if not self._size:
+            self.work = 0.0
+        # Evita que entradas inativas se acumulem quando ficam longe do topo
+        garbage = len(self._heap) + len(self._deadlines) - 2 * self._size
+        if garbage > 64 and garbage > 2 * self._size:
+            self._heap = [e for e in self._heap if e[ACTIVE]]
+            heapq.heapify(self._heap)
+            self._deadlines = [d for d in self._deadlines if d[2][ACTIVE]]
+            heapq.heapify(self._deadlines)
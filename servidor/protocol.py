@@ -0,0 +1,186 @@
+"""
+Protocolo de chegada de pacientes.
+
+Versão 1 (clientes antigos): um único objeto JSON sem delimitador por ligação, a que o
+servidor responde CHEGADA_RECEBIDA. Não se pode assumir que um recv(1024) traz a
+mensagem inteira (nem que traz só uma): o JsonFramer acumula bytes e devolve cada
+objeto JSON de topo assim que fica completo.
+
+Versão 2 (ligação persistente): o cliente abre com a linha {"protocolo": 2} e o
+servidor responde {"protocolo": 2}. A partir daí cada linha é um lote
+{"lote": <id>, "pacientes": [<chegada>, ...]} e o servidor responde a cada lote com
+uma linha {"ack": <id>, "recebidos": n, "rejeitados": m}. O último lote pode chegar sem
+newline, terminado pelo fecho da escrita (EOF).
+"""
+import codecs
+import json
+
+ACK_CHEGADA = b'CHEGADA_RECEBIDA'
+PROTOCOLO_V2 = 2
+PROTOCOLOS = (1, PROTOCOLO_V2)
+MAX_FRAME = 64 * 1024
+MAX_LINE = 16 * 1024 * 1024
+RECV_SIZE = 4096
+
+
+class FrameError(ValueError):
+    """Mensagem malformada ou maior que MAX_FRAME"""
+
+
+class JsonFramer:
+    """Decodificador incremental de objetos JSON consecutivos"""
+
+    def __init__(self, max_frame=MAX_FRAME):
+        self.max_frame = max_frame
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        # Estado do scanner, para não voltar a percorrer o que já foi visto
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, data, limit=None):
+        """
+        Acrescenta bytes recebidos e devolve a lista de mensagens completas
+        (no máximo `limit`; o resto fica no buffer para a próxima chamada).
+        """
+        try:
+            self._buf += self._decoder.decode(data)
+        except UnicodeDecodeError as e:
+            raise FrameError(str(e))
+        messages = []
+        while limit is None or len(messages) < limit:
+            frame = self._next_frame()
+            if frame is None:
+                break
+            try:
+                messages.append(json.loads(frame))
+            except json.JSONDecodeError as e:
+                raise FrameError(str(e))
+        if self._depth and len(self._buf) > self.max_frame:
+            raise FrameError(f"Mensagem excede {self.max_frame} bytes")
+        return messages
+
+    def _next_frame(self):
+        buf = self._buf
+        i = self._pos
+        if self._depth == 0:
+            # Salta separadores entre mensagens
+            while i < len(buf) and buf[i] in ' \t\r\n':
+                i += 1
+            buf = self._buf = buf[i:]
+            i = self._pos = 0
+            if not buf:
+                return None
+            if buf[0] not in '{[':
+                raise FrameError(f"Início de mensagem inválido: {buf[:16]!r}")
+        while i < len(buf):
+            c = buf[i]
+            i += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in '{[':
+                self._depth += 1
+            elif c in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    frame, self._buf = buf[:i], buf[i:]
+                    self._pos = 0
+                    return frame
+        self._pos = i
+        return None
+
+    @property
+    def pending(self):
+        """True se há uma mensagem parcialmente recebida"""
+        return bool(self._buf.strip())
+
+    def take_remaining(self):
+        """Devolve (em bytes) o que já foi recebido mas não enquadrado"""
+        rest = self._buf + self._decoder.decode(b'', final=True)
+        self._buf = ''
+        self._pos = self._depth = 0
+        self._in_string = self._escape = False
+        return rest.encode('utf-8')
+
+
+def encode_line(obj):
+    """Serializa uma mensagem do protocolo v2 (JSON terminado em newline)"""
+    return (json.dumps(obj, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def is_handshake(msg):
+    return isinstance(msg, dict) and 'protocolo' in msg
+
+
+def handshake_reply(msg):
+    """Resposta à abertura de sessão; devolve (bytes, versão aceite ou None)"""
+    version = msg.get('protocolo')
+    if version == PROTOCOLO_V2:
+        return encode_line({'protocolo': PROTOCOLO_V2}), PROTOCOLO_V2
+    return encode_line({'erro': 'protocolo não suportado',
+                        'suportados': list(PROTOCOLOS)}), None
+
+
+def process_batch(line, on_arrival):
+    """
+    Processa uma linha v2 (um lote de chegadas) com `on_arrival(payload) -> bool` e
+    devolve a linha de acknowledgement.
+    """
+    try:
+        msg = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return encode_line({'ack': None, 'erro': 'JSON inválido'})
+    if not isinstance(msg, dict) or not isinstance(msg.get('pacientes'), list):
+        return encode_line({'ack': None, 'erro': 'lote sem "pacientes"'})
+    recebidos = 0
+    for pay in msg['pacientes']:
+        if on_arrival(pay):
+            recebidos += 1
+    return encode_line({
+        'ack': msg.get('lote'),
+        'recebidos': recebidos,
+        'rejeitados': len(msg['pacientes']) - recebidos,
+    })
+
+
+def recv_message(conn, framer=None):
+    """Lê de um socket bloqueante até ter uma mensagem completa (None se EOF)"""
+    if framer is None:
+        framer = JsonFramer()
+    while True:
+        data = conn.recv(RECV_SIZE)
+        if not data:
+            return None
+        messages = framer.feed(data, limit=1)
+        if messages:
+            return messages[0]
+
+
+def serve_v2_socket(conn, framer, on_arrival):
+    """Sessão v2 num socket bloqueante (motor com threads), até EOF"""
+    buf = framer.take_remaining()
+    while True:
+        nl = buf.find(b'\n')
+        if nl < 0:
+            if len(buf) > MAX_LINE:
+                return
+            data = conn.recv(64 * 1024)
+            if not data:
+                # Último lote sem '\n' antes do EOF: também é processado e confirmado
+                if buf.strip():
+                    conn.sendall(process_batch(buf, on_arrival))
+                return
+            buf += data
+            continue
+        line, buf = buf[:nl], buf[nl + 1:]
+        if line.strip():
+            conn.sendall(process_batch(line, on_arrival))
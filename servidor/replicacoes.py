@@ -0,0 +1,100 @@
+"""
+Replicações Monte Carlo de um cenário do motor de eventos discretos.
+
+Cada replicação é um Scenario com uma semente diferente, executado num processo do
+pool (sem servidor TCP). Cada processo devolve só o resumo da sua execução e o processo
+principal agrega as distribuições de espera e desistência com intervalos de confiança.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+
+from servidor.des import NIVEIS, simulate
+from servidor.stats import mean_ci95, percentile
+
+QUANTIS = (50, 90, 99)
+
+
+def cpus_disponiveis():
+    """CPUs que este processo pode usar (respeita a afinidade, ex.: em containers)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def resumo_execucao(records):
+    """Métricas escalares de uma execução a partir dos registos (formato logs.json)"""
+    esperas = {n: [] for n in NIVEIS}
+    desistencias = dict.fromkeys(NIVEIS, 0)
+    totais = dict.fromkeys(NIVEIS, 0)
+    for rec in records.values():
+        nivel = rec['nivel']
+        if nivel not in totais:
+            continue
+        totais[nivel] += 1
+        if rec['desistencia']:
+            desistencias[nivel] += 1
+        elif rec['inicio'] is not None:
+            esperas[nivel].append(rec['espera'])
+
+    resumo = {}
+    todas = sorted(e for lst in esperas.values() for e in lst)
+    total = sum(totais.values())
+    resumo['pacientes'] = total
+    resumo['taxa_desistencia'] = sum(desistencias.values()) / total if total else None
+    resumo['espera_media'] = sum(todas) / len(todas) if todas else None
+    for q in QUANTIS:
+        resumo[f'espera_p{q}'] = percentile(todas, q)
+    for nivel in NIVEIS:
+        lst = sorted(esperas[nivel])
+        n = totais[nivel]
+        resumo[f'taxa_desistencia_{nivel}'] = desistencias[nivel] / n if n else None
+        resumo[f'espera_media_{nivel}'] = sum(lst) / len(lst) if lst else None
+        for q in QUANTIS:
+            resumo[f'espera_p{q}_{nivel}'] = percentile(lst, q)
+    return resumo
+
+
+def run_replication(scenario):
+    """Executa uma replicação (função de topo para poder ser enviada ao pool)"""
+    sim = simulate(scenario, start_epoch=0)
+    resumo = resumo_execucao(sim.records)
+    resumo['seed'] = scenario.seed
+    resumo['duracao_virtual'] = sim.now
+    return resumo
+
+
+def agregar(resumos):
+    """Média, IC 95% e percentis entre replicações de cada métrica"""
+    if not resumos:
+        raise ValueError("agregar precisa de pelo menos uma replicação")
+    agregado = {}
+    for key in resumos[0]:
+        if key == 'seed':
+            continue
+        values = sorted(r[key] for r in resumos if r[key] is not None)
+        mean, low, high = mean_ci95(values)
+        agregado[key] = {
+            'media': mean,
+            'ic95': [low, high],
+            'p5': percentile(values, 5),
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'n': len(values),
+        }
+    return agregado
+
+
+def replicate(scenario, replicacoes, seed=0, processos=None):
+    """
+    Executa `replicacoes` cópias do cenário com sementes seed, seed+1, ... num pool de
+    processos e devolve a lista de resumos (pela ordem das sementes).
+    """
+    processos = processos or cpus_disponiveis()
+    cenarios = [replace(scenario, seed=seed + i) for i in range(replicacoes)]
+    if processos == 1:
+        return [run_replication(sc) for sc in cenarios]
+    # Lotes grandes amortizam o custo de serialização entre processos
+    chunksize = max(1, replicacoes // (processos * 4))
+    with ProcessPoolExecutor(max_workers=processos) as pool:
+        return list(pool.map(run_replication, cenarios, chunksize=chunksize))
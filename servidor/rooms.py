@@ -1,150 +1,285 @@
-import heapq
+import logging
 import threading
-import time
-import json
-from datetime import datetime
+from servidor import clock
 from servidor.constants import TIMEOUTS, TEMPOS_ATENDIMENTO, URGENCIA_PRIORIDADES
+from servidor.instrumentacao import TimedLock, nivel
+from servidor.journal import JsonFileSink
+from servidor.patient_queue import ARRIVAL, PAYLOAD, PID, TS, PatientQueue
+from servidor.scheduler import default_scheduler
+from servidor.writer import SyncWriter
+
+# Uma linha por atendimento terminado, só com o nível DEBUG ativo (fora do caminho crítico)
+logger = logging.getLogger(__name__)
 
 
 class Room:
-    def __init__(self, room_id, num_medicos=5, log_lock= None):
+    """
+    Sala com fila de prioridade e `num_medicos` médicos. Os médicos e as desistências não
+    têm threads próprias: o fim de cada atendimento e o próximo prazo de desistência são
+    temporizadores do Scheduler (partilhado por todas as salas do processo).
+    Com `inst` (servidor.instrumentacao) mede a espera pelo lock, a profundidade da fila e
+    o tempo entre chegada e início; sem ele não mede nada.
+    """
+
+    def __init__(self, room_id, num_medicos=5, log_lock= None, writer=None, scheduler=None,
+                 slots=None, inst=None):
         self.room_id = room_id
-        self.queue = []
-        self.cv = threading.Condition()  # Condiciona a chegada/saida de pacientes
+        self.num_medicos = num_medicos
+        self.queue = PatientQueue()
+        self.inst = inst
+        if inst is None:
+            self.lock = threading.Lock()
+        else:
+            self.lock = TimedLock(inst.lock_espera.labels(lock='sala', sala=room_id))
+            inst.ao_recolher(self._recolher)
+        self.cv = threading.Condition(self.lock)  # Condiciona a chegada/saida de pacientes
+        self.scheduler = scheduler or default_scheduler()
+        # Temporizador da próxima desistência (e o respetivo prazo)
+        self._purge_timer = None
+        self._purge_at = None
         self.log_lock = log_lock or threading.Lock()
+        # Escritor dos eventos e do estado dos médicos (LogWriter grava em background)
+        self.writer = writer or SyncWriter(JsonFileSink(lock=self.log_lock), lock=self.log_lock)
+        # Slots dos médicos em memória partilhada (servidor.med_slots), sem lock global
+        self.slots = slots
 
-        # Ativa todos os médicos desta sala com threads
-        for m in range(1, num_medicos + 1):
-            t = threading.Thread(target=self.medico_worker, args=(m,), daemon=True)
-            t.start()
+        # Roubo de pacientes: salas vizinhas (definidas com set_peers) e médicos livres
+        self.peers = []
+        self._kicks = 0
+        # Médicos sem paciente (ids), à espera de uma chegada ou de um pedido de ajuda
+        self.livres = list(range(num_medicos, 0, -1))
+        # Médicos a procurar pacientes nas outras salas (ainda fora de self.livres)
+        self._roubando = 0
+        # Fim previsto (monotónico) de cada atendimento em curso, por médico (sob self.cv)
+        self._em_atendimento = {}
 
-        # Thread de desitência/purge
-        t = threading.Thread(target=self.purge_worker, daemon=True)
-        t.start()
+    @property
+    def idle(self):
+        """
+        Nº de médicos livres, incluindo os que estão a procurar nas outras salas: um
+        pedido de ajuda (kick) durante essa procura faz o médico procurar de novo
+        """
+        return len(self.livres) + self._roubando
+
+    def _recolher(self, inst):
+        """Profundidade da fila por nível, lida no momento da recolha das métricas"""
+        with self.cv:
+            contagem = self.queue.por_prioridade()
+        for urg, priority in URGENCIA_PRIORIDADES.items():
+            inst.fila.labels(sala=self.room_id, nivel=urg).set(contagem.pop(priority, 0))
+        inst.fila.labels(sala=self.room_id, nivel='outro').set(sum(contagem.values()))
 
     def log_event(self, record):
         """Grava eventos logs"""
-        with self.log_lock:
-            try:
-                with open('logs.json', 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                data = {}
-            data[str(record['pid'])] = record
-            with open('logs.json', 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-
-    def _update_med_status(self, med_key, room, ocupado):
-        """Atualiza med_status.json quando o médico começa ou termina o atendimento"""
-        with self.log_lock:
-            try:
-                with open('med_status.json', 'r', encoding='utf-8') as f:
-                    status = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                status = {}
-            status[med_key] = {'room': room if ocupado else None, 'ocupado': ocupado}
-            with open('med_status.json', 'w', encoding='utf-8') as f:
-                json.dump(status, f, ensure_ascii=False, indent=2)
+        self.writer.log_event(record)
+
+    def _update_med_status(self, med_id, ocupado):
+        """
+        Atualiza o estado do médico quando começa ou termina o atendimento: no seu slot
+        ou, sem slots, no med_status.json através do writer
+        """
+        if self.slots is not None:
+            self.slots.set(self.room_id, med_id, ocupado)
+        else:
+            self.writer.update_med_status(f"{self.room_id}-{med_id}", self.room_id, ocupado)
+
+    def _schedule_purge(self):
+        """Agenda a desistência para o próximo prazo (chamar com self.lock adquirido)"""
+        deadline = self.queue.next_deadline()
+        if deadline is None or deadline == self._purge_at:
+            return
+        if self._purge_timer is not None:
+            self._purge_timer.cancel()
+        self._purge_at = deadline
+        self._purge_timer = self.scheduler.call_at(deadline, self.purge_worker)
 
     def purge_worker(self):
-        """Desistência dentro desta sala caso o doente espera demasiado"""
+        """
+        Desistência dentro desta sala caso o doente espera demasiado.
+        Corre exatamente no próximo prazo e só toca nos pacientes expirados.
+        """
+        with self.lock:
+            now = clock.now()
+            expired = self.queue.expire(now)
+            self._purge_timer = self._purge_at = None
+            self._schedule_purge()
+        if expired:
+            saida = clock.to_iso(now)
+            for entry in expired:
+                ts, pid, payload = entry[TS], entry[PID], entry[PAYLOAD]
+                level = payload.get('urgencia') or payload.get('urgência')
+                rec = {
+                    "pid": pid,
+                    "medico": None,
+                    "room": self.room_id,
+                    "chegada": ts,
+                    "nivel": level,
+                    "inicio": None,
+                    "saida": saida,
+                    "espera": clock.seconds(now - entry[ARRIVAL]),
+                    "duracao": None,
+                    "desistencia": True,
+                }
+                if payload.get('surto') is not None:
+                    rec["surto"] = payload['surto']
+                self.log_event(rec)
+
+    def set_peers(self, rooms):
+        """Ativa o roubo: médicos livres desta sala atendem pacientes das outras"""
+        self.peers = [r for r in rooms if r is not self]
+
+    def kick(self):
+        """
+        Põe um médico livre desta sala a tentar roubar um paciente (numa thread do
+        Scheduler, não na de quem pede ajuda)
+        """
+        with self.cv:
+            self._kicks += 1
+            med_id = self.livres.pop() if self.livres else None
+        if med_id is not None:
+            self.scheduler.call_soon(self.medico_worker, med_id)
+
+    def steal(self):
+        """Cede o paciente mais prioritário desta sala a outra (ou None)"""
+        with self.cv:
+            if not self.queue:
+                return None
+            return self.queue.pop()
+
+    def _steal_from_peers(self):
+        # Nunca segura dois locks de salas ao mesmo tempo (evita deadlocks)
+        best = None
+        for peer in self.peers:
+            with peer.cv:
+                head = peer.queue.peek()
+                if head is not None and (best is None or head[:2] < best[0]):
+                    best = (head[:2], peer)
+        return best[1].steal() if best else None
+
+    def _next_patient(self, med_id):
+        """
+        Próximo paciente desta sala ou, com roubo, de outra sala. Sem nenhum, o médico
+        fica livre (em self.livres) e devolve None.
+        """
         while True:
-            time.sleep(1)
-            now = datetime.utcnow().isoformat() + 'Z'
-            with (self.cv):
-                new_queue = []
-                for priority, ts, pid, payload in self.queue:
-                    level = payload.get('urgencia') or payload.get('urgência')
-                    waited = (datetime.fromisoformat(now[:-1]) -
-                              datetime.fromisoformat(ts[:-1])
-                              ).total_seconds()
-                    if waited > TIMEOUTS.get(level, 0):
-                        rec = {
-                            "pid": pid,
-                            "medico": None,
-                            "room": self.room_id,
-                            "chegada": ts,
-                            "nivel": level,
-                            "inicio": None,
-                            "saida": now,
-                            "espera": waited,
-                            "duracao": None,
-                            "desistencia": True,
-                        }
-                        self.log_event(rec)
-                    else:
-                        new_queue.append((priority, ts, pid, payload))
-                # Reconstroi a pilha para quem não desistiu
-                self.queue[:] = new_queue
-                heapq.heapify(self.queue)
+            with self.cv:
+                if self.queue:
+                    return self.queue.pop()
+                kicks = self._kicks
+                if not self.peers:
+                    self.livres.append(med_id)
+                    return None
+                # Conta como livre durante a procura, para as outras salas pedirem ajuda
+                self._roubando += 1
+            entry = self._steal_from_peers()
+            with self.cv:
+                self._roubando -= 1
+                if entry is not None:
+                    return entry
+                # Só fica livre se ninguém pediu ajuda entretanto
+                if not self.queue and self._kicks == kicks:
+                    self.livres.append(med_id)
+                    return None
+
+    def pending_work(self):
+        """Trabalho pendente por médico (s): fila + o que falta aos atendimentos"""
+        now = clock.now()
+        with self.cv:
+            restante = sum(max(0.0, fim - now) for fim in self._em_atendimento.values())
+            work = self.queue.work
+        return (work + restante) / max(self.num_medicos, 1)
 
     def medico_worker(self, med_id):
-        """Atende pacientes desta sala e atualiza o med_status.json"""
+        """
+        O médico atende o próximo paciente desta sala (ou roubado) e marca-se ocupado
+        (no seu slot ou, sem slots, através do writer); o fim do atendimento é agendado
+        em vez de dormir numa thread.
+        """
+        entry = self._next_patient(med_id)
+        if entry is None:
+            return
         med_key = f"{self.room_id}-{med_id}"
-        while True:
-            with self.cv:
-                # Espera paciente na fila
-                while not self.queue:
-                    self.cv.wait()
-                priority, ts, pid, payload = heapq.heappop(self.queue)
-
-            urg = payload.get('urgencia') or payload.get('urgência')
-            dur = TEMPOS_ATENDIMENTO.get(urg, 10)
-            inicio = datetime.utcnow().isoformat() + 'Z'
-            espera = (
-                    datetime.fromisoformat(inicio[:-1]) -
-                    datetime.fromisoformat(ts[:-1])
-            ).total_seconds()
-
-            rec_start = {
-                "pid": pid,
-                "medico": med_key,
-                "room": self.room_id,
-                "chegada": ts,
-                "nivel": urg,
-                "inicio": inicio,
-                "saida": None,
-                "espera": espera,
-                "duracao": None,
-                "desistencia": False
-            }
-            self.log_event(rec_start)
-            self._update_med_status(med_key, self.room_id, True)
-
-            # Simula atendimento
-            time.sleep(dur)
-            fim = datetime.utcnow().isoformat() + 'Z'
-            duracao = (
-                    datetime.fromisoformat(fim[:-1]) -
-                    datetime.fromisoformat(inicio[:-1])
-            ).total_seconds()
-
-            record_end = {
-                "pid": pid,
-                "medico": med_key,
-                "room": self.room_id,
-                "chegada": ts,
-                "nivel": urg,
-                "inicio": inicio,
-                "saida": fim,
-                "espera": espera,
-                "duracao": duracao,
-                "desistencia": False
-            }
-            self.log_event(record_end)
-            self._update_med_status(med_key, self.room_id, False)
-            print(
-                f"[Sala {self.room_id}] Médico {med_key} terminou PID {pid} ({urg}) "
-                f"espera {espera:.1f}s, duração {duracao:.1f}s"
-            )
-
-    def enqueue(self, pid, ts, payload):
-        """Cria a pilha de um novo paciente desta sala"""
+        t_inicio = clock.now()
+
+        ts, pid, payload = entry[TS], entry[PID], entry[PAYLOAD]
+        urg = payload.get('urgencia') or payload.get('urgência')
+        dur = TEMPOS_ATENDIMENTO.get(urg, 10)
+        with self.cv:
+            self._em_atendimento[med_id] = t_inicio + dur
+        inicio = clock.to_iso(t_inicio)
+        espera = clock.seconds(t_inicio - entry[ARRIVAL])
+        if self.inst is not None:
+            self.inst.espera.labels(sala=self.room_id, nivel=nivel(urg)).observe(espera)
+
+        rec_start = {
+            "pid": pid,
+            "medico": med_key,
+            "room": self.room_id,
+            "chegada": ts,
+            "nivel": urg,
+            "inicio": inicio,
+            "saida": None,
+            "espera": espera,
+            "duracao": None,
+            "desistencia": False
+        }
+        if payload.get('surto') is not None:
+            rec_start["surto"] = payload['surto']
+        self.log_event(rec_start)
+        self._update_med_status(med_id, True)
+
+        # Simula atendimento
+        self.scheduler.call_at(t_inicio + dur, self._fim_atendimento,
+                               med_id, rec_start, t_inicio)
+
+    def _fim_atendimento(self, med_id, rec_start, t_inicio):
+        """Fim de um atendimento: regista a saída e o médico passa ao paciente seguinte"""
+        med_key = rec_start["medico"]
+        t_fim = clock.now()
+        with self.cv:
+            self._em_atendimento.pop(med_id, None)
+        duracao = clock.seconds(t_fim - t_inicio)
+
+        record_end = {
+            **rec_start,
+            "saida": clock.to_iso(t_fim),
+            "duracao": duracao,
+        }
+        self.log_event(record_end)
+        self._update_med_status(med_id, False)
+        logger.debug(
+            "[Sala %s] Médico %s terminou PID %s (%s) espera %.1fs, duração %.1fs",
+            self.room_id, med_key, record_end['pid'], record_end['nivel'],
+            record_end['espera'], duracao,
+        )
+        self.medico_worker(med_id)
+
+    def enqueue(self, pid, ts, payload, chegada=None):
+        """
+        Cria a pilha de um novo paciente desta sala.
+        `ts` é o timestamp ISO do cliente (só serializado); `chegada` é o instante
+        monotónico de receção no servidor, usado para ordenar, esperas e prazos.
+        """
+        if chegada is None:
+            chegada = clock.now()
         urg = payload.get('urgencia') or payload.get('urgência')
         priority = URGENCIA_PRIORIDADES.get(urg, 99)
+        deadline = chegada + TIMEOUTS.get(urg, 0)
+        work = TEMPOS_ATENDIMENTO.get(urg, 10)
         with self.cv:
-            heapq.heappush(self.queue, (priority, ts, pid, payload))
-            self.cv.notify()
+            if self.queue.push(priority, chegada, pid, payload, deadline, ts=ts, work=work):
+                self._schedule_purge()
+            # O médico chamado ainda conta como livre até pegar no paciente
+            need_help = len(self.queue) > self.idle
+            med_id = self.livres.pop() if self.livres else None
+        if med_id is not None:
+            # O atendimento começa numa thread do Scheduler: o ciclo de accept só enfileira
+            self.scheduler.call_soon(self.medico_worker, med_id)
+        if need_help and self.peers:
+            # Sem médicos livres aqui: pede ajuda às salas com médicos parados
+            for peer in self.peers:
+                if peer.idle:
+                    peer.kick()
 
     def size(self):
         """Retorna o tamanho atual da fila"""
@@ -0,0 +1,99 @@
+"""
+Temporizadores partilhados pelas Room (médicos e desistências).
+
+Em vez de uma thread por médico a dormir em time.sleep, cada fim de atendimento e cada
+prazo de desistência é um temporizador num heap, vigiado por uma única thread. Quando o
+instante chega, o callback corre num ThreadPoolExecutor de tamanho fixo. O nº de threads
+é sempre 1 + `threads`, seja qual for o nº de salas e de médicos.
+"""
+import heapq
+import itertools
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from servidor import clock
+
+THREADS = 4
+
+
+class Timer:
+    """Temporizador devolvido por Scheduler.call_at (pode ser cancelado)"""
+    __slots__ = ('when', 'fn', 'args', 'cancelled')
+
+    def __init__(self, when, fn, args):
+        self.when = when
+        self.fn = fn
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """Heap de temporizadores (relógio monotónico) e executor de tamanho fixo"""
+
+    def __init__(self, threads=THREADS):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cv = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=threads,
+                                            thread_name_prefix='medicos')
+        self._thread = threading.Thread(target=self._run, name='agenda', daemon=True)
+        self._thread.start()
+
+    def call_at(self, when, fn, *args):
+        """Corre fn(*args) no executor quando clock.now() >= when"""
+        timer = Timer(when, fn, args)
+        with self._cv:
+            heapq.heappush(self._heap, (when, next(self._seq), timer))
+            # Só acorda a thread se este passou a ser o próximo temporizador
+            if self._heap[0][2] is timer:
+                self._cv.notify()
+        return timer
+
+    def call_soon(self, fn, *args):
+        """Corre fn(*args) no executor assim que houver uma thread livre"""
+        self._executor.submit(self._call, fn, args)
+
+    @staticmethod
+    def _call(fn, args):
+        try:
+            fn(*args)
+        except Exception:
+            # Como numa thread: o erro é reportado e o executor continua
+            traceback.print_exc()
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while True:
+                    while self._heap and self._heap[0][2].cancelled:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cv.wait()
+                        continue
+                    delay = self._heap[0][0] - clock.now()
+                    if delay <= 0:
+                        break
+                    self._cv.wait(delay)
+                _, _, timer = heapq.heappop(self._heap)
+            self._executor.submit(self._call, timer.fn, timer.args)
+
+    def pending(self):
+        with self._cv:
+            return sum(1 for _, _, t in self._heap if not t.cancelled)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_scheduler():
+    """Scheduler do processo, criado na primeira utilização"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Scheduler()
+        return _default
@@ -0,0 +1,280 @@
+"""
+Salas repartidas por processos (runurgencias --processos N).
+
+As salas são distribuídas em round-robin por N processos de salas, cada um com as suas
+Room (heaps, médicos e desistências) e o seu próprio GIL. O processo principal mantém o
+ciclo de accept, a política de encaminhamento e o LogWriter:
+
+- as chegadas seguem para o processo da sala por um Pipe, em lotes curtos;
+- os registos voltam por uma Queue partilhada, também em lotes, e uma thread coletora
+  entrega-os ao LogWriter (um único escritor e um único LiveState);
+- o estado dos médicos é escrito por cada processo diretamente nos slots partilhados
+  (servidor.med_slots), quando existem;
+- com instrumentação, cada processo envia pela mesma Queue um snapshot das suas métricas
+  a cada segundo, somado às do principal em /metrics.
+
+No processo principal cada sala é um RoomProxy com os contadores de que as políticas
+precisam (size, pending_work), atualizados a partir dos registos que voltam. Com --roubo
+os médicos só roubam pacientes das salas do mesmo processo.
+"""
+import multiprocessing as mp
+import signal
+import threading
+
+from servidor import clock
+from servidor.constants import TEMPOS_ATENDIMENTO
+from servidor.instrumentacao import INTERVALO, Instrumentos
+from servidor.scheduler import THREADS
+
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 0.005
+
+
+class Batcher:
+    """Junta itens de várias threads e entrega-os a `send` em lotes (tamanho ou tempo)"""
+
+    def __init__(self, send, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.send = send
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buf = []
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='batcher', daemon=True)
+        self._thread.start()
+
+    def add(self, item):
+        with self._lock:
+            self._buf.append(item)
+            full = len(self._buf) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        with self._send_lock:
+            with self._lock:
+                batch, self._buf = self._buf, []
+            if batch:
+                self.send(batch)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+
+
+class ShardWriter:
+    """Writer das Room de um processo de salas: envia tudo ao processo principal"""
+
+    def __init__(self, out):
+        self._batcher = Batcher(out.put)
+
+    def log_event(self, record):
+        self._batcher.add(('evento', record))
+
+    def update_med_status(self, med_key, room, ocupado):
+        self._batcher.add(('medico', (med_key, room, ocupado)))
+
+    def metricas(self, index, snap):
+        self._batcher.add(('metricas', (index, snap)))
+
+    def close(self):
+        self._batcher.close()
+
+
+def _enviar_metricas(index, inst, writer, parar):
+    while not parar.wait(INTERVALO):
+        writer.metricas(index, inst.snapshot())
+    writer.metricas(index, inst.snapshot())
+
+
+def shard_main(index, room_ids, num_medicos, roubo, threads, slots_path, metricas, inbox, out):
+    """Processo de salas: cria as Room e enfileira as chegadas recebidas do Pipe"""
+    from servidor.med_slots import MedSlots
+    from servidor.rooms import Room
+    from servidor.scheduler import Scheduler
+
+    # Ctrl+C chega a todo o grupo de processos; quem decide o fim é o principal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    writer = ShardWriter(out)
+    scheduler = Scheduler(threads=threads)
+    # Os médicos escrevem o seu estado diretamente nos slots partilhados
+    slots = MedSlots(slots_path, write=True) if slots_path else None
+    inst = Instrumentos() if metricas else None
+    rooms = {rid: Room(rid, num_medicos=num_medicos, writer=writer, scheduler=scheduler,
+                       slots=slots, inst=inst)
+             for rid in room_ids}
+    if inst is not None:
+        parar = threading.Event()
+        envio = threading.Thread(target=_enviar_metricas, args=(index, inst, writer, parar),
+                                 name='metricas', daemon=True)
+        envio.start()
+    if roubo:
+        for room in rooms.values():
+            room.set_peers(list(rooms.values()))
+    while True:
+        try:
+            batch = inbox.recv()
+        except EOFError:
+            break
+        if batch is None:
+            break
+        for room_id, pid, ts, payload, chegada in batch:
+            rooms[room_id].enqueue(pid, ts, payload, chegada=chegada)
+    if inst is not None:
+        parar.set()
+        envio.join()
+    writer.close()
+    out.put(None)
+
+
+class RoomProxy:
+    """Sala de um processo de salas vista do processo principal"""
+
+    def __init__(self, room_id, num_medicos, shard, shard_set):
+        self.room_id = room_id
+        self.num_medicos = num_medicos
+        self.shard = shard
+        self.shard_set = shard_set
+        self.em_fila = 0
+        self.work = 0.0
+        # Fim previsto (monotónico) dos atendimentos em curso, por médico
+        self.em_atendimento = {}
+
+    def enqueue(self, pid, ts, payload, chegada=None):
+        if chegada is None:
+            chegada = clock.now()
+        urg = payload.get('urgencia') or payload.get('urgência')
+        self.shard_set.pending(pid, self, TEMPOS_ATENDIMENTO.get(urg, 10))
+        # O relógio monotónico é o mesmo em todos os processos da máquina
+        self.shard.batcher.add((self.room_id, pid, ts, payload, chegada))
+
+    def size(self):
+        return self.em_fila
+
+    def pending_work(self):
+        now = clock.now()
+        restante = sum(max(0.0, fim - now) for fim in list(self.em_atendimento.values()))
+        return (self.work + restante) / max(self.num_medicos, 1)
+
+
+class Shard:
+    """Um processo de salas e o Pipe (com lotes) pelo qual recebe as chegadas"""
+
+    def __init__(self, index, room_ids, num_medicos, roubo, threads, slots_path, metricas,
+                 out, ctx):
+        self.index = index
+        recv, self.conn = ctx.Pipe(duplex=False)
+        self.process = ctx.Process(
+            target=shard_main,
+            args=(index, room_ids, num_medicos, roubo, threads, slots_path, metricas,
+                  recv, out),
+            name=f'salas-{index}', daemon=True,
+        )
+        self.process.start()
+        recv.close()
+        self.batcher = Batcher(self.conn.send)
+
+    def close(self):
+        self.batcher.close()
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.conn.close()
+
+
+class ShardSet:
+    """
+    Cria `processos` processos de salas e expõe `rooms` (RoomProxy, pela ordem dos ids)
+    para a política de encaminhamento. Os registos que voltam são entregues a `writer` e,
+    com `inst`, as métricas dos processos de salas ficam em inst.externos.
+    """
+
+    def __init__(self, n_salas, num_medicos, processos, writer, roubo=False, threads=THREADS,
+                 slots_path=None, inst=None):
+        ctx = mp.get_context('spawn')
+        self.writer = writer
+        self.inst = inst
+        self.out = ctx.Queue()
+        self._lock = threading.Lock()
+        # Chegadas ainda em fila, por pid: lista (por ordem de chegada) de (proxy, work),
+        # porque um pid repetido não pode apagar a entrada anterior
+        self._pendentes = {}
+        processos = max(1, min(processos, n_salas))
+        self.shards = []
+        self.rooms = [None] * n_salas
+        for i in range(processos):
+            room_ids = list(range(i, n_salas, processos))
+            shard = Shard(i, room_ids, num_medicos, roubo, threads, slots_path,
+                          inst is not None, self.out, ctx)
+            self.shards.append(shard)
+            for rid in room_ids:
+                self.rooms[rid] = RoomProxy(rid, num_medicos, shard, self)
+        self._collector = threading.Thread(target=self._collect, name='shard-collector',
+                                           daemon=True)
+        self._collector.start()
+
+    def pending(self, pid, proxy, work):
+        with self._lock:
+            self._pendentes.setdefault(pid, []).append((proxy, work))
+            proxy.em_fila += 1
+            proxy.work += work
+
+    def _observe(self, record):
+        """Atualiza os contadores dos proxies com um registo vindo de um processo de salas"""
+        started = record['inicio'] is not None and record['saida'] is None
+        if not started and not record['desistencia']:
+            if record['saida'] is not None and record['medico'] is not None:
+                room = self.rooms[record['room']]
+                room.em_atendimento.pop(record['medico'], None)
+            return
+        with self._lock:
+            fila = self._pendentes.get(record['pid'])
+            if fila:
+                proxy, work = fila.pop(0)
+                if not fila:
+                    del self._pendentes[record['pid']]
+                proxy.em_fila -= 1
+                proxy.work -= work
+        if started:
+            # O médico pode ser de outra sala do mesmo processo (roubo)
+            room = self.rooms[record['room']]
+            dur = TEMPOS_ATENDIMENTO.get(record['nivel'], 10)
+            room.em_atendimento[record['medico']] = clock.now() + dur
+
+    def _collect(self):
+        ativos = len(self.shards)
+        while ativos:
+            batch = self.out.get()
+            if batch is None:
+                ativos -= 1
+                continue
+            for kind, payload in batch:
+                if kind == 'evento':
+                    self._observe(payload)
+                    self.writer.log_event(payload)
+                elif kind == 'metricas':
+                    index, snap = payload
+                    self.inst.externos[index] = snap
+                else:
+                    self.writer.update_med_status(*payload)
+
+    def close(self, timeout=5.0):
+        """Para os processos de salas e espera que os seus últimos registos cheguem"""
+        for shard in self.shards:
+            shard.close()
+        self._collector.join(timeout)
+        for shard in self.shards:
+            shard.process.join(timeout)
+            if shard.process.is_alive():
+                shard.process.terminate()
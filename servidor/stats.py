@@ -0,0 +1,34 @@
+"""Estatística descritiva partilhada pelos runners de replicações, sweeps e relatórios"""
+import math
+import statistics
+
+# Valores críticos t de Student bilaterais a 95% (graus de liberdade 1..30)
+_T95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+
+
+def percentile(sorted_values, q):
+    """Percentil `q` (0-100) com interpolação linear; `sorted_values` já ordenado"""
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * q / 100
+    lo = math.floor(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def mean_ci95(values):
+    """Média e intervalo de confiança a 95% (t de Student): (média, inferior, superior)"""
+    values = [v for v in values if v is not None]
+    if not values:
+        return None, None, None
+    mean = statistics.fmean(values)
+    if len(values) < 2:
+        return mean, mean, mean
+    df = len(values) - 1
+    t = _T95[df - 1] if df <= len(_T95) else 1.96
+    half = t * statistics.stdev(values) / math.sqrt(len(values))
+    return mean, mean - half, mean + half
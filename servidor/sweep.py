@@ -0,0 +1,161 @@
+"""
+Varrimento (what-if) de uma grelha de cenários.
+
+Cada célula da grelha é um Scenario avaliado com várias replicações; todas as
+replicações de todas as células são repartidas pelo mesmo pool de processos. O
+resultado é um ficheiro colunar (uma lista por coluna, uma linha por configuração)
+e as células já calculadas, identificadas por uma chave estável do cenário, são
+reutilizadas em vez de recalculadas.
+"""
+import functools
+import hashlib
+import importlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, replace
+
+from servidor.replicacoes import agregar, cpus_disponiveis, run_replication
+
+FORMATO_VERSAO = 2
+PARAMETROS = ('salas', 'medicos', 'pacientes', 'surto', 'taxa', 'mix', 'tempos', 'timeouts',
+              'politica', 'roubo')
+# Módulos cujo código determina o resultado de uma célula (ver assinatura_motor)
+MODULOS_MOTOR = ('servidor.des', 'servidor.dispatch', 'servidor.patient_queue',
+                 'servidor.replicacoes', 'servidor.stats', 'servidor.constants',
+                 'servidor.clock')
+METRICAS = (
+    'espera_media', 'espera_p50', 'espera_p90', 'espera_p99', 'taxa_desistencia',
+    'espera_p90_vermelho', 'taxa_desistencia_vermelho',
+)
+
+
+def parse_range(text, tipo=int):
+    """'1:5' -> [1..5], '1:10:2' -> passo 2, '1,3,5' -> lista; 'none' -> None"""
+    valores = []
+    for part in text.split(','):
+        part = part.strip()
+        if part.lower() == 'none':
+            valores.append(None)
+        elif ':' in part:
+            fields = [tipo(x) for x in part.split(':')]
+            start, stop = fields[0], fields[1]
+            step = fields[2] if len(fields) > 2 else 1
+            v = start
+            while v <= stop:
+                valores.append(v)
+                v += step
+        else:
+            valores.append(tipo(part))
+    return valores
+
+
+def parse_table(text):
+    """'vermelho=15,amarelo=10,verde=5' -> {'vermelho': 15.0, ...}"""
+    table = {}
+    for part in text.split(','):
+        nivel, _, valor = part.partition('=')
+        table[nivel.strip()] = float(valor)
+    return table
+
+
+def grid(base, **eixos):
+    """Produto cartesiano dos valores de cada eixo aplicados ao cenário base"""
+    nomes = list(eixos)
+    for valores in itertools.product(*(eixos[n] for n in nomes)):
+        yield replace(base, **dict(zip(nomes, valores)))
+
+
+@functools.lru_cache(maxsize=None)
+def assinatura_motor():
+    """Hash do código do motor: uma alteração ao motor invalida as células guardadas"""
+    h = hashlib.sha1()
+    for nome in MODULOS_MOTOR:
+        with open(importlib.import_module(nome).__file__, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def chave(scenario, replicacoes, seed):
+    """
+    Chave estável de uma célula: cenário (sem semente) + replicações + semente + versão
+    do motor
+    """
+    params = asdict(scenario)
+    params.pop('seed')
+    blob = json.dumps([params, replicacoes, seed, assinatura_motor()], sort_keys=True)
+    return hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+
+def load_results(path):
+    """Lê o ficheiro colunar e devolve (colunas, índice chave -> linha)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}, {}
+    if data.get('versao') != FORMATO_VERSAO:
+        return {}, {}
+    colunas = data['colunas']
+    return colunas, {k: i for i, k in enumerate(colunas.get('chave', []))}
+
+
+def save_results(path, colunas):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'versao': FORMATO_VERSAO, 'colunas': colunas},
+                  f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def linha(scenario, key, agregado):
+    row = {'chave': key}
+    for param in PARAMETROS:
+        value = getattr(scenario, param)
+        row[param] = json.dumps(value, sort_keys=True) if isinstance(value, dict) else value
+    for metrica in METRICAS:
+        m = agregado.get(metrica, {})
+        media = m.get('media')
+        row[metrica] = media
+        # Semi-amplitude do IC 95%, para a coluna ficar numérica
+        row[f'{metrica}_ic95'] = None if media is None else m['ic95'][1] - media
+    # Pacientes registados por replicação (com `taxa` difere do parâmetro `pacientes`)
+    row['pacientes_media'] = agregado['pacientes']['media']
+    return row
+
+
+def sweep(cenarios, path, replicacoes=20, seed=0, processos=None):
+    """
+    Avalia as células ainda não presentes em `path` e grava o ficheiro colunar.
+    Devolve (nº de células calculadas, nº de células reutilizadas).
+    """
+    colunas, indice = load_results(path)
+    pendentes = []
+    reutilizadas = 0
+    for sc in cenarios:
+        key = chave(sc, replicacoes, seed)
+        if key in indice:
+            reutilizadas += indice[key] is not None
+            continue
+        indice[key] = None
+        pendentes.append((key, sc))
+    if not pendentes:
+        return 0, reutilizadas
+
+    tarefas = [replace(sc, seed=seed + i) for _, sc in pendentes for i in range(replicacoes)]
+    processos = processos or cpus_disponiveis()
+    if processos == 1:
+        resumos = [run_replication(t) for t in tarefas]
+    else:
+        chunksize = max(1, len(tarefas) // (processos * 4))
+        with ProcessPoolExecutor(max_workers=processos) as pool:
+            resumos = list(pool.map(run_replication, tarefas, chunksize=chunksize))
+
+    for n, (key, sc) in enumerate(pendentes):
+        row = linha(sc, key, agregar(resumos[n * replicacoes:(n + 1) * replicacoes]))
+        size = len(colunas.get('chave', []))
+        for col, value in row.items():
+            colunas.setdefault(col, [None] * size).append(value)
+    save_results(path, colunas)
+    return len(pendentes), reutilizadas
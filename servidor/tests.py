@@ -1,3 +1,203 @@
-from django.test import TestCase
+import os
+import random
+import tempfile
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from servidor.des import Scenario, simulate
+from servidor.instrumentacao import Contador, Familia, Histograma, juntar, texto
+from servidor.journal import JournalSink, read_changes
+from servidor.metricas import LogHistogram
+from servidor.patient_queue import PID, PatientQueue
+from servidor.stats import percentile
+
+
+class PatientQueueTests(SimpleTestCase):
+    def test_ordem_por_prioridade_e_chegada(self):
+        q = PatientQueue()
+        q.push(2, 0.0, 'a', {}, 100)
+        q.push(0, 2.0, 'b', {}, 100)
+        q.push(0, 1.0, 'c', {}, 100)
+        q.push(1, 0.5, 'd', {}, 100)
+        # Empate de prioridade e chegada: ordem de entrada
+        q.push(1, 0.5, 'e', {}, 100)
+        self.assertEqual([q.pop()[PID] for _ in range(5)], ['c', 'b', 'd', 'e', 'a'])
+        self.assertEqual(len(q), 0)
+        with self.assertRaises(IndexError):
+            q.pop()
+
+    def test_push_indica_prazo_mais_proximo(self):
+        q = PatientQueue()
+        self.assertTrue(q.push(0, 0.0, 'a', {}, 50))
+        self.assertFalse(q.push(0, 0.0, 'b', {}, 60))
+        self.assertTrue(q.push(0, 0.0, 'c', {}, 10))
+
+    def test_expire_so_retira_prazos_vencidos(self):
+        q = PatientQueue()
+        q.push(0, 0.0, 'a', {}, 10, work=3.0)
+        q.push(1, 0.0, 'b', {}, 20, work=5.0)
+        q.push(2, 0.0, 'c', {}, 30, work=7.0)
+        self.assertEqual(q.expire(9.9), [])
+        self.assertEqual([e[PID] for e in q.expire(20)], ['a', 'b'])
+        self.assertEqual(len(q), 1)
+        self.assertEqual(q.work, 7.0)
+        self.assertEqual(q.next_deadline(), 30)
+        self.assertEqual(q.por_prioridade(), {2: 1})
+
+    def test_remocao_preguicosa(self):
+        q = PatientQueue()
+        q.push(0, 0.0, 'a', {}, 10)
+        q.push(1, 0.0, 'b', {}, 20)
+        # Expirado: continua no heap de prioridades mas não é devolvido
+        q.expire(10)
+        self.assertEqual(q.peek()[PID], 'b')
+        self.assertEqual(q.pop()[PID], 'b')
+        # Atendido: o seu prazo já não expira ninguém
+        q.push(0, 0.0, 'c', {}, 5)
+        q.pop()
+        self.assertIsNone(q.next_deadline())
+        self.assertEqual(q.expire(100), [])
+        self.assertEqual(q.work, 0.0)
+
+    def test_compacta_entradas_inativas(self):
+        q = PatientQueue()
+        for i in range(500):
+            q.push(i % 3, float(i), i, {}, 1000 + i)
+        for _ in range(450):
+            q.pop()
+        self.assertEqual(len(q), 50)
+        self.assertLess(len(q._deadlines), 200)
+        self.assertEqual([q.pop()[PID] for _ in range(50)],
+                         sorted(range(500), key=lambda i: (i % 3, i))[450:])
+
+
+class ReadChangesTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.journal = os.path.join(tmp.name, 'logs.jsonl')
+        self.snapshot = os.path.join(tmp.name, 'logs.json')
+
+    def sink(self):
+        sink = JournalSink(self.journal, self.snapshot, compact_interval=60)
+        self.addCleanup(sink.close)
+        return sink
+
+    def test_cursor_retoma_sem_repetir_nem_perder(self):
+        sink = self.sink()
+        sink.write_batch([{'pid': i} for i in range(5)])
+        vistos = []
+        cursor = None
+        while True:
+            eventos, cursor, execucao, reiniciado = read_changes(self.journal, cursor, limit=2)
+            self.assertEqual(execucao, sink.run_id)
+            self.assertFalse(reiniciado)
+            if not eventos:
+                break
+            vistos += [e['seq'] for e in eventos]
+        self.assertEqual(vistos, [1, 2, 3, 4, 5])
+
+        sink.write_batch([{'pid': 5}, {'pid': 6}])
+        eventos, cursor, _, _ = read_changes(self.journal, cursor)
+        self.assertEqual([e['pid'] for e in eventos], [5, 6])
+        self.assertEqual(read_changes(self.journal, cursor)[0], [])
+
+    def test_nova_execucao_recomeca(self):
+        primeiro = self.sink()
+        primeiro.write_batch([{'pid': 1}])
+        _, cursor, _, _ = read_changes(self.journal)
+        primeiro.close()
+        self.sink().write_batch([{'pid': 2}])
+        eventos, _, _, reiniciado = read_changes(self.journal, cursor)
+        self.assertTrue(reiniciado)
+        self.assertEqual([e['pid'] for e in eventos], [2])
+
+    def test_sem_diario_e_cursor_invalido(self):
+        self.assertIsNone(read_changes(self.journal))
+        self.sink()
+        with self.assertRaises(ValueError):
+            read_changes(self.journal, 'lixo')
+
+
+class LogHistogramTests(SimpleTestCase):
+    def test_quantis_com_erro_relativo_limitado(self):
+        rng = random.Random(42)
+        valores = [rng.lognormvariate(1, 1) for _ in range(20000)] + [0.0] * 100
+        hist = LogHistogram()
+        for v in valores:
+            hist.add(v)
+        valores.sort()
+        for q, aproximado in zip((0.5, 0.9, 0.99), hist.quantiles()):
+            exato = percentile(valores, q * 100)
+            self.assertAlmostEqual(aproximado, exato, delta=0.02 * exato)
+
+    def test_zeros_vazio_e_merge(self):
+        self.assertEqual(LogHistogram().quantiles(), [None, None, None])
+        a, b = LogHistogram(), LogHistogram()
+        for _ in range(5):
+            a.add(0)
+            b.add(100)
+        a.merge(b)
+        # Valores de um só balde ficam limitados ao intervalo observado
+        self.assertEqual(a.quantiles(), [0.0, 100, 100])
+        self.assertEqual(a.resumo()['n'], 10)
+
+
+class SimulateTests(SimpleTestCase):
+    def test_mesma_semente_mesmos_registos(self):
+        cenario = dict(salas=2, medicos=2, pacientes=300, taxa=1.5,
+                       servico='exponencial', roubo=True)
+        a = simulate(Scenario(seed=7, **cenario), start_epoch=0)
+        b = simulate(Scenario(seed=7, **cenario), start_epoch=0)
+        c = simulate(Scenario(seed=8, **cenario), start_epoch=0)
+        self.assertEqual(a.snapshot(), b.snapshot())
+        self.assertEqual(a.now, b.now)
+        self.assertNotEqual(a.snapshot(), c.snapshot())
+        self.assertEqual(len(a.records), 300)
+
+    def test_cenario_invalido(self):
+        for kwargs in ({'salas': 0}, {'medicos': 0}, {'surto': 0}, {'taxa': 0},
+                       {'pacientes': -1}):
+            with self.assertRaises(ValueError):
+                Scenario(**kwargs)
+
+
+class InstrumentacaoTests(SimpleTestCase):
+    def snapshot(self):
+        espera = Familia('t_espera', "Espera", 'histogram', lambda: Histograma((0.1, 1.0)),
+                         ('sala',), (0.1, 1.0))
+        for v in (0.05, 0.5, 5.0):
+            espera.labels(sala=0).observe(v)
+        chegadas = Familia('t_chegadas', "Chegadas", 'counter', Contador, ('resultado',))
+        chegadas.labels(resultado='ok').inc(3)
+        return {'t_espera': espera.snapshot(), 't_chegadas': chegadas.snapshot()}
+
+    def test_texto(self):
+        self.assertEqual(texto(self.snapshot()), '\n'.join([
+            '# HELP t_chegadas Chegadas',
+            '# TYPE t_chegadas counter',
+            't_chegadas{resultado="ok"} 3',
+            '# HELP t_espera Espera',
+            '# TYPE t_espera histogram',
+            't_espera_bucket{sala="0",le="0.1"} 1',
+            't_espera_bucket{sala="0",le="1.0"} 2',
+            't_espera_bucket{sala="0",le="+Inf"} 3',
+            't_espera_sum{sala="0"} 5.55',
+            't_espera_count{sala="0"} 3',
+        ]) + '\n')
+
+    def test_juntar(self):
+        destino = juntar({}, self.snapshot())
+        juntar(destino, self.snapshot())
+        outro = self.snapshot()
+        outro['t_chegadas']['series'] = [[['erro'], 1]]
+        juntar(destino, outro)
+        self.assertEqual(sorted(destino['t_chegadas']['series']), [[['erro'], 1], [['ok'], 6]])
+        [[chave, valores]] = destino['t_espera']['series']
+        self.assertEqual((chave, valores[:-1]), (['0'], [3, 3, 3]))
+        self.assertAlmostEqual(valores[-1], 16.65)
+        # O primeiro snapshot não é alterado pelas somas seguintes
+        primeiro = self.snapshot()
+        destino = juntar({}, primeiro)
+        juntar(destino, self.snapshot())
+        self.assertEqual(primeiro['t_chegadas']['series'], [[['ok'], 3]])
@@ -0,0 +1,235 @@
+"""
+Escrita em disco fora do caminho crítico da simulação.
+
+Os médicos, a thread de desistência e o ciclo de accept entregam registos ao LogWriter
+através de uma fila limitada; uma thread dedicada agrupa-os (group commit) e grava-os no
+sink de eventos e no med_status.json. Quando a fila enche, quem produz fica bloqueado
+(backpressure) e o tempo bloqueado fica registado nas métricas. Um erro ao gravar um lote
+(disco cheio, base de dados bloqueada) é reportado e contado, e a thread continua a
+drenar a fila para que quem produz nunca fique bloqueado para sempre.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+
+from servidor.live_state import STATE_FILE, LiveState
+
+MED_STATUS_FILE = 'med_status.json'
+# Sem registos, o estado.json é republicado com esta cadência (débitos a descer a zero)
+IDLE_PUBLISH = 1.0
+
+_STOP = object()
+
+
+def write_med_status(path, status):
+    """Grava o med_status.json de forma atómica"""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(status, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def read_med_status(path=MED_STATUS_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+class SyncWriter:
+    """Escrita síncrona sob um lock partilhado (comportamento original da Room)"""
+
+    def __init__(self, sink, status_file=MED_STATUS_FILE, lock=None):
+        self.sink = sink
+        self.status_file = status_file
+        self.lock = lock or threading.Lock()
+
+    def log_event(self, record):
+        self.sink.log_event(record)
+
+    def update_med_status(self, med_key, room, ocupado):
+        with self.lock:
+            status = read_med_status(self.status_file)
+            status[med_key] = {'room': room if ocupado else None, 'ocupado': ocupado}
+            with open(self.status_file, 'w', encoding='utf-8') as f:
+                json.dump(status, f, ensure_ascii=False, indent=2)
+
+    def close(self):
+        self.sink.close()
+
+
+class LogWriter:
+    """
+    Thread escritora com fila limitada e group commit.
+
+    Um lote é gravado quando junta `batch_size` registos ou quando passam
+    `flush_interval` segundos desde o primeiro registo do lote. As atualizações de
+    estado dos médicos são acumuladas em memória e o med_status.json é reescrito uma
+    única vez por lote. Cada lote atualiza também o LiveState, publicado em estado.json.
+    Com `slots` (servidor.med_slots) os médicos escrevem o seu estado diretamente na
+    memória partilhada e o med_status.json deixa de ser escrito. Com `inst`
+    (servidor.instrumentacao) regista a duração de cada lote e o tempo bloqueado.
+    """
+
+    def __init__(self, sink, status_file=MED_STATUS_FILE, maxsize=10000,
+                 batch_size=256, flush_interval=0.05, initial_status=None,
+                 state_file=STATE_FILE, salas_totais=0, slots=None, inst=None):
+        self.sink = sink
+        self.inst = inst
+        if inst is not None:
+            inst.ao_recolher(lambda inst: inst.escrita_fila.set(self.queue.qsize()))
+        self.status_file = status_file
+        self.state_file = state_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=maxsize)
+
+        self.live = LiveState(salas_totais=salas_totais, medicos=initial_status, slots=slots,
+                              ao_vivo=True)
+        if initial_status is not None and slots is None:
+            write_med_status(self.status_file, self.live.medicos)
+        if self.state_file:
+            self.live.publish(self.state_file)
+
+        # Métricas de backpressure (atualizadas por várias threads, sob _stats_lock) e
+        # de escrita (só pela thread escritora)
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.blocked = 0
+        self.blocked_time = 0.0
+        self.max_depth = 0
+        self.flush_time = 0.0
+        self.errors = 0
+        self.lost = 0
+
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            t0 = time.monotonic()
+            self.queue.put(item)
+            blocked = time.monotonic() - t0
+            with self._stats_lock:
+                self.blocked += 1
+                self.blocked_time += blocked
+            if self.inst is not None:
+                self.inst.escrita_bloqueio.observe(blocked)
+        depth = self.queue.qsize()
+        with self._stats_lock:
+            self.enqueued += 1
+            if depth > self.max_depth:
+                self.max_depth = depth
+
+    def log_event(self, record):
+        self._put(('evento', record))
+
+    def update_med_status(self, med_key, room, ocupado):
+        self._put(('medico', (med_key, {'room': room if ocupado else None, 'ocupado': ocupado})))
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=IDLE_PUBLISH)
+            except queue.Empty:
+                self._republish()
+                continue
+            batch = [item]
+            stop = item is _STOP
+            deadline = time.monotonic() + self.flush_interval
+            while not stop and len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                stop = item is _STOP
+            batch = [i for i in batch if i is not _STOP]
+            try:
+                self._commit(batch)
+            except Exception:
+                # O lote perde-se, mas a thread continua a drenar a fila
+                traceback.print_exc()
+                self.errors += 1
+                self.lost += len(batch)
+            if stop:
+                # Fecha o sink nesta thread: ligações por thread (ex.: Django/sqlite)
+                # são as que ela usou em write_batch
+                try:
+                    self.sink.close()
+                except Exception:
+                    traceback.print_exc()
+                # Estado final: o dashboard deixa de o mostrar como ao vivo
+                self.live.terminar()
+                self._republish()
+                return
+
+    def _republish(self):
+        """Republica o estado.json sem novos registos (janelas de débito atualizadas)"""
+        if not self.state_file:
+            return
+        try:
+            self.live.publish(self.state_file)
+        except Exception:
+            traceback.print_exc()
+
+    def _commit(self, batch):
+        if not batch:
+            return
+        t0 = time.monotonic()
+        events = []
+        status_changed = False
+        for kind, payload in batch:
+            if kind == 'evento':
+                events.append(payload)
+            else:
+                med_key, value = payload
+                self.live.update_medico(med_key, value)
+                status_changed = True
+        if events:
+            self.sink.write_batch(events)
+            for record in events:
+                self.live.apply(record)
+        if status_changed:
+            write_med_status(self.status_file, self.live.medicos)
+        if self.state_file:
+            self.live.publish(self.state_file)
+        self.written += len(batch)
+        self.batches += 1
+        elapsed = time.monotonic() - t0
+        self.flush_time += elapsed
+        if self.inst is not None:
+            self.inst.escrita.observe(elapsed)
+
+    def stats(self):
+        """Métricas de backpressure e de group commit"""
+        with self._stats_lock:
+            return {
+                'enfileirados': self.enqueued,
+                'gravados': self.written,
+                'lotes': self.batches,
+                'media_por_lote': self.written / self.batches if self.batches else 0.0,
+                'profundidade': self.queue.qsize(),
+                'profundidade_max': self.max_depth,
+                'bloqueios': self.blocked,
+                'tempo_bloqueado': self.blocked_time,
+                'tempo_escrita': self.flush_time,
+                'erros': self.errors,
+                'perdidos': self.lost,
+            }
+
+    def close(self):
+        """Drena a fila, grava o que falta e fecha o sink (na thread escritora)"""
+        self.queue.put(_STOP)
+        self._thread.join()
@@ -0,0 +1,27 @@
+"""
+ASGI config for simulacao_de_urgencia project (ASGI_APPLICATION).
+
+HTTP segue para a aplicação Django; WebSockets para os consumers do Channels
+(dashboard em /ws/dashboard/).
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'simulacao_de_urgencia.settings')
+
+# Inicializa o Django antes de importar consumers que dependem dos settings
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+
+import dashboard.routing  # noqa: E402
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    'websocket': AllowedHostsOriginValidator(
+        URLRouter(dashboard.routing.websocket_urlpatterns)
+    ),
+})
@@ -36,8 +36,12 @@ ALLOWED_HOSTS = [
 # Load .env
 API_KEY = os.environ.get('API_KEY')
 
+# Servidores de urgências (runurgencias --metricas PORTA) agregados em GET /metrics
+METRICAS_URLS = [u for u in os.environ.get('METRICAS_URLS', 'http://127.0.0.1:9100').split(',') if u]
+
 # Application definition
 INSTALLED_APPS = [
+    'daphne',
     'channels',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -88,6 +92,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # O modo WAL é ativado só pela ligação do runurgencias --sink sqlite
+        # (servidor.event_store.SqliteSink)
     }
 }
 
@@ -5,6 +5,14 @@ from datetime import datetime
 import random
 import argparse
 
+from servidor.cliente import PatientConnection, send_legacy
+from servidor.des import Scenario, simulate
+from servidor.dispatch import POLITICAS
+from servidor.journal import read_snapshot, write_snapshot
+from servidor.live_state import STATE_FILE, LiveState
+from servidor.med_slots import SLOTS_FILE
+from servidor.writer import MED_STATUS_FILE
+
 HOST = '127.0.0.1'
 PORT = 9000
 NIVEIS = ['vermelho', 'amarelo', 'verde']
@@ -22,30 +30,52 @@ def start_server(salas):
     ]
     return subprocess.Popen(cmd, preexec_fn=os.setsid)
 
-def patient(pid, level, room):
+def patient(pid, level, room, surto=None):
     ts = datetime.utcnow().isoformat() + 'Z'
     payload = {
         'pid': pid,
         'room': room,
         'urgencia': level,
-        'timestamp': ts
+        'timestamp': ts,
+        'surto': surto,
     }
     try:
-        with socket.create_connection((HOST, PORT), timeout=2) as s:
-            s.sendall(json.dumps(payload).encode())
-            resp = s.recv(1024)
-            print(f"Paciente {pid} ({level}) Hospital recebeu: {resp!r}")
+        resp = send_legacy(HOST, PORT, payload, timeout=2)
+        print(f"Paciente {pid} ({level}) Hospital recebeu: {resp!r}")
     except Exception as e:
         print(f"[ROOM {room}] Paciente {pid} ERRO: {e}")
 
 
-def run_burst(start_pid, count, salas, start_room):
+def run_burst_persistente(conn, start_pid, count, salas, start_room, surto=None):
+    """Surto enviado numa ligação persistente (protocolo v2), um lote por paciente"""
+    room = start_room
+    for i in range(count):
+        pid = start_pid + i
+        level = random.choice(NIVEIS)
+        payload = {
+            'pid': pid,
+            'room': room,
+            'urgencia': level,
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'surto': surto,
+        }
+        try:
+            ack = conn.send_batch([payload])
+            print(f"Paciente {pid} ({level}) Hospital recebeu: {ack}")
+        except Exception as e:
+            print(f"[ROOM {room}] Paciente {pid} ERRO: {e}")
+        room = (room + 1) % salas
+        time.sleep(0.05)
+    return room
+
+
+def run_burst(start_pid, count, salas, start_room, surto=None):
     threads = []
     room = start_room
     for i in range(count):
         pid = start_pid + i
         level = random.choice(NIVEIS)
-        t = threading.Thread(target=patient, args=(pid, level, room))
+        t = threading.Thread(target=patient, args=(pid, level, room, surto))
         t.start()
         threads.append(t)
         # round‐robin cycle das salas
@@ -64,11 +94,52 @@ if __name__ == '__main__':
     p.add_argument('--salas', type=int, default=3, help="Nº de salas e médicos")
     p.add_argument('--pacientes', type=int, default=20, help="Total pacientes")
     p.add_argument('--surto', type=int, default=5, help="Tamanho do surto")
+    p.add_argument('--persistente', action='store_true',
+                   help="Usa uma única ligação (protocolo v2) em vez de uma por paciente")
+    p.add_argument('--engine', choices=['tcp', 'des'], default='tcp',
+                   help="tcp: servidor real; des: simulação por eventos discretos "
+                        "(relógio virtual, sem servidor)")
+    p.add_argument('--medicos', type=int, default=1,
+                   help="Nº de médicos por sala (só --engine des)")
+    p.add_argument('--taxa', type=float, default=None,
+                   help="Chegadas Poisson por segundo em vez de surtos (só --engine des)")
+    p.add_argument('--seed', type=int, default=None, help="Semente (só --engine des)")
+    p.add_argument('--politica', choices=list(POLITICAS), default='round-robin',
+                   help="Política de escolha de sala (só --engine des)")
+    p.add_argument('--roubo', action='store_true',
+                   help="Médicos livres roubam pacientes de outras salas (só --engine des)")
     args = p.parse_args()
 
     if args.surto < 1:
         p.error("O valor de --surto deve ser >= 1")
 
+    if args.engine == 'des':
+        # O estado dos médicos de um servidor anterior não corresponde a esta simulação
+        for path in (SLOTS_FILE, MED_STATUS_FILE):
+            if os.path.exists(path):
+                os.remove(path)
+        t0 = time.perf_counter()
+        sim = simulate(Scenario(
+            salas=args.salas, medicos=args.medicos, pacientes=args.pacientes,
+            surto=args.surto, taxa=args.taxa, seed=args.seed,
+            politica=args.politica, roubo=args.roubo,
+        ))
+        write_snapshot('logs.json', sim.snapshot())
+        # Estado final para o dashboard (médicos livres no fim da simulação)
+        live = LiveState(salas_totais=args.salas, medicos={
+            f"{r}-{m}": {'room': None, 'ocupado': False}
+            for r in range(args.salas) for m in range(1, args.medicos + 1)
+        })
+        for rec in sim.records.values():
+            live.apply(rec)
+        live.publish(STATE_FILE)
+        print(
+            f"✅ {args.pacientes} pacientes simulados em "
+            f"{time.perf_counter() - t0:.3f}s (tempo virtual {sim.now:.1f}s). "
+            f"Verifique logs.json."
+        )
+        raise SystemExit(0)
+
     SALAS = args.salas
     PACIENTES = args.pacientes
     SURTO = args.surto
@@ -89,7 +160,11 @@ if __name__ == '__main__':
     if srv:
         time.sleep(1)
 
+    conn = None
     try:
+        if args.persistente:
+            conn = PatientConnection(HOST, PORT, timeout=5).connect()
+
         # Simula surtos
         pid = 0
         sala = 0
@@ -98,22 +173,11 @@ if __name__ == '__main__':
             resto = PACIENTES - pid
             cnt = SURTO if resto >= SURTO else resto
 
-            # dispara o surto
-            sala = run_burst(pid, cnt, SALAS, sala)
-
-            # marca o “surto” nos registros
-            try:
-                with open('logs.json', 'r+', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for p_i in range(pid, pid + cnt):
-                        key = str(p_i)
-                        if key in data:
-                            data[key]["surto"] = idx + 1
-                    f.seek(0)
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                    f.truncate()
-            except (FileNotFoundError, json.JSONDecodeError):
-                pass
+            # dispara o surto; o servidor marca-o em todos os registos de cada paciente
+            if conn:
+                sala = run_burst_persistente(conn, pid, cnt, SALAS, sala, surto=idx + 1)
+            else:
+                sala = run_burst(pid, cnt, SALAS, sala, surto=idx + 1)
 
             pid += cnt
             time.sleep(2)
@@ -134,17 +198,17 @@ if __name__ == '__main__':
                 pass
             time.sleep(1)
 
-        # Regista total de surtos
+        # Regista total de surtos (substituição atómica: a compactação do servidor
+        # deteta a alteração e mantém a chave)
         try:
-            with open('logs.json', 'r+', encoding='utf-8') as f:
-                data = json.load(f)
-                data['total_surtos'] = n_bursts
-                f.seek(0)
-                json.dump(data, f, ensure_ascii=False, indent=2)
-                f.truncate()
-        except Exception:
+            data = read_snapshot('logs.json')
+            data['total_surtos'] = n_bursts
+            write_snapshot('logs.json', data)
+        except OSError:
             pass
     finally:
+        if conn:
+            conn.close()
         if srv:
             # Desliga o servidor só se nós o arrancámos
             print("🏁 Finalizando servidor")
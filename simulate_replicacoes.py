@@ -0,0 +1,73 @@
+"""
+Replicações Monte Carlo de um cenário de urgências (sem servidor TCP).
+
+Corre o mesmo cenário do motor de eventos discretos com sementes diferentes,
+distribuídas por um pool de processos, e agrega as esperas e desistências com
+intervalos de confiança a 95%.
+"""
+import argparse
+import json
+import time
+
+from servidor.des import Scenario, parse_mix
+from servidor.dispatch import POLITICAS
+from servidor.replicacoes import agregar, replicate
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Replicações Monte Carlo de um cenário")
+    p.add_argument('--salas', type=int, default=3, help="Nº de salas")
+    p.add_argument('--medicos', type=int, default=1, help="Nº de médicos por sala")
+    p.add_argument('--pacientes', type=int, default=20, help="Pacientes por replicação")
+    p.add_argument('--surto', type=int, default=5, help="Tamanho do surto")
+    p.add_argument('--taxa', type=float, default=None,
+                   help="Chegadas Poisson por segundo em vez de surtos")
+    p.add_argument('--mix', default=None,
+                   help="Pesos das urgências, ex.: vermelho=1,amarelo=2,verde=3")
+    p.add_argument('--servico', choices=['fixo', 'exponencial'], default='fixo',
+                   help="Distribuição do tempo de atendimento")
+    p.add_argument('--politica', choices=list(POLITICAS), default='round-robin',
+                   help="Política de escolha de sala")
+    p.add_argument('--roubo', action='store_true',
+                   help="Médicos livres roubam pacientes de outras salas")
+    p.add_argument('--replicacoes', type=int, default=100, help="Nº de replicações")
+    p.add_argument('--seed', type=int, default=0, help="Semente da primeira replicação")
+    p.add_argument('--processos', type=int, default=None,
+                   help="Nº de processos (padrão: nº de CPUs)")
+    p.add_argument('--saida', default='replicacoes.json',
+                   help="Ficheiro JSON com o agregado e os resumos por replicação")
+    args = p.parse_args()
+
+    if args.surto < 1:
+        p.error("O valor de --surto deve ser >= 1")
+    if args.replicacoes < 1:
+        p.error("O valor de --replicacoes deve ser >= 1")
+    if args.salas < 1 or args.medicos < 1:
+        p.error("Os valores de --salas e --medicos devem ser >= 1")
+    if args.taxa is not None and not args.taxa > 0:
+        p.error("O valor de --taxa deve ser > 0")
+
+    kwargs = {}
+    if args.mix:
+        kwargs['mix'] = parse_mix(args.mix)
+    cenario = Scenario(
+        salas=args.salas, medicos=args.medicos, pacientes=args.pacientes,
+        surto=args.surto, taxa=args.taxa, servico=args.servico,
+        politica=args.politica, roubo=args.roubo, **kwargs
+    )
+
+    t0 = time.perf_counter()
+    resumos = replicate(cenario, args.replicacoes, seed=args.seed, processos=args.processos)
+    agregado = agregar(resumos)
+    elapsed = time.perf_counter() - t0
+
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump({'agregado': agregado, 'replicacoes': resumos},
+                  f, ensure_ascii=False, indent=2)
+
+    print(f"✅ {args.replicacoes} replicações em {elapsed:.2f}s")
+    for key in ('espera_media', 'espera_p90', 'taxa_desistencia'):
+        m = agregado[key]
+        if m['media'] is None:
+            continue
+        print(f"  {key}: {m['media']:.3f} (IC95 {m['ic95'][0]:.3f} – {m['ic95'][1]:.3f})")
+    print(f"Resultados em {args.saida}")
@@ -0,0 +1,76 @@
+"""
+Varrimento what-if de salas, médicos, surtos, taxa de chegada e tabelas de tempos.
+
+Avalia a grelha completa em paralelo com o motor de eventos discretos e grava um
+ficheiro colunar com uma linha por configuração e as métricas de percentis. Células
+já calculadas com os mesmos parâmetros são reutilizadas, por isso alargar a grelha
+só custa as células novas.
+"""
+import argparse
+import time
+
+from servidor.constants import TEMPOS_ATENDIMENTO, TIMEOUTS
+from servidor.des import Scenario, parse_mix
+from servidor.dispatch import POLITICAS
+from servidor.sweep import grid, parse_range, parse_table, sweep
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Varrimento de cenários de urgências")
+    p.add_argument('--salas', default='3', help="Valores ou intervalo, ex.: 1:5 ou 2,4,8")
+    p.add_argument('--medicos', default='1', help="Médicos por sala, ex.: 1:4")
+    p.add_argument('--surto', default='5', help="Tamanhos de surto, ex.: 5,10,20")
+    p.add_argument('--taxa', default='none',
+                   help="Chegadas Poisson/s (none = surtos), ex.: none,0.5,1")
+    p.add_argument('--tempos', action='append', default=None,
+                   help="Tabela de tempos de atendimento (repetível), "
+                        "ex.: vermelho=15,amarelo=10,verde=5")
+    p.add_argument('--timeouts', action='append', default=None,
+                   help="Tabela de timeouts de desistência (repetível)")
+    p.add_argument('--politica', default='round-robin',
+                   help="Políticas de escolha de sala, ex.: round-robin,jsq,least-loaded")
+    p.add_argument('--roubo', default='0', help="Com/sem roubo entre salas, ex.: 0,1")
+    p.add_argument('--pacientes', type=int, default=200, help="Pacientes por replicação")
+    p.add_argument('--mix', default=None, help="Pesos das urgências")
+    p.add_argument('--replicacoes', type=int, default=20, help="Replicações por célula")
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--processos', type=int, default=None)
+    p.add_argument('--saida', default='sweep.json', help="Ficheiro colunar de resultados")
+    args = p.parse_args()
+    if args.replicacoes < 1:
+        p.error("O valor de --replicacoes deve ser >= 1")
+    politicas = [x.strip() for x in args.politica.split(',')]
+    desconhecidas = [x for x in politicas if x not in POLITICAS]
+    if desconhecidas:
+        p.error(f"--politica: {', '.join(desconhecidas)} desconhecida(s) "
+                f"(opções: {', '.join(POLITICAS)})")
+
+    try:
+        base = Scenario(pacientes=args.pacientes)
+        if args.mix:
+            base.mix = parse_mix(args.mix)
+        # Cada célula é validada pelo Scenario antes de chegar ao pool de processos
+        cenarios = list(grid(
+            base,
+            salas=parse_range(args.salas),
+            medicos=parse_range(args.medicos),
+            surto=parse_range(args.surto),
+            taxa=parse_range(args.taxa, float),
+            tempos=([parse_table(t) for t in args.tempos] if args.tempos
+                    else [dict(TEMPOS_ATENDIMENTO)]),
+            timeouts=([parse_table(t) for t in args.timeouts] if args.timeouts
+                      else [dict(TIMEOUTS)]),
+            politica=politicas,
+            roubo=[bool(x) for x in parse_range(args.roubo)],
+        ))
+    except ValueError as e:
+        p.error(str(e))
+
+    t0 = time.perf_counter()
+    calculadas, reutilizadas = sweep(
+        cenarios, args.saida, replicacoes=args.replicacoes,
+        seed=args.seed, processos=args.processos,
+    )
+    print(
+        f"✅ {len(cenarios)} configurações: {calculadas} calculadas, "
+        f"{reutilizadas} reutilizadas em {time.perf_counter() - t0:.2f}s -> {args.saida}"
+    )
@@ -0,0 +1,253 @@
+"""
+Consulta do logs.json para GET /api/logs/: filtros, seleção de campos e paginação por
+cursor sobre iter_snapshot, sem carregar o ficheiro inteiro em memória.
+
+O cursor do logs.json guarda a chave (pid) do último registo devolvido e o offset em
+bytes da sua linha: a página seguinte faz um seek até lá e confirma a chave, pelo que
+cada página custa o mesmo seja qual for a posição. Se o ficheiro foi reescrito entretanto
+e a chave já não está nesse offset, procura-a desde o início. Como o snapshot só
+acrescenta pids novos no fim, o cursor continua válido enquanto o servidor escreve.
+
+Com o runurgencias --sink sqlite os mesmos filtros são aplicados como SQL sobre a
+tabela RegistoPaciente (indexada), por ordem de pid. A ordem não é a do logs.json, pelo
+que o cursor indica a origem e um cursor de uma origem é recusado na outra.
+"""
+import base64
+import binascii
+from datetime import datetime, timedelta, timezone
+
+from servidor import event_store
+from servidor.journal import iter_snapshot_offsets
+from servidor.models import RegistoPaciente
+
+LIMITE_PADRAO = 100
+LIMITE_MAX = 10000
+
+# Parâmetros que ativam a consulta (sem nenhum, /api/logs/ devolve o logs.json inteiro)
+PARAMETROS = ('limite', 'cursor', 'formato', 'campos', 'room', 'nivel',
+              'desistencia', 'desde', 'ate', 'pid_min', 'pid_max')
+
+
+# Folga dos limites de texto de desde/ate na base de dados
+FOLGA = timedelta(days=1)
+
+
+class QueryError(ValueError):
+    """Parâmetro de consulta inválido (resposta 400)"""
+
+
+# Origem do cursor: logs.json ou base de dados
+FICHEIRO, BASE_DADOS = 'f', 'd'
+
+
+def encode_cursor(posicao):
+    """Token de uma posição: (FICHEIRO, chave, offset ou None) ou (BASE_DADOS, pid)"""
+    texto = '.'.join('' if p is None else str(p) for p in posicao)
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        texto = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise QueryError('cursor inválido')
+    partes = texto.split('.')
+    if partes[0] == FICHEIRO and len(partes) == 3 and partes[1].isdigit():
+        offset = partes[2]
+        if offset and not offset.isdigit():
+            raise QueryError('cursor inválido')
+        return FICHEIRO, partes[1], int(offset) if offset else None
+    if partes[0] == BASE_DADOS and len(partes) == 2 and partes[1].isdigit():
+        return BASE_DADOS, int(partes[1])
+    raise QueryError('cursor inválido')
+
+
+def parse_time(text):
+    """Timestamp ISO (com ou sem 'Z'/fuso) normalizado para UTC sem fuso"""
+    try:
+        t = datetime.fromisoformat(text)
+    except (TypeError, ValueError):
+        return None
+    if t.tzinfo is not None:
+        t = t.astimezone(timezone.utc).replace(tzinfo=None)
+    return t
+
+
+def _limite(t):
+    """Prefixo 'AAAA-MM-DDTHH:MM:SS' para comparar com a coluna de texto chegada"""
+    return t.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def _int(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError(f'{name} deve ser inteiro')
+
+
+def _bool(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    if value.lower() in ('1', 'true', 'sim'):
+        return True
+    if value.lower() in ('0', 'false', 'nao', 'não'):
+        return False
+    raise QueryError(f'{name} deve ser true ou false')
+
+
+class LogQuery:
+    """Filtros e paginação de uma consulta, a partir dos query params do pedido"""
+
+    def __init__(self, params):
+        self.formato = params.get('formato', 'json')
+        if self.formato not in ('json', 'ndjson'):
+            raise QueryError('formato deve ser json ou ndjson')
+        limite = _int(params, 'limite')
+        if limite is not None and not 1 <= limite <= LIMITE_MAX:
+            raise QueryError(f'limite deve estar entre 1 e {LIMITE_MAX}')
+        # O NDJSON sem limite percorre todos os registos
+        self.limite = limite or (LIMITE_PADRAO if self.formato == 'json' else None)
+        self.cursor = decode_cursor(params['cursor']) if params.get('cursor') else None
+        campos = params.get('campos')
+        self.campos = [c for c in campos.split(',') if c] if campos else None
+
+        self.room = _int(params, 'room')
+        niveis = params.get('nivel')
+        self.niveis = set(niveis.split(',')) if niveis else None
+        self.desistencia = _bool(params, 'desistencia')
+        self.pid_min = _int(params, 'pid_min')
+        self.pid_max = _int(params, 'pid_max')
+        self.desde = self.ate = None
+        for name in ('desde', 'ate'):
+            if params.get(name):
+                t = parse_time(params[name])
+                if t is None:
+                    raise QueryError(f'{name} deve ser um timestamp ISO')
+                setattr(self, name, t)
+
+    def matches(self, key, rec):
+        if self.pid_min is not None or self.pid_max is not None:
+            pid = int(key)
+            if self.pid_min is not None and pid < self.pid_min:
+                return False
+            if self.pid_max is not None and pid > self.pid_max:
+                return False
+        if self.room is not None and rec.get('room') != self.room:
+            return False
+        if self.niveis is not None and rec.get('nivel') not in self.niveis:
+            return False
+        if self.desistencia is not None and bool(rec.get('desistencia')) != self.desistencia:
+            return False
+        return self._no_intervalo(rec)
+
+    def _no_intervalo(self, rec):
+        """desde/ate comparados como datetimes (os textos ISO variam nas frações e no fuso)"""
+        if self.desde is None and self.ate is None:
+            return True
+        chegada = parse_time(rec.get('chegada'))
+        if chegada is None:
+            return False
+        if self.desde is not None and chegada < self.desde:
+            return False
+        if self.ate is not None and chegada > self.ate:
+            return False
+        return True
+
+    def project(self, rec):
+        if self.campos is None:
+            return rec
+        return {c: rec.get(c) for c in self.campos}
+
+    def records(self, path):
+        """
+        Gera (posição, registo) dos registos que passam os filtros, a seguir ao cursor.
+        Os metadados (chaves não numéricas) ficam em `self.meta` à medida que aparecem.
+        """
+        self.meta = {}
+        offset = None
+        if self.cursor is not None:
+            if self.cursor[0] != FICHEIRO:
+                raise QueryError('cursor de outra origem (base de dados)')
+            _, cursor_key, offset = self.cursor
+        if offset is not None:
+            # Metadados do início do ficheiro, que o seek salta
+            for key, rec, _ in iter_snapshot_offsets(path):
+                if key.isdigit():
+                    break
+                self.meta[key] = rec
+            it = iter_snapshot_offsets(path, offset)
+            primeiro = next(it, None)
+            if primeiro is not None and primeiro[0] == cursor_key and primeiro[2] == offset:
+                yield from self._filtrar(it)
+                return
+            # O ficheiro mudou: procura a chave desde o início
+            it.close()
+            self.meta = {}
+        skipping = self.cursor is not None
+        it = iter_snapshot_offsets(path)
+        if skipping:
+            for key, rec, _ in it:
+                if not key.isdigit():
+                    self.meta[key] = rec
+                elif key == cursor_key:
+                    skipping = False
+                    break
+        if skipping:
+            raise QueryError('cursor não encontrado neste logs.json')
+        yield from self._filtrar(it)
+
+    def _filtrar(self, it):
+        for key, rec, offset in it:
+            if not key.isdigit():
+                self.meta[key] = rec
+            elif self.matches(key, rec):
+                yield (FICHEIRO, key, offset), self.project(rec)
+
+    def queryset(self, qs):
+        """Os mesmos filtros, aplicados a um queryset de RegistoPaciente"""
+        if self.cursor is not None:
+            if self.cursor[0] != BASE_DADOS:
+                raise QueryError('cursor de outra origem (logs.json)')
+            qs = qs.filter(pid__gt=self.cursor[1])
+        if self.pid_min is not None:
+            qs = qs.filter(pid__gte=self.pid_min)
+        if self.pid_max is not None:
+            qs = qs.filter(pid__lte=self.pid_max)
+        if self.room is not None:
+            qs = qs.filter(room=self.room)
+        if self.niveis is not None:
+            qs = qs.filter(nivel__in=self.niveis)
+        if self.desistencia is not None:
+            qs = qs.filter(desistencia=self.desistencia)
+        # O índice de chegada restringe por texto com um dia de folga (frações e fusos
+        # ordenam-se mal como texto); o intervalo exato é verificado em records_db
+        if self.desde is not None:
+            qs = qs.filter(chegada__gte=_limite(self.desde - FOLGA))
+        if self.ate is not None:
+            qs = qs.filter(chegada__lt=_limite(self.ate + FOLGA))
+        return qs
+
+    def records_db(self):
+        """Como records(), mas a partir da base de dados (índices em vez de varrimento)"""
+        self.meta = {}
+        for rec in event_store.iter_records(self.queryset(RegistoPaciente.objects.all())):
+            if self._no_intervalo(rec):
+                yield (BASE_DADOS, rec['pid']), self.project(rec)
+
+    def page(self, path=None):
+        """Uma página: (registos, cursor seguinte ou None, metadados); sem path, da base de dados"""
+        resultados = []
+        seguinte = None
+        it = self.records(path) if path is not None else self.records_db()
+        for posicao, rec in it:
+            if len(resultados) == self.limite:
+                seguinte = encode_cursor(ultima)
+                break
+            resultados.append(rec)
+            ultima = posicao
+        it.close()
+        return resultados, seguinte, self.meta
@@ -1,3 +1,100 @@
-from django.test import TestCase
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from servidor.journal import JournalSink, write_snapshot
+from simulation_api import views
+from .log_query import BASE_DADOS, FICHEIRO, LogQuery, QueryError, decode_cursor, encode_cursor
+
+
+def registo(pid, room=0, nivel='verde', **extra):
+    return {'pid': pid, 'room': room, 'nivel': nivel, 'chegada': '2025-01-01T10:00:00Z',
+            'inicio': None, 'saida': None, 'desistencia': False, **extra}
+
+
+class LogQueryTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'logs.json')
+        self.data = {'medicos_totais': 2, 'salas_totais': 2}
+        self.data.update({str(i): registo(i, room=i % 2) for i in range(10)})
+        write_snapshot(self.path, self.data)
+
+    def paginas(self, params):
+        """Percorre todas as páginas; devolve os pids e os metadados de cada página"""
+        pids, metas = [], []
+        cursor = None
+        while True:
+            resultados, cursor, meta = LogQuery({**params, 'cursor': cursor}).page(self.path)
+            pids += [r['pid'] for r in resultados]
+            metas.append(meta)
+            if cursor is None:
+                return pids, metas
+
+    def test_cursor_percorre_todas_as_paginas(self):
+        pids, metas = self.paginas({'limite': '3'})
+        self.assertEqual(pids, list(range(10)))
+        self.assertEqual(len(metas), 4)
+        for meta in metas:
+            self.assertEqual(meta, {'medicos_totais': 2, 'salas_totais': 2})
+
+    def test_cursor_com_filtro(self):
+        pids, _ = self.paginas({'limite': '2', 'room': '1'})
+        self.assertEqual(pids, [1, 3, 5, 7, 9])
+
+    def test_cursor_valido_depois_de_reescrita(self):
+        resultados, cursor, _ = LogQuery({'limite': '4'}).page(self.path)
+        # Compactação: registo atualizado antes do cursor e pid novo no fim
+        self.data['0'] = registo(0, inicio='2025-01-01T10:00:01Z')
+        self.data['10'] = registo(10)
+        write_snapshot(self.path, self.data)
+        resto, seguinte, _ = LogQuery({'limite': '100', 'cursor': cursor}).page(self.path)
+        self.assertEqual([r['pid'] for r in resultados + resto], list(range(11)))
+        self.assertIsNone(seguinte)
+
+    def test_encode_decode(self):
+        for posicao in ((FICHEIRO, '12', 345), (FICHEIRO, '12', None), (BASE_DADOS, 7)):
+            self.assertEqual(decode_cursor(encode_cursor(posicao)), posicao)
+        for token in ('###', encode_cursor(('x', 1)), encode_cursor((FICHEIRO, 'a', 1))):
+            with self.assertRaises(QueryError):
+                decode_cursor(token)
+
+    def test_cursor_de_outra_origem(self):
+        query = LogQuery({'cursor': encode_cursor((BASE_DADOS, 3))})
+        with self.assertRaises(QueryError):
+            query.page(self.path)
+
+
+@override_settings(API_KEY='chave')
+class LogChangesViewTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.journal = os.path.join(tmp.name, 'logs.jsonl')
+        patcher = mock.patch.object(views, 'JOURNAL_PATH', self.journal)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sink = JournalSink(self.journal, os.path.join(tmp.name, 'logs.json'),
+                           compact_interval=60)
+        self.addCleanup(sink.close)
+        sink.write_batch([registo(i) for i in range(3)])
+
+    def get(self, **params):
+        return self.client.get('/api/logs/changes/', params, HTTP_X_API_KEY='chave')
+
+    def test_cursor_pela_api(self):
+        r = self.get(limite=2)
+        self.assertEqual([e['seq'] for e in r.json()['eventos']], [1, 2])
+        r = self.get(cursor=r.json()['cursor'])
+        self.assertEqual([e['seq'] for e in r.json()['eventos']], [3])
+        self.assertFalse(r.json()['reiniciado'])
+
+    def test_espera_invalida(self):
+        for espera in ('nan', 'inf', '-1', 'x'):
+            self.assertEqual(self.get(espera=espera).status_code, 400)
+
+    def test_sem_chave(self):
+        self.assertEqual(self.client.get('/api/logs/changes/').status_code, 403)
@@ -1,7 +1,7 @@
 from django.urls import path
 from .views import (
     RunUrgencias, RunCliente, SimulateMultiSalas,
-    CommandStatus, LogsView, APIDocumentation
+    CommandStatus, LogsView, LogChangesView, APIDocumentation
 )
 
 urlpatterns = [
@@ -10,5 +10,6 @@ urlpatterns = [
     path('simulate/',    SimulateMultiSalas.as_view(), name='simulate'),
     path('commands/<int:pk>/', CommandStatus.as_view(), name='command-status'),
     path('logs/', LogsView.as_view(), name='logs'),
+    path('logs/changes/', LogChangesView.as_view(), name='logs-changes'),
     path('docs/', APIDocumentation.as_view(), name='api-docs'),
 ]
\ No newline at end of file
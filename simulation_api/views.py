@@ -1,16 +1,35 @@
-import os, subprocess, threading, json
+import os, subprocess, threading, json, math, time
 
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.views.generic import TemplateView
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
+from servidor.file_cache import FileCache, etag, file_signature
+from servidor import event_store
+from servidor.journal import read_changes
+from .log_query import PARAMETROS, LogQuery, QueryError, encode_cursor
 from .models import CommandRun
 from .permissions import HasAPIKey
 from .serializers import CommandRunSerializer
 
 # Onde se encontra os scripts
 BASE_DIR = settings.BASE_DIR
+LOGS_PATH = os.path.join(BASE_DIR, 'logs.json')
+JOURNAL_PATH = os.path.join(BASE_DIR, 'logs.jsonl')
+# Long-polling de /api/logs/changes/
+ESPERA_MAX = 30.0
+POLL_INTERVAL = 0.1
+
+# Base de dados do runurgencias --sink sqlite (o ficheiro -wal muda a cada commit)
+DB_PATH = str(settings.DATABASES['default']['NAME'])
+LOGS_FILES = (LOGS_PATH, DB_PATH, f"{DB_PATH}-wal")
+
+# logs.json já lido, reaproveitado enquanto o ficheiro não mudar
+_logs_cache = FileCache()
 
 def monitor_process(cmd_run, proc):
     proc.wait()
@@ -113,16 +132,123 @@ class LogsView(APIView):
     """
        GET /api/logs/
        Retorna conteúdo de logs.json para inspeção do estado dos pacientes.
+
+       Com qualquer dos parâmetros abaixo devolve uma página filtrada:
+       { "resultados": [...], "seguinte": <cursor ou null>, "meta": {...} }
+         limite=100            registos por página (máx. 10000)
+         cursor=<token>        continua a partir da página anterior ("seguinte")
+         room=1, nivel=verde,amarelo, desistencia=true|false
+         desde=<ISO>, ate=<ISO>  intervalo de chegada
+         pid_min=, pid_max=    intervalo de pids
+         campos=pid,nivel,espera
+         formato=ndjson        um registo por linha, em streaming (sem limite por
+                               omissão; com limite, a última linha é {"seguinte": ...})
     """
     permission_classes = [HasAPIKey]
 
+    @method_decorator(condition(
+        # A resposta depende também do formato negociado e dos parâmetros da consulta
+        etag_func=lambda request: etag(file_signature(*LOGS_FILES), request.META.get('HTTP_ACCEPT'),
+                                       request.META.get('QUERY_STRING')),
+    ))
     def get(self, request):
-        logs_path = os.path.join(BASE_DIR, 'logs.json')
-        if not os.path.exists(logs_path):
+        # Sem logs.json (runurgencias --sink sqlite) os registos vêm da base de dados
+        path = LOGS_PATH if os.path.exists(LOGS_PATH) else None
+        if path is None and not event_store.has_records():
             return Response({"detail": "logs.json não encontrado."}, status=status.HTTP_404_NOT_FOUND)
-        with open(logs_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return Response(data)
+        if not any(p in request.query_params for p in PARAMETROS):
+            if path is None:
+                return Response(_logs_cache.get('db', LOGS_FILES, _read_db))
+            return Response(_logs_cache.get('logs', (LOGS_PATH,), _read_logs))
+        try:
+            query = LogQuery(request.query_params)
+            if query.formato == 'ndjson':
+                return StreamingHttpResponse(_stream_ndjson(query, path), content_type='application/x-ndjson')
+            resultados, seguinte, meta = query.page(path)
+        except QueryError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'resultados': resultados, 'seguinte': seguinte, 'meta': meta})
+
+
+def _read_logs():
+    with open(LOGS_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _read_db():
+    return {str(rec['pid']): rec for rec in event_store.iter_records()}
+
+
+def _stream_ndjson(query, path):
+    """Registos da consulta em JSON-lines, lidos à medida que são enviados"""
+    enviados = 0
+    try:
+        records = query.records(path) if path is not None else query.records_db()
+        for posicao, rec in records:
+            if enviados == query.limite:
+                yield json.dumps({'seguinte': encode_cursor(ultima)}) + '\n'
+                return
+            yield json.dumps(rec, ensure_ascii=False) + '\n'
+            enviados += 1
+            ultima = posicao
+    except QueryError as e:
+        yield json.dumps({'erro': str(e)}, ensure_ascii=False) + '\n'
+
+class LogChangesView(APIView):
+    """
+       GET /api/logs/changes/?cursor=<cursor>&limite=1000&espera=<s>
+       Eventos acrescentados ao diário (logs.jsonl) depois do cursor, por ordem de seq:
+       { "execucao": id, "eventos": [...], "cursor": <cursor seguinte>, "reiniciado": bool }
+       Sem cursor começa no primeiro evento da execução. Com `espera` (até 30 s) o pedido
+       fica em long-polling até haver eventos novos. "reiniciado" indica que o servidor
+       começou uma execução nova e a leitura recomeçou do início.
+    """
+    permission_classes = [HasAPIKey]
+
+    def get(self, request):
+        cursor = request.query_params.get('cursor') or None
+        try:
+            limite = min(int(request.query_params.get('limite', 1000)), 10000)
+            espera = float(request.query_params.get('espera', 0))
+        except ValueError:
+            return Response({"detail": "limite e espera devem ser numéricos."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        # nan tornaria o prazo inalcançável (ciclo ativo até chegar um evento)
+        if not (math.isfinite(espera) and espera >= 0):
+            return Response({"detail": "espera deve ser um número finito >= 0."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        espera = min(espera, ESPERA_MAX)
+        deadline = time.monotonic() + espera
+        while True:
+            # Assinatura antes da leitura: o que for escrito depois acorda a espera
+            assinatura = file_signature(JOURNAL_PATH)[0]
+            try:
+                result = read_changes(JOURNAL_PATH, cursor, max(limite, 1))
+            except ValueError:
+                return Response({"detail": "cursor inválido."}, status=status.HTTP_400_BAD_REQUEST)
+            if result is None:
+                return Response({"detail": "logs.jsonl não encontrado."}, status=status.HTTP_404_NOT_FOUND)
+            eventos, seguinte, execucao, reiniciado = result
+            if eventos or reiniciado or time.monotonic() >= deadline:
+                break
+            cursor = seguinte
+            _wait_for_growth(JOURNAL_PATH, assinatura, deadline)
+        return Response({
+            'execucao': execucao,
+            'eventos': eventos,
+            'cursor': seguinte,
+            'reiniciado': reiniciado,
+        })
+
+
+def _wait_for_growth(path, inicial, deadline):
+    """Espera (com stat, sem ler) até o diário mudar de tamanho ou ser recriado"""
+    while inicial is not None and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        atual = file_signature(path)[0]
+        if atual is None or atual[:2] != inicial[:2]:
+            return
+
 
 class APIDocumentation(TemplateView):
     """